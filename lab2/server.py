@@ -2,10 +2,21 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, JSONResponse
 import uvicorn
+import logging
+import os
+import sys
 from datetime import datetime
 from pydantic import BaseModel
 from typing import Optional
 
+# Общий JSON-лог (lab4/core/jsonlog.py, только стандартная библиотека):
+# записи уходят в очередь, в stderr их пишет отдельный поток
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lab4"))
+from core import jsonlog  # noqa: E402
+
+jsonlog.setup(os.getenv("LOG_LEVEL", "INFO").upper())
+log = logging.getLogger("form")
+
 
 class UserRequest(BaseModel):
     name: str
@@ -25,6 +36,9 @@ app = FastAPI(title="Тестовый сервер")
 # Размещение статических файлов (HTML, CSS, JS)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Журнал запросов: request_id, маршрут, статус, латентность
+app.add_middleware(jsonlog.RequestLogMiddleware)
+
 
 @app.post("/api/json")
 async def create_json_data(request: UserRequest):
@@ -55,7 +69,7 @@ async def create_json_data(request: UserRequest):
 async def handle_form(data: FormData):
     """Обработка данных из формы с возвратом информации о кнопке"""
 
-    print(data)
+    log.info("form submitted", extra={"form": data.model_dump()})
 
     # Определяем действие на основе нажатой кнопки
     button_actions = {
@@ -92,4 +106,5 @@ async def read_root():
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # журнал запросов пишет RequestLogMiddleware — текстовый uvicorn не дублирует
+    uvicorn.run(app, host="0.0.0.0", port=8000, access_log=False)
@@ -0,0 +1,427 @@
+# bench/bench_http.py
+"""
+Нагрузочный бенчмарк HTTP API lab4.
+
+Поднимает приложение (uvicorn, отдельный процесс) на локальной БД из .env,
+досеивает тестовые данные до заданного масштаба и прогоняет сценарии
+асинхронным HTTP-клиентом (httpx):
+
+  login        — шквал логинов (POST /auth/login);
+  search       — поиск по мере набора в users_menu (GET /api/users/list?q=i, iv, iva...);
+  visits       — учёт посещений (GET /api/visit);
+  catalog      — фирмы -> машины фирмы -> добавить в корзину -> корзина;
+  admin        — правка ролей админом (список, PUT роли, выдача/отзыв роли).
+
+Результат — JSON: RPS и p50/p95/p99 (мс) по каждому эндпоинту + коммит git,
+чтобы сравнивать прогоны между коммитами.
+
+Запуск из каталога lab4:
+  python -m bench.bench_http --users 1000 --cars 5000 --duration 20 --concurrency 32 \\
+      --out bench-results.json
+  python -m bench.bench_http --url http://127.0.0.1:5000 --no-seed   # уже запущенный сервер
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+from sqlalchemy import text
+
+from db.database import engine
+
+SCENARIOS = ("login", "search", "visits", "catalog", "admin")
+BENCH_PREFIX = "bench_"
+ADMIN_LOGIN = f"{BENCH_PREFIX}admin"
+
+
+# ----------------- Данные -----------------
+def seed(users: int, companies: int, cars: int) -> None:
+    """
+    Досеивает bench_-пользователей (пароль = логин + "123", как в fill_auth_tables),
+    фирмы и машины до заданного количества. Повторный запуск ничего не дублирует.
+    """
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                """
+            INSERT INTO auth.users (last_name, first_name, email, login, salt, password_hash)
+            SELECT 'Бенч', 'Пользователь' || g,
+                   :p || g || '@example.com', :p || g, s.salt, md5(s.salt || :p || g || '123')
+            FROM generate_series(1, CAST(:n AS int)) g
+            CROSS JOIN LATERAL (SELECT substring(md5(random()::text || g) FROM 1 FOR 8) AS salt) s
+            ON CONFLICT DO NOTHING
+        """
+            ),
+            {"p": BENCH_PREFIX, "n": users},
+        )
+        conn.execute(
+            text(
+                """
+            INSERT INTO auth.users (last_name, first_name, email, login, salt, password_hash)
+            VALUES ('Бенч', 'Админ', :login || '@example.com', :login, 'benchslt',
+                    md5('benchslt' || :login || '123'))
+            ON CONFLICT DO NOTHING
+        """
+            ),
+            {"login": ADMIN_LOGIN},
+        )
+        conn.execute(
+            text(
+                """
+            INSERT INTO auth.user_roles (user_id, role_id)
+            SELECT u.user_id, r.role_id FROM auth.users u, auth.roles r
+            WHERE u.login = :login AND r.role_name = 'admin'
+            ON CONFLICT DO NOTHING
+        """
+            ),
+            {"login": ADMIN_LOGIN},
+        )
+        have = conn.execute(text("SELECT count(*) FROM catalog.companies")).scalar_one()
+        if have < companies:
+            conn.execute(
+                text(
+                    "INSERT INTO catalog.companies (name) "
+                    "SELECT 'Бенч-фирма ' || g FROM generate_series(CAST(:a AS int), CAST(:b AS int)) g"
+                ),
+                {"a": have + 1, "b": companies},
+            )
+        have = conn.execute(text("SELECT count(*) FROM catalog.cars")).scalar_one()
+        if have < cars:
+            conn.execute(
+                text(
+                    """
+                INSERT INTO catalog.cars (company_id, model, year, price)
+                SELECT c.ids[1 + (g % array_length(c.ids, 1))],
+                       'BM-' || g, 1995 + (g % 30), 200000 + (g * 7919 % 3000000)
+                FROM generate_series(CAST(:a AS int), CAST(:b AS int)) g,
+                     (SELECT array_agg(company_id) AS ids FROM catalog.companies) c
+            """
+                ),
+                {"a": have + 1, "b": cars},
+            )
+
+
+def load_fixture() -> dict:
+    with engine.connect() as conn:
+        logins = (
+            conn.execute(
+                text(
+                    "SELECT login FROM auth.users WHERE login LIKE :p AND login <> :a"
+                ),
+                {"p": f"{BENCH_PREFIX}%", "a": ADMIN_LOGIN},
+            )
+            .scalars()
+            .all()
+        )
+        company_ids = (
+            conn.execute(text("SELECT company_id FROM catalog.companies"))
+            .scalars()
+            .all()
+        )
+        role_ids = (
+            conn.execute(
+                text("SELECT role_id FROM auth.roles WHERE role_name <> 'admin'")
+            )
+            .scalars()
+            .all()
+        )
+        user_ids = (
+            conn.execute(
+                text("SELECT user_id FROM auth.users WHERE login LIKE :p LIMIT 1000"),
+                {"p": f"{BENCH_PREFIX}%"},
+            )
+            .scalars()
+            .all()
+        )
+    if not logins or not company_ids:
+        raise SystemExit("нет данных для бенчмарка: запустите без --no-seed")
+    return {
+        "logins": logins,
+        "company_ids": company_ids,
+        "role_ids": role_ids,
+        "user_ids": user_ids,
+    }
+
+
+# ----------------- Сервер -----------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url + "/auth/me", timeout=1)
+            return proc, url
+        except httpx.TransportError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("сервер не поднялся за 30 с")
+
+
+# ----------------- Сценарии -----------------
+class Recorder:
+    def __init__(self):
+        self.lat = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.status = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, client, name: str, method: str, url: str, **kw):
+        t0 = time.perf_counter()
+        try:
+            r = await client.request(method, url, **kw)
+            ok = r.status_code < 500
+        except httpx.HTTPError:
+            r, ok = None, False
+        self.lat[name].append((time.perf_counter() - t0) * 1000)
+        self.status[name][r.status_code if r is not None else "error"] += 1
+        if not ok:
+            self.errors[name] += 1
+        return r
+
+
+async def _login(rec, client, login: str):
+    await rec.call(
+        client,
+        "POST /auth/login",
+        "POST",
+        "/auth/login",
+        data={"login": login, "password": login + "123"},
+    )
+
+
+async def sc_login(rec, client, fx):
+    await _login(rec, client, random.choice(fx["logins"]))
+
+
+async def sc_search(rec, client, fx):
+    word = random.choice(fx["logins"])
+    for i in range(1, min(len(word), 8) + 1):
+        await rec.call(
+            client,
+            "GET /api/users/list",
+            "GET",
+            "/api/users/list",
+            params={"q": word[:i], "limit": 25},
+        )
+
+
+async def sc_visits(rec, client, fx):
+    if "session" not in client.cookies:
+        await _login(rec, client, random.choice(fx["logins"]))
+    page = random.choice(("protected_page", "Главная страница", "stats"))
+    await rec.call(client, "GET /api/visit", "GET", "/api/visit", params={"page": page})
+
+
+async def sc_catalog(rec, client, fx):
+    await rec.call(client, "GET /api/companies", "GET", "/api/companies")
+    cid = random.choice(fx["company_ids"])
+    r = await rec.call(
+        client,
+        "GET /api/companies/{company_id}/cars",
+        "GET",
+        f"/api/companies/{cid}/cars",
+    )
+    items = r.json().get("items", []) if r is not None and r.status_code == 200 else []
+    if items:
+        car = random.choice(items)
+        await rec.call(
+            client,
+            "POST /api/cart/add",
+            "POST",
+            "/api/cart/add",
+            json={"car_id": car["car_id"]},
+        )
+    await rec.call(client, "GET /api/cart", "GET", "/api/cart")
+
+
+async def sc_admin(rec, client, fx):
+    if "session" not in client.cookies:
+        await _login(rec, client, ADMIN_LOGIN)
+    await rec.call(
+        client, "GET /api/roles/list", "GET", "/api/roles/list", params={"limit": 25}
+    )
+    if fx["role_ids"]:
+        rid = random.choice(fx["role_ids"])
+        role = await rec.call(
+            client, "GET /api/roles/{role_id}", "GET", f"/api/roles/{rid}"
+        )
+        if role is not None and role.status_code == 200:
+            body = role.json()
+            await rec.call(
+                client,
+                "PUT /api/roles/{role_id}",
+                "PUT",
+                f"/api/roles/{rid}",
+                json={"is_enabled": body["is_enabled"]},  # без фактических изменений
+            )
+        uid = random.choice(fx["user_ids"])
+        await rec.call(
+            client,
+            "POST /api/users/{user_id}/roles",
+            "POST",
+            f"/api/users/{uid}/roles",
+            json={"role_id": rid},
+        )
+        await rec.call(
+            client,
+            "DELETE /api/users/{user_id}/roles/{role_id}",
+            "DELETE",
+            f"/api/users/{uid}/roles/{rid}",
+        )
+
+
+SCENARIO_FUNCS = {
+    "login": sc_login,
+    "search": sc_search,
+    "visits": sc_visits,
+    "catalog": sc_catalog,
+    "admin": sc_admin,
+}
+
+
+async def run_scenario(
+    name: str, url: str, fx: dict, concurrency: int, duration: float
+):
+    rec = Recorder()
+    fn = SCENARIO_FUNCS[name]
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async def vuser():
+        async with httpx.AsyncClient(base_url=url, timeout=30, limits=limits) as client:
+            while time.monotonic() < deadline:
+                await fn(rec, client, fx)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(vuser() for _ in range(concurrency)))
+    return rec, time.perf_counter() - t0
+
+
+def _percentile(sorted_vals: list, q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+def summarize(rec: Recorder, elapsed: float) -> dict:
+    out = {}
+    for name, vals in sorted(rec.lat.items()):
+        vals.sort()
+        out[name] = {
+            "requests": len(vals),
+            "errors": rec.errors.get(name, 0),
+            "status": {str(k): v for k, v in sorted(rec.status[name].items(), key=str)},
+            "rps": round(len(vals) / elapsed, 1),
+            "p50_ms": round(_percentile(vals, 0.50), 2),
+            "p95_ms": round(_percentile(vals, 0.95), 2),
+            "p99_ms": round(_percentile(vals, 0.99), 2),
+        }
+    return out
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Нагрузочный бенчмарк API lab4")
+    ap.add_argument("--url", help="адрес уже запущенного сервера (иначе поднимем свой)")
+    ap.add_argument("--workers", type=int, default=1, help="воркеров uvicorn")
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--companies", type=int, default=50)
+    ap.add_argument("--cars", type=int, default=5000)
+    ap.add_argument("--no-seed", action="store_true", help="не досеивать данные")
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS))
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--duration", type=float, default=15, help="секунд на сценарий")
+    ap.add_argument(
+        "--seed", type=int, default=1, help="seed генератора случайных чисел"
+    )
+    ap.add_argument("--out", help="файл для JSON (по умолчанию stdout)")
+    args = ap.parse_args()
+
+    random.seed(args.seed)
+    if not args.no_seed:
+        seed(args.users, args.companies, args.cars)
+    fx = load_fixture()
+
+    proc = None
+    url = args.url
+    if not url:
+        proc, url = start_server(args.workers)
+    try:
+        results = {}
+        for name in args.scenarios.split(","):
+            rec, elapsed = asyncio.run(
+                run_scenario(name, url, fx, args.concurrency, args.duration)
+            )
+            results[name] = {
+                "elapsed_sec": round(elapsed, 2),
+                "endpoints": summarize(rec, elapsed),
+            }
+            print(f"{name}: done", file=sys.stderr)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    report = {
+        "commit": _git_commit(),
+        "at": datetime.now(timezone.utc).isoformat(),
+        "params": vars(args),
+        "scenarios": results,
+    }
+    data = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(data)
+    else:
+        print(data)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,258 @@
+# bench/bench_micro.py
+"""
+Микробенчмарки Python-работы на запрос (БД не нужна):
+  - utils.passwords: генерация соли, md5+соль, проверка пароля;
+  - _row_to_userout / _row_to_roleout, элементы /users/list, отбор ролей /roles/list,
+    строки корзины /cart;
+  - _get_cart_set (разбор корзины из сессии);
+  - подпись/проверка cookie сессии так, как это делает SessionMiddleware Starlette.
+
+Времена делятся на время эталонного цикла на чистом Python (calibration), поэтому
+сохранённый baseline сравним между машинами, а не только на одной. Случаи замеряются
+вперемешку в rounds раундах, в сравнение идут медианы; допуск каждого случая —
+threshold плюс поправка на его разброс между раундами (сохраняется в baseline).
+
+Запуск из каталога lab4:
+  python -m bench.bench_micro                      # таблица времён
+  python -m bench.bench_micro --save               # записать bench/micro_baseline.json
+  python -m bench.bench_micro --check [--threshold 0.25] [--rounds 30]
+      # код выхода 1, если какой-то случай медленнее baseline больше допуска
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import timeit
+from base64 import b64decode, b64encode
+from datetime import datetime, timedelta, timezone
+from types import MappingProxyType, SimpleNamespace
+
+from itsdangerous import TimestampSigner
+
+from bench.bench_serialization import make_role_rows, make_user_rows
+from routers.cartRouter import _cart_items, _get_cart_set
+from routers.roleRouter import _row_to_roleout, _select_roles
+from routers.userRouter import _row_to_list_item, _row_to_userout
+from utils.passwords import generate_salt, hash_md5_with_salt, verify_md5_with_salt
+
+BASELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "micro_baseline.json"
+)
+
+PAGE = 25  # строк на страницу по умолчанию в списках
+CART = 20  # машин в корзине
+ROLES = 200  # ролей в справочнике
+
+
+# ----------------- Входные данные -----------------
+def make_cart_rows(n: int) -> list[dict]:
+    return [
+        {
+            "car_id": i,
+            "company_id": i % 7 + 1,
+            "company_name": f"Фирма {i % 7 + 1}",
+            "model": f"M-{i}",
+            "year": 2000 + i % 25,
+            "price": None if i % 10 == 0 else 500000 + i * 1000,
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def make_session(cart: int) -> dict:
+    return {"user_id": 42, "login": "ivanov", "cart": list(range(1000, 1000 + cart))}
+
+
+_signer = TimestampSigner("bench-secret")
+
+
+def sign_session(session: dict) -> bytes:
+    # starlette.middleware.sessions.SessionMiddleware, ответ
+    return _signer.sign(b64encode(json.dumps(session).encode("utf-8")))
+
+
+def unsign_session(cookie: bytes) -> dict:
+    # starlette.middleware.sessions.SessionMiddleware, запрос
+    return json.loads(b64decode(_signer.unsign(cookie, max_age=14 * 24 * 3600)))
+
+
+def _calibration():
+    # эталон: типичная интерпретируемая работа (dict/str/цикл)
+    d = {}
+    for i in range(200):
+        d[f"k{i}"] = i * 2
+    return sum(v for k, v in d.items() if k.endswith("1"))
+
+
+def build_cases() -> list[tuple[str, object]]:
+    users = make_user_rows(PAGE)
+    roles_page = make_role_rows(PAGE)
+    now = datetime.now(timezone.utc)
+    registry = [
+        MappingProxyType(
+            {
+                "role_id": i,
+                "name": f"role_{i}",
+                "is_enabled": i % 3 != 0,
+                "created_at": now - timedelta(days=i),
+            }
+        )
+        for i in range(1, ROLES + 1)
+    ]
+    cart_rows = make_cart_rows(CART)
+    request = SimpleNamespace(session=make_session(CART))
+    salt = generate_salt()
+    hashed = hash_md5_with_salt("password123", salt)
+    session = make_session(CART)
+    cookie = sign_session(session)
+
+    return [
+        ("passwords.generate_salt", generate_salt),
+        ("passwords.hash_md5", lambda: hash_md5_with_salt("password123", salt)),
+        (
+            "passwords.verify_md5",
+            lambda: verify_md5_with_salt("password123", salt, hashed),
+        ),
+        (f"users.userout x{PAGE}", lambda: [_row_to_userout(r) for r in users]),
+        (f"users.list_item x{PAGE}", lambda: [_row_to_list_item(r) for r in users]),
+        (f"roles.roleout x{PAGE}", lambda: [_row_to_roleout(r) for r in roles_page]),
+        (
+            f"roles.select of {ROLES}",
+            lambda: _select_roles(registry, "role_1", "enabled", "name", "desc"),
+        ),
+        (f"cart.items x{CART}", lambda: _cart_items(cart_rows)),
+        (f"cart.get_set x{CART}", lambda: _get_cart_set(request)),
+        ("session.sign", lambda: sign_session(session)),
+        ("session.unsign", lambda: unsign_session(cookie)),
+    ]
+
+
+# ----------------- Замеры -----------------
+def _number(fn, sample_s: float) -> int:
+    """Число вызовов, чтобы один замер длился не меньше sample_s."""
+    n = 1
+    while True:
+        t = timeit.timeit(fn, number=n)
+        if t >= sample_s:
+            return n
+        n = max(n * 2, int(n * sample_s / t * 1.2) if t > 0 else n * 10)
+
+
+def _per_call(fn, number: int) -> float:
+    return timeit.timeit(fn, number=number) / number
+
+
+def _noise(xs: list[float]) -> float:
+    """Относительный разброс замеров: межквартильный размах / медиана."""
+    q1, _, q3 = statistics.quantiles(xs, n=4)
+    return (q3 - q1) / statistics.median(xs)
+
+
+def measure(rounds: int, sample_ms: float) -> tuple[float, dict, dict, dict]:
+    """
+    Медианы времени на вызов, отношения к эталону и их разброс по rounds раундам.
+    В каждом раунде случаи идут в случайном порядке, каждый замер обрамлён
+    замерами эталона: дрейф частоты CPU и фоновая нагрузка ложатся на все случаи
+    поровну, а не на тот, что попал в неудачный момент.
+    """
+    cases = build_cases()
+    for _, fn in cases:  # прогрев: кэши, ленивые импорты
+        fn()
+    sample_s = sample_ms / 1000
+    numbers = {name: _number(fn, sample_s) for name, fn in cases}
+    calib_n = _number(_calibration, sample_s)
+    times = {name: [] for name, _ in cases}
+    ratios = {name: [] for name, _ in cases}
+    calibs = []
+    rng = random.Random(0)
+    for _ in range(rounds):
+        order = list(cases)
+        rng.shuffle(order)
+        for name, fn in order:
+            before = _per_call(_calibration, calib_n)
+            t = _per_call(fn, numbers[name])
+            calib = (before + _per_call(_calibration, calib_n)) / 2
+            times[name].append(t)
+            ratios[name].append(t / calib)
+            calibs.append(calib)
+    med = statistics.median
+    return (
+        med(calibs),
+        {k: med(v) for k, v in times.items()},
+        {k: med(v) for k, v in ratios.items()},
+        {k: _noise(v) for k, v in ratios.items()},
+    )
+
+
+def tolerance(threshold: float, noise: float, base_noise: float, rounds: int) -> float:
+    """
+    Допуск случая: threshold плюс три «стандартные ошибки» разности медиан
+    (разброс замеров — из baseline и текущего прогона, берётся больший).
+    """
+    return threshold + 3 * max(noise, base_noise) * math.sqrt(2 / rounds)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Микробенчмарки обработчиков lab4")
+    ap.add_argument("--rounds", type=int, default=30, help="раундов замеров")
+    ap.add_argument(
+        "--sample-ms", type=float, default=5, help="длительность одного замера, мс"
+    )
+    ap.add_argument("--save", action="store_true", help="сохранить baseline")
+    ap.add_argument("--check", action="store_true", help="сравнить с baseline")
+    ap.add_argument("--threshold", type=float, default=0.25, help="допуск замедления")
+    ap.add_argument("--baseline", default=BASELINE)
+    args = ap.parse_args()
+
+    calib, results, ratios, noise = measure(args.rounds, args.sample_ms)
+
+    base, base_noise = {}, {}
+    if args.check:
+        with open(args.baseline, encoding="utf-8") as f:
+            saved = json.load(f)
+        base, base_noise = saved["ratios"], saved.get("noise", {})
+
+    print(f"calibration: {calib * 1e6:.2f} us")
+    print(
+        f"{'case':<28}{'us/call':>10}{'x calib':>10}{'noise':>8}{'vs base':>10}{'tol':>7}"
+    )
+    failed = []
+    for name, t in results.items():
+        line = f"{name:<28}{t * 1e6:>10.2f}{ratios[name]:>10.3f}{noise[name]:>8.1%}"
+        if name in base:
+            delta = ratios[name] / base[name] - 1
+            tol = tolerance(
+                args.threshold, noise[name], base_noise.get(name, 0), args.rounds
+            )
+            line += f"{delta:>+10.0%}{tol:>7.0%}"
+            if delta > tol:
+                failed.append(name)
+                line += "  SLOWER"
+        print(line)
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "rounds": args.rounds,
+                    "sample_ms": args.sample_ms,
+                    "ratios": ratios,
+                    "noise": noise,
+                },
+                f,
+                indent=2,
+            )
+            f.write("\n")
+        print(f"baseline saved: {args.baseline}")
+    if failed:
+        print(f"regression: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
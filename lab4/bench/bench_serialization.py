@@ -0,0 +1,134 @@
+# bench/bench_serialization.py
+"""
+Бенчмарк сериализации ответов: «старый» путь (Pydantic-модель + повторная
+валидация по response_model + jsonable_encoder + json.dumps) против быстрого
+(dict из строки + FastJSONResponse/orjson).
+
+Запуск из каталога lab4 (БД не нужна):
+  python -m bench.bench_serialization [--rows 100] [--repeat 200]
+
+Печатает время на страницу и на строку (мкс) для каждого варианта.
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import timeit
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from routers.roleRouter import RoleOut, _row_to_roleout
+from routers.userRouter import UserOut, _row_to_list_item, _row_to_userout
+from utils.fastjson import FastJSONResponse, dumps
+
+
+def _json_render(content) -> bytes:
+    # то же, что делает starlette.responses.JSONResponse.render
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def make_user_rows(n: int) -> list[dict]:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "user_id": i,
+            "last_name": f"Фамилия{i}",
+            "first_name": f"Имя{i}",
+            "email": f"user{i}@example.com",
+            "login": f"user{i}",
+            "created_at": now - timedelta(days=i),
+            "updated_at": now,
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def make_role_rows(n: int) -> list[dict]:
+    now = datetime.now(timezone.utc)
+    return [
+        {"role_id": i, "name": f"role_{i}", "is_enabled": i % 3 != 0, "created_at": now}
+        for i in range(1, n + 1)
+    ]
+
+
+# ----------------- Старый путь -----------------
+_users_adapter = TypeAdapter(list[UserOut])
+_roles_adapter = TypeAdapter(list[RoleOut])
+
+
+def old_users_page(rows):
+    models = [UserOut(**r) for r in rows]  # _row_to_userout
+    validated = _users_adapter.validate_python(models)  # response_model
+    return _json_render(jsonable_encoder(validated))
+
+
+def old_users_list(rows):
+    content = {
+        "total": len(rows),
+        "items": [
+            {
+                "user_id": r["user_id"],
+                "name": f'{r["last_name"]} {r["first_name"]}',
+                "login": r["login"],
+                "email": r["email"],
+                "created_at": r["created_at"].isoformat() if r["created_at"] else None,
+            }
+            for r in rows
+        ],
+    }
+    return _json_render(jsonable_encoder(content))
+
+
+def old_roles_page(rows):
+    models = [RoleOut(**r) for r in rows]
+    validated = _roles_adapter.validate_python(models)
+    return _json_render(jsonable_encoder(validated))
+
+
+# ----------------- Быстрый путь -----------------
+def new_users_page(rows):
+    return FastJSONResponse([_row_to_userout(r) for r in rows]).body
+
+
+def new_users_list(rows):
+    return dumps({"total": len(rows), "items": [_row_to_list_item(r) for r in rows]})
+
+
+def new_roles_page(rows):
+    return FastJSONResponse([_row_to_roleout(r) for r in rows]).body
+
+
+CASES = [
+    ("users: UserOut", make_user_rows, old_users_page, new_users_page),
+    ("users: /users/list", make_user_rows, old_users_list, new_users_list),
+    ("roles: RoleOut", make_role_rows, old_roles_page, new_roles_page),
+]
+
+
+def _per_call(fn, arg, repeat: int) -> float:
+    """Лучшее из 5 замеров, секунд на вызов."""
+    return min(timeit.repeat(lambda: fn(arg), number=repeat, repeat=5)) / repeat
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--rows", type=int, default=100, help="строк на страницу")
+    ap.add_argument("--repeat", type=int, default=200, help="вызовов на замер")
+    args = ap.parse_args()
+
+    print(f"rows per page: {args.rows}")
+    print(f"{'case':<22}{'old, us/row':>14}{'new, us/row':>14}{'saved':>10}")
+    for name, make, old, new in CASES:
+        rows = make(args.rows)
+        t_old = _per_call(old, rows, args.repeat) / args.rows * 1e6
+        t_new = _per_call(new, rows, args.repeat) / args.rows * 1e6
+        print(f"{name:<22}{t_old:>14.2f}{t_new:>14.2f}{t_old / t_new:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,512 @@
+# bench/gen_data.py
+"""
+Генератор данных большого объёма для бенчмарков (нужна БД из .env):
+  - пользователи <prefix>N (пароль = логин + "123", как в fill_auth_tables) с
+    солью из 8 символов и md5(соль + пароль) — хеши считаются в процессах-воркерах;
+  - роли со скошенным распределением: почти у всех user, у единиц admin (ROLE_SHARE);
+  - фирмы и машины: число машин у фирмы — по степенному закону, цена — логнормальная;
+  - посещения за --days дней до --end: пользователь и страница — по закону Ципфа
+    (немногие активные пользователи и популярные страницы дают основную долю визитов).
+
+Данные режутся на куски; каждый кусок генерирует (numpy) и грузит через COPY
+один воркер на своём соединении — --workers параллельных потоков COPY. Генератор
+каждого куска засеян (seed, вид данных, номер куска), поэтому результат не зависит
+от числа воркеров и порядка их работы: тот же --seed и те же параметры на той же
+исходной БД дают те же строки. Идентификаторы назначаются явно, начиная с max(id) + 1;
+последовательности сдвигаются в конце.
+
+Посещения куска лежат в своём отрезке времени и отсортированы — как журнал, который
+пишется по мере прихода визитов (BRIN по visited_at остаётся узким). Дневные итоги
+строит задача visit_rollup при следующем запуске (или сразу — флаг --rollup);
+приближённые счётчики (/api/visits/approx/*) сгенерированные визиты не видят.
+
+Запуск из каталога lab4:
+  python -m bench.gen_data --users 100000 --visits 10000000 --workers 8
+  python -m bench.gen_data --users 1000 --visits 100000 --seed 7 --end 2026-01-01
+  python -m bench.gen_data --reset --visits 0 --users 0 --companies 0 --cars 0
+      # --reset: TRUNCATE всех таблиц посещений и удаление пользователей/фирм с префиксом
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time as dtime, timedelta, timezone
+
+import numpy as np
+import psycopg
+
+from db.database import url
+from utils.passwords import hash_md5_with_salt
+
+USER_CHUNK = 50_000
+CAR_CHUNK = 200_000
+VISIT_CHUNK = 500_000
+WRITE_ROWS = 100_000  # строк в одном write() в COPY
+
+# доля пользователей с ролью; прочие роли — OTHER_ROLE_SHARE
+ROLE_SHARE = {
+    "user": 0.9,
+    "viewer": 0.25,
+    "editor": 0.04,
+    "moderator": 0.01,
+    "admin": 0.001,
+}
+OTHER_ROLE_SHARE = 0.01
+
+# потоки случайных чисел: (seed, поток, номер куска)
+_USERS, _CARS, _VISITS, _USER_RANK, _COMPANY_RANK, _COMPANIES = range(1, 7)
+
+SALT_ALPHABET = np.frombuffer(
+    b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789", dtype=np.uint8
+)
+LAST_NAMES = np.array(
+    [
+        "Иванов", "Петров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов",
+        "Михайлов", "Новиков", "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев",
+        "Семёнов", "Егоров", "Павлов", "Козлов", "Степанов", "Николаев", "Орлов",
+        "Андреев", "Макаров", "Никитин", "Захаров", "Зайцев", "Соловьёв", "Борисов",
+    ]
+)  # fmt: skip
+FIRST_NAMES = np.array(
+    [
+        "Александр", "Дмитрий", "Максим", "Сергей", "Андрей", "Алексей", "Артём",
+        "Илья", "Кирилл", "Михаил", "Никита", "Матвей", "Роман", "Егор", "Иван",
+        "Анна", "Мария", "Елена", "Ольга", "Наталья", "Екатерина", "Татьяна",
+        "Ирина", "Светлана", "Юлия", "Дарья", "Полина", "Ксения",
+    ]
+)  # fmt: skip
+COMPANY_WORDS = ["Авто", "Мотор", "Транс", "Драйв", "Кар", "Стар", "Север", "Урал"]
+COMPANY_KINDS = ["трейд", "сервис", "групп", "центр", "лайн", "маркет"]
+CAR_MODELS = np.array(
+    [
+        "Camry", "Corolla", "RAV4", "Octavia", "Rapid", "Kodiaq", "Solaris", "Creta",
+        "Tucson", "Rio", "Sportage", "Polo", "Tiguan", "Vesta", "Granta", "Niva",
+        "X5", "3 Series", "A4", "Q5", "Outlander", "Qashqai", "X-Trail", "CX-5",
+    ]
+)  # fmt: skip
+SITE_PAGES = ["protected_page", "users", "roles", "cars", "cart", "profile", "search"]
+
+_conn: psycopg.Connection | None = None
+
+
+# ----------------- Распределения -----------------
+def _rng(seed: int, stream: int, chunk: int = 0) -> np.random.Generator:
+    return np.random.default_rng([seed, stream, chunk])
+
+
+def _zipf_cdf(n: int, s: float) -> np.ndarray:
+    """Функция распределения Ципфа на рангах 0..n-1: P(r) ~ 1 / (r + 1)^s."""
+    w = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** s
+    cdf = np.cumsum(w)
+    return cdf / cdf[-1]
+
+
+def _zipf(rng: np.random.Generator, cdf: np.ndarray, size: int) -> np.ndarray:
+    return np.minimum(
+        np.searchsorted(cdf, rng.random(size), side="right"), len(cdf) - 1
+    )
+
+
+_ranks: dict[tuple, tuple[np.ndarray, np.ndarray]] = {}
+
+
+def _ranked(seed: int, stream: int, n: int, s: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (функция распределения, перестановка ранг -> индекс): самые популярные —
+    случайные объекты, а не первые по id. Считается один раз на процесс.
+    """
+    key = (seed, stream, n, s)
+    if key not in _ranks:
+        _ranks[key] = (_zipf_cdf(n, s), _rng(seed, stream).permutation(n))
+    return _ranks[key]
+
+
+def _ts(us: np.ndarray) -> list[str]:
+    """Микросекунды UTC -> текст для COPY (сессия воркера в UTC)."""
+    return np.datetime_as_string(us.astype("datetime64[us]"), unit="us").tolist()
+
+
+def _ids(base: int, idx: np.ndarray) -> list[str]:
+    return (idx + (base + 1)).astype(str).tolist()
+
+
+# ----------------- Воркер -----------------
+def _init_worker(conninfo: str) -> None:
+    global _conn
+    _conn = psycopg.connect(conninfo, autocommit=True)
+    _conn.execute("SET TimeZone = 'UTC'")
+    _conn.execute("SET synchronous_commit = off")
+
+
+def _copy(cur, sql: str, lines) -> int:
+    n = 0
+    with cur.copy(sql) as cp:
+        batch = []
+        for line in lines:
+            batch.append(line)
+            if len(batch) == WRITE_ROWS:
+                cp.write("".join(batch))
+                n += len(batch)
+                batch.clear()
+        if batch:
+            cp.write("".join(batch))
+            n += len(batch)
+    return n
+
+
+def _run(job: tuple) -> int:
+    """Кусок данных: сгенерировать и загрузить одной транзакцией, вернуть число строк."""
+    fn, args = job
+    with _conn.transaction(), _conn.cursor() as cur:
+        return fn(cur, *args)
+
+
+def _users_chunk(cur, p: dict, k: int, lo: int, hi: int) -> int:
+    rng = _rng(p["seed"], _USERS, k)
+    n = hi - lo
+    idx = np.arange(lo, hi)
+    uids = _ids(p["user_base"], idx)
+    logins = [f"{p['prefix']}{i + 1}" for i in idx.tolist()]
+    last = LAST_NAMES[rng.integers(0, len(LAST_NAMES), n)].tolist()
+    first = FIRST_NAMES[rng.integers(0, len(FIRST_NAMES), n)].tolist()
+    salts = [
+        s.decode()
+        for s in SALT_ALPHABET[rng.integers(0, len(SALT_ALPHABET), (n, 8))]
+        .view("S8")
+        .ravel()
+    ]
+    # регистрация — за год до начала окна посещений
+    created_us = p["t0_us"] - rng.integers(0, 365 * 86_400_000_000, n)
+    created = _ts(created_us)
+    rows = _copy(
+        cur,
+        "COPY auth.users (user_id, last_name, first_name, email, login, salt, "
+        "password_hash, created_at, updated_at) FROM STDIN",
+        (
+            f"{uids[i]}\t{last[i]}\t{first[i]}\t{logins[i]}@example.com\t{logins[i]}\t"
+            f"{salts[i]}\t{hash_md5_with_salt(logins[i] + '123', salts[i])}\t"
+            f"{created[i]}\t{created[i]}\n"
+            for i in range(n)
+        ),
+    )
+    grants = []
+    for role_id, share in p["roles"]:
+        for i in np.flatnonzero(rng.random(n) < share).tolist():
+            grants.append(f"{uids[i]}\t{role_id}\t{created[i]}\n")
+    return rows + _copy(
+        cur, "COPY auth.user_roles (user_id, role_id, granted_at) FROM STDIN", grants
+    )
+
+
+def _cars_chunk(cur, p: dict, k: int, lo: int, hi: int) -> int:
+    rng = _rng(p["seed"], _CARS, k)
+    n = hi - lo
+    cdf, perm = _ranked(p["seed"], _COMPANY_RANK, p["companies"], 1.0)
+    company = _ids(p["company_base"], perm[_zipf(rng, cdf, n)])
+    cids = _ids(p["car_base"], np.arange(lo, hi))
+    model = CAR_MODELS[rng.integers(0, len(CAR_MODELS), n)].tolist()
+    trim = rng.integers(100, 1000, n).tolist()
+    # свежих машин больше: возраст — геометрический, не старше 30 лет
+    year = (p["year"] - np.minimum(rng.geometric(0.15, n) - 1, 30)).tolist()
+    price = np.round(rng.lognormal(np.log(1_500_000), 0.6, n), 2)
+    price = np.minimum(price, 9_999_999_999.99).tolist()
+    created = _ts(p["t0_us"] - rng.integers(0, 365 * 86_400_000_000, n))
+    return _copy(
+        cur,
+        "COPY catalog.cars (car_id, company_id, model, year, price, created_at) FROM STDIN",
+        (
+            f"{cids[i]}\t{company[i]}\t{model[i]} {trim[i]}\t{year[i]}\t"
+            f"{price[i]:.2f}\t{created[i]}\n"
+            for i in range(n)
+        ),
+    )
+
+
+def _visits_chunk(cur, p: dict, k: int, count: int, t_lo: int, t_hi: int) -> int:
+    rng = _rng(p["seed"], _VISITS, k)
+    cdf, perm = _ranked(p["seed"], _USER_RANK, p["users"], p["zipf"])
+    users = _ids(p["visit_user_base"], perm[_zipf(rng, cdf, count)])
+    pages = np.array(p["pages"])[_zipf(rng, p["page_cdf"], count)].tolist()
+    at = _ts(np.sort(rng.integers(t_lo, t_hi, count)))
+    return _copy(
+        cur,
+        "COPY auth.user_visits (user_id, page_name, visited_at) FROM STDIN",
+        (f"{users[i]}\t{pages[i]}\t{at[i]}\n" for i in range(count)),
+    )
+
+
+# ----------------- Главный процесс -----------------
+def _pages(n: int) -> list[str]:
+    return (SITE_PAGES + [f"page_{i}" for i in range(1, n + 1)])[:n]
+
+
+def _split(total: int, size: int) -> list[tuple[int, int]]:
+    return [(lo, min(lo + size, total)) for lo in range(0, total, size)]
+
+
+def _reset(conn, prefix: str) -> None:
+    with conn.transaction():
+        conn.execute(
+            "TRUNCATE auth.user_visits, auth.user_visits_daily, auth.page_visits_daily, "
+            "auth.visit_hll, auth.visit_topk"
+        )
+        conn.execute(
+            "DELETE FROM auth.user_roles WHERE granted_by IN "
+            "(SELECT user_id FROM auth.users WHERE starts_with(login, %s))",
+            (prefix,),
+        )
+        conn.execute("DELETE FROM auth.users WHERE starts_with(login, %s)", (prefix,))
+        conn.execute(
+            "DELETE FROM catalog.companies WHERE starts_with(name, %s)", (prefix,)
+        )
+
+
+def _detach_visits(conn) -> list[tuple[str, str, str]]:
+    """
+    Снять вторичные индексы и внешние ключи auth.user_visits на время COPY
+    (иначе каждая строка обновляет пять индексов и проверяет users).
+    Возвращает [(вид, имя, определение)] для _restore_visits.
+    """
+    indexes = conn.execute(
+        "SELECT 'index', indexname, indexdef FROM pg_indexes WHERE schemaname = 'auth' "
+        "AND tablename = 'user_visits' AND indexname <> 'user_visits_pkey'"
+    ).fetchall()
+    fks = conn.execute(
+        "SELECT 'fk', conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = 'auth.user_visits'::regclass AND contype = 'f'"
+    ).fetchall()
+    with conn.transaction():
+        for _, name, _ in indexes:
+            conn.execute(f"DROP INDEX auth.{name}")
+        for _, name, _ in fks:
+            conn.execute(f"ALTER TABLE auth.user_visits DROP CONSTRAINT {name}")
+    return indexes + fks
+
+
+def _index_job(cur, definition: str) -> int:
+    cur.execute("SET maintenance_work_mem = '256MB'")
+    cur.execute(definition)
+    return 0
+
+
+def _restore_visits(pool, conn, restore: list[tuple[str, str, str]]) -> None:
+    """Индексы — параллельно в воркерах; внешний ключ — NOT VALID и VALIDATE одним проходом."""
+    list(pool.map(_run, [(_index_job, (d,)) for k, _, d in restore if k == "index"]))
+    for kind, name, definition in restore:
+        if kind == "fk":
+            conn.execute(
+                f"ALTER TABLE auth.user_visits ADD CONSTRAINT {name} {definition} NOT VALID"
+            )
+            conn.execute(f"ALTER TABLE auth.user_visits VALIDATE CONSTRAINT {name}")
+
+
+def _base(conn, table: str, column: str) -> int:
+    return conn.execute(f"SELECT coalesce(max({column}), 0) FROM {table}").fetchone()[0]
+
+
+def _phase(pool, name: str, fn, jobs: list[tuple]) -> dict:
+    if not jobs:
+        return {"rows": 0, "sec": 0}
+    t0 = time.perf_counter()
+    rows = sum(pool.map(_run, [(fn, j) for j in jobs]))
+    sec = time.perf_counter() - t0
+    print(
+        f"{name}: {rows} строк за {sec:.1f} с ({rows / sec if sec else 0:,.0f} строк/с)",
+        file=sys.stderr,
+    )
+    return {"rows": rows, "sec": round(sec, 2)}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Генератор данных для бенчмарков lab4")
+    ap.add_argument("--users", type=int, default=100_000)
+    ap.add_argument("--companies", type=int, default=500)
+    ap.add_argument("--cars", type=int, default=200_000)
+    ap.add_argument("--visits", type=int, default=10_000_000)
+    ap.add_argument("--days", type=int, default=90, help="окно посещений, дней")
+    ap.add_argument(
+        "--end",
+        type=date.fromisoformat,
+        default=datetime.now(timezone.utc).date(),
+        help="дата (UTC), до начала которой идут посещения; по умолчанию сегодня",
+    )
+    ap.add_argument("--pages", type=int, default=50, help="различных страниц")
+    ap.add_argument(
+        "--zipf", type=float, default=1.1, help="показатель закона Ципфа для визитов"
+    )
+    ap.add_argument("--prefix", default="gen_", help="префикс логинов и имён фирм")
+    ap.add_argument(
+        "--seed", type=int, default=1, help="seed генератора случайных чисел"
+    )
+    ap.add_argument("--workers", type=int, default=4, help="параллельных потоков COPY")
+    ap.add_argument(
+        "--reset",
+        action="store_true",
+        help="сначала очистить посещения и удалить пользователей/фирмы с префиксом",
+    )
+    ap.add_argument(
+        "--drop-indexes",
+        action="store_true",
+        help="снять индексы и внешний ключ auth.user_visits на время загрузки посещений",
+    )
+    ap.add_argument(
+        "--rollup", action="store_true", help="после загрузки свернуть дневные итоги"
+    )
+    args = ap.parse_args()
+
+    conninfo = url.set(drivername="postgresql").render_as_string(hide_password=False)
+    t1 = datetime.combine(args.end, dtime.min, timezone.utc)
+    t0 = t1 - timedelta(days=args.days)
+    t0_us, t1_us = (int(t.timestamp()) * 1_000_000 for t in (t0, t1))
+    report: dict = {}
+
+    with psycopg.connect(conninfo, autocommit=True) as conn:
+        if args.reset:
+            _reset(conn, args.prefix)
+        clash = conn.execute(
+            "SELECT login FROM auth.users WHERE starts_with(login, %s) LIMIT 1",
+            (args.prefix,),
+        ).fetchone()
+        if clash and args.users:
+            raise SystemExit(
+                f"пользователь {clash[0]} уже есть: добавьте --reset или смените --prefix"
+            )
+        roles = [
+            (rid, ROLE_SHARE.get(name, OTHER_ROLE_SHARE))
+            for rid, name in conn.execute(
+                "SELECT role_id, role_name FROM auth.roles ORDER BY role_id"
+            )
+        ]
+        p = {
+            "seed": args.seed,
+            "prefix": args.prefix,
+            "roles": roles,
+            "t0_us": t0_us,
+            "year": args.end.year,
+            "zipf": args.zipf,
+            "pages": _pages(args.pages),
+            "page_cdf": _zipf_cdf(args.pages, 1.0),
+            "user_base": _base(conn, "auth.users", "user_id"),
+            "company_base": _base(conn, "catalog.companies", "company_id"),
+            "car_base": _base(conn, "catalog.cars", "car_id"),
+        }
+        # визиты — по сгенерированным пользователям, а без --users — по последним
+        # имеющимся с префиксом (повторная догрузка посещений)
+        p["users"] = args.users
+        p["visit_user_base"] = p["user_base"]
+        if not args.users:
+            lo, n = conn.execute(
+                "SELECT coalesce(min(user_id), 1) - 1, count(*) FROM auth.users "
+                "WHERE starts_with(login, %s)",
+                (args.prefix,),
+            ).fetchone()
+            p["users"], p["visit_user_base"] = n, lo
+        if args.visits and not p["users"]:
+            raise SystemExit("нет пользователей для посещений: задайте --users")
+
+        if args.companies:
+            t = time.perf_counter()
+            rng = _rng(args.seed, _COMPANIES)
+            words = rng.integers(0, len(COMPANY_WORDS), args.companies).tolist()
+            kinds = rng.integers(0, len(COMPANY_KINDS), args.companies).tolist()
+            with conn.cursor() as cur:
+                n = _copy(
+                    cur,
+                    "COPY catalog.companies (company_id, name) FROM STDIN",
+                    (
+                        f"{p['company_base'] + i + 1}\t{args.prefix}"
+                        f"{COMPANY_WORDS[words[i]]}{COMPANY_KINDS[kinds[i]]} {i + 1}\n"
+                        for i in range(args.companies)
+                    ),
+                )
+            report["companies"] = {
+                "rows": n,
+                "sec": round(time.perf_counter() - t, 2),
+            }
+        p["companies"] = args.companies
+        if args.cars and not args.companies:
+            p["company_base"], p["companies"] = conn.execute(
+                "SELECT coalesce(min(company_id), 1) - 1, count(*) FROM catalog.companies "
+                "WHERE starts_with(name, %s)",
+                (args.prefix,),
+            ).fetchone()
+            if not p["companies"]:
+                raise SystemExit("нет фирм для машин: задайте --companies")
+
+        spans = max(1, -(-args.visits // VISIT_CHUNK))
+        step = (t1_us - t0_us) / spans
+        visit_jobs = [
+            (
+                p,
+                k,
+                args.visits // spans + (k < args.visits % spans),
+                t0_us + int(step * k),
+                t0_us + int(step * (k + 1)),
+            )
+            for k in range(spans if args.visits else 0)
+        ]
+
+        with ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=_init_worker,
+            initargs=(conninfo,),
+        ) as pool:
+            report["users"] = _phase(
+                pool,
+                "users+roles",
+                _users_chunk,
+                [
+                    (p, k, lo, hi)
+                    for k, (lo, hi) in enumerate(_split(args.users, USER_CHUNK))
+                ],
+            )
+            report["cars"] = _phase(
+                pool,
+                "cars",
+                _cars_chunk,
+                [
+                    (p, k, lo, hi)
+                    for k, (lo, hi) in enumerate(_split(args.cars, CAR_CHUNK))
+                ],
+            )
+            restore = _detach_visits(conn) if args.drop_indexes and visit_jobs else []
+            try:
+                report["visits"] = _phase(pool, "visits", _visits_chunk, visit_jobs)
+            finally:
+                if restore:
+                    t = time.perf_counter()
+                    _restore_visits(pool, conn, restore)
+                    report["reindex"] = {"sec": round(time.perf_counter() - t, 2)}
+                    print(f"reindex: {report['reindex']['sec']} с", file=sys.stderr)
+
+        for seq, table, column in (
+            ("auth.users_user_id_seq", "auth.users", "user_id"),
+            ("catalog.companies_company_id_seq", "catalog.companies", "company_id"),
+            ("catalog.cars_car_id_seq", "catalog.cars", "car_id"),
+        ):
+            conn.execute(
+                f"SELECT setval('{seq}', greatest((SELECT max({column}) FROM {table}), 1))"
+            )
+        conn.execute(
+            "ANALYZE auth.users, auth.user_roles, auth.user_visits, "
+            "catalog.companies, catalog.cars"
+        )
+
+    if args.rollup:
+        from core.jobs import visit_rollup
+
+        t = time.perf_counter()
+        visit_rollup()
+        report["rollup"] = {"sec": round(time.perf_counter() - t, 2)}
+        print(f"rollup: {report['rollup']['sec']} с", file=sys.stderr)
+
+    params = vars(args) | {"end": args.end.isoformat()}
+    print(json.dumps({"params": params, **report}, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
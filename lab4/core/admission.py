@@ -0,0 +1,238 @@
+# core/admission.py
+"""
+Контроль допуска запросов, которые ходят в БД.
+
+Когда Postgres тормозит, синхронные обработчики висят на engine.connect(),
+threadpool (40 потоков anyio) заполняется, и в очередь встают все маршруты —
+даже /auth/me без БД. Здесь запрос отсекается ДО threadpool и сессии:
+
+- классы приоритета по пути (ROUTE_CLASSES):
+    critical — вход и учёт посещений,
+    normal   — остальное API (CRUD, каталог, корзина),
+    low      — статистика, списки для админки, аналитика;
+  у каждого класса свой лимит одновременных запросов (ADMISSION_LIMIT_*), сумма
+  лимитов меньше threadpool — маршрутам без БД всегда остаются потоки, а
+  тяжёлые списки не вытесняют логин;
+- лишний запрос — сразу 503 с Retry-After, без ожидания;
+- автомат (circuit breaker) по исходам запросов за ADMISSION_BREAKER_WINDOW_SEC:
+  ошибка соединения/таймаут пула, ответ 5xx или время в БД больше
+  ADMISSION_DB_SLOW_MS — неудача. При доле неудач >= ADMISSION_BREAKER_FAILURE_RATIO автомат открывается
+  на ADMISSION_BREAKER_OPEN_SEC (все классы получают 503), затем полуоткрыт:
+  пропускаются по одному пробные запросы класса critical; успех закрывает автомат,
+  если пробный запрос выполнил SQL (ответ без обращения к БД — не проба).
+
+Маршруты без класса (страницы, статика, /auth/me, /healthz, /metrics, SSE
+/api/visits/stream) не ограничиваются.
+"""
+
+from __future__ import annotations
+import json
+import math
+import re
+import time
+from collections import deque
+
+from sqlalchemy import exc as sa_exc
+
+from core import metrics
+from core.config import (
+    ADMISSION_BREAKER_FAILURE_RATIO,
+    ADMISSION_BREAKER_MIN_REQUESTS,
+    ADMISSION_BREAKER_OPEN_SEC,
+    ADMISSION_BREAKER_WINDOW_SEC,
+    ADMISSION_DB_SLOW_MS,
+    ADMISSION_ENABLED,
+    ADMISSION_LIMIT_CRITICAL,
+    ADMISSION_LIMIT_LOW,
+    ADMISSION_LIMIT_NORMAL,
+)
+
+CRITICAL, NORMAL, LOW = "critical", "normal", "low"
+LIMITS = {
+    CRITICAL: ADMISSION_LIMIT_CRITICAL,
+    NORMAL: ADMISSION_LIMIT_NORMAL,
+    LOW: ADMISSION_LIMIT_LOW,
+}
+
+# (метод или None, шаблон пути) -> класс; первый совпавший. None — без ограничений.
+ROUTE_CLASSES = [
+    ("POST", r"/auth/login", CRITICAL),
+    (None, r"/api/visit", CRITICAL),
+    (None, r"/api/stats", LOW),
+    ("GET", r"/api/users/list", LOW),
+    ("GET", r"/api/roles/list", LOW),
+    (None, r"/api/admin/.*", LOW),
+    (None, r"/api/catalog/analytics", LOW),
+    ("GET", r"/api/visits/analytics/.*", LOW),
+    ("GET", r"/api/visits/approx/.*", LOW),
+    # долгоживущий SSE: слот держался бы всё время соединения; в БД не ходит
+    ("GET", r"/api/visits/stream", None),
+    (None, r"/api/.*", NORMAL),
+]
+_ROUTES = [(m, re.compile(p + r"\Z"), c) for m, p, c in ROUTE_CLASSES]
+
+# ошибки «БД недоступна/перегружена», а не логики запроса
+DB_FAILURES = (sa_exc.OperationalError, sa_exc.InterfaceError, sa_exc.TimeoutError)
+
+REJECTED = metrics.counter(
+    "admission_rejected_total",
+    "Запросы, отклонённые контролем допуска",
+    ("class", "reason"),
+)
+IN_FLIGHT = metrics.gauge(
+    "admission_in_flight", "Запросы в обработке по классу приоритета", ("class",)
+)
+# автомат у каждого воркера свой: по воркерам — наибольшее (открыт хоть у одного)
+BREAKER_STATE = metrics.gauge(
+    "admission_breaker_open",
+    "Автомат БД: 0 закрыт, 1 открыт, 0.5 полуоткрыт",
+    merge="max",
+)
+
+
+def classify(method: str, path: str):
+    for m, rx, cls in _ROUTES:
+        if (m is None or m == method) and rx.match(path):
+            return cls
+    return None
+
+
+# ----------------- Автомат БД -----------------
+class Breaker:
+    """Состояние меняется только в потоке event loop — блокировки не нужны."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self):
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.outcomes: deque = deque()  # (monotonic, неудача?)
+
+    def _set(self, state: str) -> None:
+        self.state = state
+        BREAKER_STATE.set((), {"closed": 0, "open": 1, "half_open": 0.5}[state])
+
+    def retry_after(self) -> int:
+        left = self.opened_at + ADMISSION_BREAKER_OPEN_SEC - time.monotonic()
+        return max(1, math.ceil(left))
+
+    def allow(self, cls: str) -> bool:
+        """True — пропустить; для полуоткрытого состояния помечает пробный запрос."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < ADMISSION_BREAKER_OPEN_SEC:
+                return False
+            self._set(self.HALF_OPEN)
+        if cls != CRITICAL or self.trial_in_flight:
+            return False
+        self.trial_in_flight = True
+        return True
+
+    def record(self, failed: bool, trial: bool, used_db: bool = True) -> None:
+        now = time.monotonic()
+        if trial:
+            self.trial_in_flight = False
+            if failed:
+                self._open(now)
+            elif not used_db:
+                # ответ без SQL (401, 404 до запроса к БД) ничего не говорит о БД —
+                # остаёмся полуоткрытыми до следующего пробного запроса
+                return
+            else:
+                self.outcomes.clear()
+                self._set(self.CLOSED)
+            return
+        if self.state != self.CLOSED:
+            return
+        self.outcomes.append((now, failed))
+        while (
+            self.outcomes and now - self.outcomes[0][0] > ADMISSION_BREAKER_WINDOW_SEC
+        ):
+            self.outcomes.popleft()
+        n = len(self.outcomes)
+        if n >= ADMISSION_BREAKER_MIN_REQUESTS:
+            failures = sum(1 for _, f in self.outcomes if f)
+            if failures / n >= ADMISSION_BREAKER_FAILURE_RATIO:
+                self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.opened_at = now
+        self.outcomes.clear()
+        self._set(self.OPEN)
+
+
+breaker = Breaker()
+
+
+# ----------------- Middleware -----------------
+async def _reject(send, retry_after: int, detail: str) -> None:
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """Снаружи сессий и роутинга: решение по пути, до захвата потока threadpool."""
+
+    def __init__(self, app):
+        self.app = app
+        self.in_flight = {cls: 0 for cls in LIMITS}
+
+    async def __call__(self, scope, receive, send):
+        if not ADMISSION_ENABLED or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        cls = classify(scope["method"], scope["path"])
+        if cls is None:
+            return await self.app(scope, receive, send)
+
+        if not breaker.allow(cls):
+            REJECTED.inc((cls, "breaker"))
+            return await _reject(
+                send, breaker.retry_after(), "База данных недоступна, повторите позже"
+            )
+        trial = breaker.state == Breaker.HALF_OPEN
+        if self.in_flight[cls] >= LIMITS[cls]:
+            if trial:
+                breaker.trial_in_flight = False
+            REJECTED.inc((cls, "limit"))
+            return await _reject(send, 1, "Сервер перегружен, повторите позже")
+
+        self.in_flight[cls] += 1
+        IN_FLIGHT.set((cls,), self.in_flight[cls])
+        failed = False
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except DB_FAILURES:
+            failed = True
+            raise
+        finally:
+            self.in_flight[cls] -= 1
+            IN_FLIGHT.set((cls,), self.in_flight[cls])
+            # обработчики перехватывают SQLAlchemyError и отвечают 500 — ответ 5xx
+            # считается неудачей так же, как ошибка БД, вылетевшая из обработчика
+            if status >= 500:
+                failed = True
+            st = metrics.current.get()
+            if st is not None and st.db_time * 1000 > ADMISSION_DB_SLOW_MS:
+                failed = True
+            breaker.record(failed, trial, st is None or st.db_queries > 0)
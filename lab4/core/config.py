@@ -13,3 +13,96 @@ DB_NAME = os.getenv("DB_NAME", "webapp_db")
 DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 SESSION_SECRET = os.getenv("SESSION_SECRET")
+
+# Аналитика каталога: снапшот catalog.cars в памяти (NumPy)
+ANALYTICS_REFRESH_SEC = float(os.getenv("ANALYTICS_REFRESH_SEC", "5"))
+ANALYTICS_FULL_RELOAD_SEC = float(os.getenv("ANALYTICS_FULL_RELOAD_SEC", "600"))
+
+# RBAC: LRU-кеш эффективных ролей пользователей (записей на воркер)
+RBAC_CACHE_SIZE = int(os.getenv("RBAC_CACHE_SIZE", "10000"))
+
+# Метрики Prometheus: общий каталог снимков воркеров (пусто — один процесс)
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_SEC = float(os.getenv("METRICS_FLUSH_SEC", "5"))
+
+# Журнал медленных запросов
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_EXPLAIN_SAMPLE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE", "0"))  # 0..1
+SLOW_QUERY_BUFFER = int(os.getenv("SLOW_QUERY_BUFFER", "100"))
+
+# Server-Timing: дублировать фазы запроса в лог "timing"
+SERVER_TIMING_LOG = os.getenv("SERVER_TIMING_LOG", "FALSE").lower() == "true"
+
+# Прод-запуск (run.py --prod / gunicorn_conf.py)
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "0"))  # 0 — по числу доступных CPU
+WEB_MAX_REQUESTS = int(os.getenv("WEB_MAX_REQUESTS", "10000"))  # 0 — без перезапуска
+WEB_MAX_REQUESTS_JITTER = int(os.getenv("WEB_MAX_REQUESTS_JITTER", "1000"))
+WEB_GRACEFUL_TIMEOUT = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+# SO_REUSEPORT: свой сокет у каждого воркера, балансирует ядро; очередь соединений
+# воркера теряется при его перезапуске, поэтому по умолчанию выключено
+WEB_REUSE_PORT = os.getenv("WEB_REUSE_PORT", "FALSE").lower() == "true"
+
+# Бюджет соединений с Postgres на все воркеры (0 — пул SQLAlchemy по умолчанию)
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "0"))
+
+# Прогрев воркера и /readyz
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))  # не больше pool_size
+READY_PROBE_TTL_SEC = float(os.getenv("READY_PROBE_TTL_SEC", "2"))
+
+# Контроль допуска к БД (core/admission.py): лимиты одновременных запросов по классам
+# (сумма — меньше threadpool anyio, 40) и автомат на ошибки/медленную БД
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "TRUE").lower() == "true"
+ADMISSION_LIMIT_CRITICAL = int(os.getenv("ADMISSION_LIMIT_CRITICAL", "16"))
+ADMISSION_LIMIT_NORMAL = int(os.getenv("ADMISSION_LIMIT_NORMAL", "12"))
+ADMISSION_LIMIT_LOW = int(os.getenv("ADMISSION_LIMIT_LOW", "4"))
+ADMISSION_DB_SLOW_MS = float(os.getenv("ADMISSION_DB_SLOW_MS", "2000"))
+ADMISSION_BREAKER_WINDOW_SEC = float(os.getenv("ADMISSION_BREAKER_WINDOW_SEC", "10"))
+ADMISSION_BREAKER_MIN_REQUESTS = int(os.getenv("ADMISSION_BREAKER_MIN_REQUESTS", "10"))
+ADMISSION_BREAKER_FAILURE_RATIO = float(
+    os.getenv("ADMISSION_BREAKER_FAILURE_RATIO", "0.5")
+)
+ADMISSION_BREAKER_OPEN_SEC = float(os.getenv("ADMISSION_BREAKER_OPEN_SEC", "5"))
+
+# Фоновый планировщик (core/scheduler.py): потоки для задач — отдельно от threadpool запросов
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "TRUE").lower() == "true"
+SCHEDULER_THREADS = int(os.getenv("SCHEDULER_THREADS", "2"))
+VISIT_ROLLUP_BATCH = int(os.getenv("VISIT_ROLLUP_BATCH", "50000"))
+
+# Очистка удалённых пользователей (задача user_purge): строк в пачке, пауза между
+# пачками и время одного запуска (незаконченное продолжит следующий)
+USER_PURGE_BATCH = int(os.getenv("USER_PURGE_BATCH", "5000"))
+USER_PURGE_PAUSE_MS = float(os.getenv("USER_PURGE_PAUSE_MS", "50"))
+USER_PURGE_BUDGET_SEC = float(os.getenv("USER_PURGE_BUDGET_SEC", "25"))
+
+# Аналитика посещений (/api/visits/analytics/*): кеш результатов и пределы окон
+VISIT_ANALYTICS_TTL_SEC = float(os.getenv("VISIT_ANALYTICS_TTL_SEC", "30"))
+VISIT_ANALYTICS_TTL_PAST_SEC = float(os.getenv("VISIT_ANALYTICS_TTL_PAST_SEC", "600"))
+VISIT_ANALYTICS_CACHE_SIZE = int(os.getenv("VISIT_ANALYTICS_CACHE_SIZE", "1000"))
+VISIT_ANALYTICS_MAX_DAYS = int(os.getenv("VISIT_ANALYTICS_MAX_DAYS", "366"))
+VISIT_ANALYTICS_HOURLY_MAX_DAYS = int(os.getenv("VISIT_ANALYTICS_HOURLY_MAX_DAYS", "7"))
+
+# Вероятностные счётчики посещений (utils/visit_sketches.py): сброс приращений в БД
+VISIT_SKETCH_FLUSH_SEC = float(os.getenv("VISIT_SKETCH_FLUSH_SEC", "10"))
+
+# Bloom-фильтр логинов/email (utils/user_bloom.py): доля ложных «возможно занято»,
+# минимальная ёмкость (ключей) и пересборка в каждом воркере
+USER_BLOOM_FP_RATE = float(os.getenv("USER_BLOOM_FP_RATE", "0.001"))
+USER_BLOOM_MIN_CAPACITY = int(os.getenv("USER_BLOOM_MIN_CAPACITY", "100000"))
+USER_BLOOM_REBUILD_SEC = float(os.getenv("USER_BLOOM_REBUILD_SEC", "600"))
+
+# Поток приращений посещений для SSE (utils/visit_feed.py)
+VISIT_FEED_INTERVAL_SEC = float(os.getenv("VISIT_FEED_INTERVAL_SEC", "1"))
+VISIT_FEED_RESYNC_SEC = float(os.getenv("VISIT_FEED_RESYNC_SEC", "60"))
+
+# Отмена SQL при обрыве соединения клиентом (core/disconnect.py)
+CANCEL_ON_DISCONNECT = os.getenv("CANCEL_ON_DISCONNECT", "TRUE").lower() == "true"
+
+# Структурированный JSON-лог (core/jsonlog.py): уровень корневого логгера, очередь до
+# потока записи (переполнение — запись отбрасывается) и журнал запросов "access":
+# доли для частых маршрутов ("шаблон=доля" через запятую); 5xx и запросы дольше
+# LOG_SLOW_MS пишутся всегда
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_ACCESS = os.getenv("LOG_ACCESS", "TRUE").lower() == "true"
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "/api/visit=0.01")
+LOG_SLOW_MS = float(os.getenv("LOG_SLOW_MS", "500"))
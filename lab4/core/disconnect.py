@@ -0,0 +1,193 @@
+# core/disconnect.py
+"""
+Отмена работы в БД, когда клиент ушёл, не дождавшись ответа.
+
+Поиск в users_menu.html отправляет запрос на каждую паузу ввода, и браузер
+обрывает предыдущий (AbortController). Без этого COUNT и LIKE брошенного
+запроса доработали бы в Postgres до конца, занимая соединение пула и поток.
+
+Для маршрутов из CANCEL_ROUTES:
+- DisconnectMiddleware читает receive() сам (сообщения передаются приложению
+  через очередь) и замечает http.disconnect, пока обработчик ещё работает;
+- события before/after_cursor_execute отмечают в Watch запроса текущее
+  DBAPI-соединение (контекст виден и в потоке threadpool);
+- при обрыве выполняющийся запрос отменяется протоколом отмены Postgres
+  (psycopg Connection.cancel_safe) в отдельном потоке — не в threadpool и не в
+  event loop; следующий SQL этого запроса не выполняется (ClientDisconnected);
+- ошибка обработчика после обрыва глотается: соединение откатывается и уходит
+  в пул обычным путём (with engine.connect()), ответ — 499 (его никто не
+  прочитает), контроль допуска не считает это отказом БД.
+
+Метрика: db_cancelled_total{route,stage}; stage=running — отменён выполнявшийся
+SQL, stage=pending — SQL после обрыва не начат.
+"""
+
+from __future__ import annotations
+import asyncio
+import contextvars
+import json
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from sqlalchemy import event
+
+from core import metrics
+from core.config import CANCEL_ON_DISCONNECT
+
+log = logging.getLogger("disconnect")
+
+# (метод, шаблон пути) — чтение, которое дорого доделывать впустую
+CANCEL_ROUTES = [
+    ("GET", r"/api/users/list"),
+    ("GET", r"/api/cars/search"),
+    ("GET", r"/api/stats"),
+    ("GET", r"/api/visits/analytics/.*"),
+    ("GET", r"/api/search"),
+]
+_ROUTES = [(m, re.compile(p + r"\Z")) for m, p in CANCEL_ROUTES]
+
+CANCELLED = metrics.counter(
+    "db_cancelled_total",
+    "SQL, отменённые из-за обрыва соединения клиентом",
+    ("route", "stage"),
+)
+
+# cancel_safe открывает отдельное соединение к серверу и ждёт ответа — не в event loop
+_cancel_pool = ThreadPoolExecutor(2, thread_name_prefix="db-cancel")
+
+
+class ClientDisconnected(Exception):
+    """Клиент отключился — дальнейшие SQL этого запроса не выполняются."""
+
+
+class Watch:
+    """Состояние одного запроса: соединение с выполняющимся SQL и флаг обрыва."""
+
+    __slots__ = ("scope", "lock", "dbapi_conn", "disconnected")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.lock = threading.Lock()
+        self.dbapi_conn = None
+        self.disconnected = False
+
+
+current: contextvars.ContextVar[Optional[Watch]] = contextvars.ContextVar(
+    "disconnect_watch", default=None
+)
+
+
+def disconnected() -> bool:
+    """
+    Клиент текущего запроса ушёл. Обработчик, превращающий ошибки БД в 500,
+    пробрасывает их как есть: отменённый SQL должен дойти до DisconnectMiddleware (499).
+    """
+    w = current.get()
+    return w is not None and w.disconnected
+
+
+def watched(method: str, path: str) -> bool:
+    return any(m == method and rx.match(path) for m, rx in _ROUTES)
+
+
+# ----------------- События engine -----------------
+def _before_cursor_execute(conn, cursor, statement, params, context, executemany):
+    w = current.get()
+    if w is None:
+        return
+    with w.lock:
+        if w.disconnected:
+            CANCELLED.inc((metrics.route_of(w.scope), "pending"))
+            raise ClientDisconnected()
+        w.dbapi_conn = conn.connection.dbapi_connection
+
+
+def _clear(*args) -> None:
+    w = current.get()
+    if w is None:
+        return
+    # ждёт, пока идёт отмена: соединение не вернётся в пул с «летящим» cancel
+    with w.lock:
+        w.dbapi_conn = None
+
+
+def instrument_engine(engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _clear)
+    event.listen(engine, "handle_error", _clear)
+
+
+def _cancel(w: Watch) -> None:
+    with w.lock:
+        if w.dbapi_conn is None:  # SQL успел завершиться
+            return
+        try:
+            w.dbapi_conn.cancel_safe(timeout=5)
+            CANCELLED.inc((metrics.route_of(w.scope), "running"))
+        except Exception:
+            log.exception("cancel failed")
+
+
+# ----------------- Middleware -----------------
+class DisconnectMiddleware:
+    """Внутри контроля допуска: отменённый запрос не считается отказом БД."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not CANCEL_ON_DISCONNECT
+            or scope["type"] != "http"
+            or not watched(scope["method"], scope["path"])
+        ):
+            return await self.app(scope, receive, send)
+
+        w = Watch(scope)
+        token = current.set(w)
+        messages: asyncio.Queue = asyncio.Queue()
+        responded = False
+
+        async def watch_receive():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    if not responded:
+                        w.disconnected = True
+                        asyncio.get_running_loop().run_in_executor(
+                            _cancel_pool, _cancel, w
+                        )
+                    return
+
+        async def app_receive():
+            return await messages.get()
+
+        async def send_wrapper(message):
+            nonlocal responded
+            if message["type"] == "http.response.start":
+                responded = True
+            await send(message)
+
+        watcher = asyncio.create_task(watch_receive())
+        try:
+            await self.app(scope, app_receive, send_wrapper)
+        except Exception:
+            if not w.disconnected:
+                raise
+            if not responded:
+                body = json.dumps({"detail": "Клиент отключился"}).encode("utf-8")
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": 499,
+                        "headers": [(b"content-type", b"application/json")],
+                    }
+                )
+                await send({"type": "http.response.body", "body": body})
+        finally:
+            watcher.cancel()
+            current.reset(token)
@@ -0,0 +1,354 @@
+# core/jobs.py
+"""
+Периодические задачи приложения (регистрируются в lifespan, см. core/scheduler.py).
+
+  visit_rollup        — посещения -> auth.user_visits_daily и auth.page_visits_daily
+                        (инкрементально), один на всех;
+  analyze_hot_tables  — ANALYZE часто меняющихся таблиц, один на всех;
+  user_purge          — очистка мягко удалённых пользователей пачками, один на всех;
+  visit_sketches      — сброс приращений HLL/Count-Min посещений в БД, в каждом воркере;
+  catalog_snapshot    — фоновое обновление снапшота аналитики каталога, в каждом воркере;
+  role_registry       — страховочная перезагрузка реестра ролей, в каждом воркере;
+  user_bloom          — пересборка Bloom-фильтра логинов/email, в каждом воркере.
+"""
+
+from __future__ import annotations
+import logging
+import time
+
+from sqlalchemy import text
+
+from core import metrics, scheduler
+from core.config import (
+    ANALYTICS_REFRESH_SEC,
+    USER_BLOOM_REBUILD_SEC,
+    USER_PURGE_BATCH,
+    USER_PURGE_BUDGET_SEC,
+    USER_PURGE_PAUSE_MS,
+    VISIT_ROLLUP_BATCH,
+    VISIT_SKETCH_FLUSH_SEC,
+)
+from db.database import engine
+
+log = logging.getLogger("jobs")
+
+HOT_TABLES = ("auth.users", "auth.user_visits", "auth.user_roles", "catalog.cars")
+
+# дневные итоги пользователей и страниц одной командой по визитам из {where};
+# новая строка user_visits_daily (xmax = 0 — вставлена, а не обновлена) —
+# новый посетитель страницы за день
+_FOLD_SQL = """
+    WITH src AS (
+        SELECT (visited_at AT TIME ZONE 'UTC')::date AS day, user_id, page_name,
+               count(*) AS cnt
+        FROM auth.user_visits
+        WHERE {where}
+        GROUP BY 1, 2, 3
+    ),
+    ins AS (
+        INSERT INTO auth.user_visits_daily (day, user_id, page_name, cnt)
+        SELECT day, user_id, page_name, cnt FROM src
+        ON CONFLICT (day, user_id, page_name)
+        DO UPDATE SET cnt = auth.user_visits_daily.cnt + EXCLUDED.cnt
+        RETURNING day, page_name, (xmax = 0) AS is_new
+    )
+    INSERT INTO auth.page_visits_daily (day, page_name, visits, visitors)
+    SELECT s.day, s.page_name, s.visits, coalesce(i.visitors, 0)
+    FROM (
+        SELECT day, page_name, sum(cnt) AS visits FROM src GROUP BY 1, 2
+    ) s
+    LEFT JOIN (
+        SELECT day, page_name, count(*) FILTER (WHERE is_new) AS visitors
+        FROM ins GROUP BY 1, 2
+    ) i USING (day, page_name)
+    ON CONFLICT (page_name, day) DO UPDATE
+    SET visits = auth.page_visits_daily.visits + EXCLUDED.visits,
+        visitors = auth.page_visits_daily.visitors + EXCLUDED.visitors
+"""
+
+
+def visit_rollup() -> None:
+    """
+    Свернуть новые посещения пачками по VISIT_ROLLUP_BATCH, сдвигая отметку.
+
+    visit_id выдаётся до COMMIT — отметка по нему пропустила бы визит, ставший
+    видимым позже. Поэтому отметка — xid вставившей транзакции (ins_xid, миграция 008),
+    а сворачиваются только xid < pg_snapshot_xmin: все такие транзакции завершены,
+    и строк с ними больше не появится. Долгая транзакция держит горизонт — хвост
+    растёт, но ничего не теряется. Строки до миграции (ins_xid IS NULL, все
+    зафиксированы) дочитываются по старой отметке last_visit_id.
+    """
+    while True:
+        with engine.begin() as conn:
+            # горизонт — до FOR UPDATE: своя транзакция получит xid и опустила бы его
+            horizon = conn.execute(
+                text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text")
+            ).scalar_one()
+            last, last_xid = conn.execute(
+                text(
+                    "SELECT last_visit_id, last_xid::text FROM auth.visit_rollup_state "
+                    "WHERE id = 1 FOR UPDATE"
+                )
+            ).one()
+            upto = conn.execute(
+                text(
+                    """
+                SELECT max(visit_id) FROM (
+                    SELECT visit_id FROM auth.user_visits
+                    WHERE visit_id > :last AND ins_xid IS NULL
+                    ORDER BY visit_id
+                    LIMIT :batch
+                ) s
+            """
+                ),
+                {"last": last, "batch": VISIT_ROLLUP_BATCH},
+            ).scalar_one()
+            if upto is not None:
+                conn.execute(
+                    text(
+                        _FOLD_SQL.format(
+                            where="ins_xid IS NULL AND visit_id > :last AND visit_id <= :upto"
+                        )
+                    ),
+                    {"last": last, "upto": upto},
+                )
+                conn.execute(
+                    text(
+                        "UPDATE auth.visit_rollup_state SET last_visit_id = :upto WHERE id = 1"
+                    ),
+                    {"upto": upto},
+                )
+                continue
+            upto_xid = conn.execute(
+                text(
+                    """
+                SELECT max(ins_xid)::text FROM (
+                    SELECT ins_xid FROM auth.user_visits
+                    WHERE ins_xid > CAST(:last_xid AS xid8)
+                      AND ins_xid < CAST(:horizon AS xid8)
+                    ORDER BY ins_xid
+                    LIMIT :batch
+                ) s
+            """
+                ),
+                {"last_xid": last_xid, "horizon": horizon, "batch": VISIT_ROLLUP_BATCH},
+            ).scalar_one()
+            if upto_xid is None:
+                # старых строк выше last_visit_id нет — подтянуть отметку к концу
+                # таблицы, чтобы условие хвоста по ней проходило пару строк индекса
+                conn.execute(
+                    text(
+                        """
+                    UPDATE auth.visit_rollup_state
+                    SET last_visit_id = greatest(
+                        last_visit_id, (SELECT max(visit_id) FROM auth.user_visits))
+                    WHERE id = 1
+                """
+                    )
+                )
+                return
+            # пачка — все строки транзакций до upto_xid включительно (одна транзакция
+            # может вставить больше VISIT_ROLLUP_BATCH строк)
+            conn.execute(
+                text(
+                    _FOLD_SQL.format(
+                        where="ins_xid > CAST(:last_xid AS xid8)"
+                        " AND ins_xid <= CAST(:upto_xid AS xid8)"
+                    )
+                ),
+                {"last_xid": last_xid, "upto_xid": upto_xid},
+            )
+            conn.execute(
+                text(
+                    "UPDATE auth.visit_rollup_state SET last_xid = CAST(:upto_xid AS xid8) "
+                    "WHERE id = 1"
+                ),
+                {"upto_xid": upto_xid},
+            )
+
+
+def analyze_hot_tables() -> None:
+    # ANALYZE нельзя внутри транзакционного блока — autocommit
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in HOT_TABLES:
+            conn.execute(text(f"ANALYZE {table}"))
+
+
+# ----------------- Очистка удалённых пользователей -----------------
+# DELETE /api/users/{id} только ставит deleted_at (пользователь сразу скрыт и без ролей).
+# Здесь зависимые строки удаляются пачками по USER_PURGE_BATCH — каждая пачка
+# в своей короткой транзакции, с паузой между пачками (блокировки и WAL порциями,
+# а не одним каскадом), строка auth.users — последней. Ход — в auth.user_purges.
+PURGED_ROWS = metrics.counter(
+    "user_purge_rows_total",
+    "Строки, удалённые фоновой очисткой пользователей, по этапам",
+    ("stage",),
+)
+
+# (этап, счётчик в auth.user_purges, команда одной пачки не больше :batch строк)
+PURGE_STEPS = (
+    (
+        "visits",
+        "visits_deleted",
+        "DELETE FROM auth.user_visits WHERE visit_id IN ("
+        "SELECT visit_id FROM auth.user_visits WHERE user_id = :uid LIMIT :batch)",
+    ),
+    (
+        "daily",
+        "daily_deleted",
+        "DELETE FROM auth.user_visits_daily WHERE (day, user_id, page_name) IN ("
+        "SELECT day, user_id, page_name FROM auth.user_visits_daily "
+        "WHERE user_id = :uid LIMIT :batch)",
+    ),
+    (
+        "grants",  # роли, выданные этим пользователем другим, остаются — без «кем выдана»
+        "grants_cleared",
+        "UPDATE auth.user_roles SET granted_by = NULL WHERE (user_id, role_id) IN ("
+        "SELECT user_id, role_id FROM auth.user_roles WHERE granted_by = :uid LIMIT :batch)",
+    ),
+    (
+        "roles",
+        "roles_deleted",
+        "DELETE FROM auth.user_roles WHERE (user_id, role_id) IN ("
+        "SELECT user_id, role_id FROM auth.user_roles WHERE user_id = :uid LIMIT :batch)",
+    ),
+)
+_STAGES = [stage for stage, _, _ in PURGE_STEPS]
+
+
+def _purge_batch(uid: int, stage: str, counter: str, sql: str) -> int:
+    # пачка и учёт хода — одна команда: счётчик не расходится с удалённым
+    with engine.begin() as conn:
+        return conn.execute(
+            text(
+                f"""
+            WITH b AS ({sql} RETURNING 1)
+            UPDATE auth.user_purges
+            SET {counter} = {counter} + (SELECT count(*) FROM b),
+                batches = batches + 1, stage = :stage
+            WHERE user_id = :uid
+            RETURNING (SELECT count(*) FROM b)
+        """
+            ),
+            {"uid": uid, "stage": stage, "batch": USER_PURGE_BATCH},
+        ).scalar_one()
+
+
+def _purge_user(uid: int, login: str, deleted_at, deadline: float) -> bool:
+    """Очистить одного пользователя; False — время запуска вышло (продолжит следующий)."""
+    with engine.begin() as conn:
+        stage = conn.execute(
+            text(
+                """
+            INSERT INTO auth.user_purges (user_id, login, deleted_at)
+            VALUES (:uid, :login, :deleted_at)
+            ON CONFLICT (user_id) DO UPDATE SET login = EXCLUDED.login
+            RETURNING stage
+        """
+            ),
+            {"uid": uid, "login": login, "deleted_at": deleted_at},
+        ).scalar_one()
+
+    for step in PURGE_STEPS[_STAGES.index(stage) :]:
+        while True:
+            if time.monotonic() >= deadline:
+                return False
+            n = _purge_batch(uid, *step)
+            PURGED_ROWS.inc((step[0],), n)
+            if n < USER_PURGE_BATCH:
+                break
+            time.sleep(USER_PURGE_PAUSE_MS / 1000)
+
+    # строки, добавленные за время очистки, удалит каскад — их единицы
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "DELETE FROM auth.users WHERE user_id = :uid AND deleted_at IS NOT NULL"
+            ),
+            {"uid": uid},
+        )
+        conn.execute(
+            text(
+                "UPDATE auth.user_purges SET stage = 'done', finished_at = now() "
+                "WHERE user_id = :uid"
+            ),
+            {"uid": uid},
+        )
+    log.info("user %s (%s) purged", uid, login)
+    return True
+
+
+def purge_deleted_users() -> None:
+    """Очистить помеченных пользователей (старые первыми) за USER_PURGE_BUDGET_SEC."""
+    deadline = time.monotonic() + USER_PURGE_BUDGET_SEC
+    with engine.connect() as conn:
+        pending = conn.execute(
+            text(
+                "SELECT user_id, login, deleted_at FROM auth.users "
+                "WHERE deleted_at IS NOT NULL ORDER BY deleted_at LIMIT 100"
+            )
+        ).all()
+    for uid, login, deleted_at in pending:
+        if not _purge_user(uid, login, deleted_at, deadline):
+            return
+
+
+def refresh_catalog_snapshot() -> None:
+    from utils.catalog_snapshot import get_snapshot
+
+    get_snapshot()  # обновит, только если снапшот устарел
+
+
+def flush_visit_sketches() -> None:
+    from utils import visit_sketches
+
+    visit_sketches.flush()
+
+
+def reload_role_registry() -> None:
+    from utils import role_registry
+
+    role_registry.reload()
+
+
+def rebuild_user_bloom() -> None:
+    from utils import user_bloom
+
+    user_bloom.rebuild()
+
+
+def register() -> None:
+    scheduler.add("visit_rollup", visit_rollup, scheduler.every(60), jitter=5)
+    scheduler.add(
+        "analyze_hot_tables",
+        analyze_hot_tables,
+        scheduler.cron("*/30 * * * *"),
+        jitter=30,
+    )
+    scheduler.add("user_purge", purge_deleted_users, scheduler.every(30), jitter=5)
+    scheduler.add(
+        "visit_sketches",
+        flush_visit_sketches,
+        scheduler.every(VISIT_SKETCH_FLUSH_SEC),
+        single=False,
+    )
+    scheduler.add(
+        "catalog_snapshot",
+        refresh_catalog_snapshot,
+        scheduler.every(max(ANALYTICS_REFRESH_SEC / 2, 1)),
+        single=False,
+    )
+    scheduler.add(
+        "role_registry",
+        reload_role_registry,
+        scheduler.every(300),
+        jitter=30,
+        single=False,
+    )
+    scheduler.add(
+        "user_bloom",
+        rebuild_user_bloom,
+        scheduler.every(USER_BLOOM_REBUILD_SEC),
+        jitter=60,
+        single=False,
+    )
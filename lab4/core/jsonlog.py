@@ -0,0 +1,233 @@
+# core/jsonlog.py
+"""
+Структурированный лог: одна JSON-строка на запись, запись — через очередь.
+
+- setup() вешает на корневой логгер QueueHandler: вызывающий поток (обработчик
+  запроса, event loop) только кладёт запись в ограниченную очередь; JSON и запись
+  в поток вывода делает поток QueueListener. Очередь полна — запись отбрасывается
+  (счётчик dropped()), запрос не ждёт ввода-вывода. После fork (воркеры gunicorn
+  при preload_app) поток-слушатель запускается в дочернем процессе заново.
+- Поля записи: ts, level, logger, msg, поля из extra=..., request_id текущего
+  запроса (контекст виден и в потоке threadpool — попадает и в slow_query,
+  scheduler и т. п.), exc — трассировка исключения.
+- RequestLogMiddleware — ASGI-middleware журнала запросов (logger "access"):
+  request_id (из X-Request-ID клиента или новый; возвращается в ответе), method,
+  path, route (шаблон маршрута), status, latency_ms, user_id из сессии и поля
+  extra(scope). Для маршрутов из sample пишется доля rate запросов (поле sample —
+  чтобы восстанавливать полные счёты); ошибки 5xx и запросы дольше slow_ms пишутся всегда.
+
+Только стандартная библиотека: модуль используют и lab4, и lab2/server.py.
+"""
+
+from __future__ import annotations
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "request_id", default=None
+)
+
+access_log = logging.getLogger("access")
+
+# атрибуты LogRecord, которые не считаются полями extra
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+_REQUEST_ID = re.compile(r"[A-Za-z0-9._-]{1,64}\Z")
+
+_handler: Optional["_QueueHandler"] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_lock = threading.Lock()
+
+
+# ----------------- Формат и очередь -----------------
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for k, v in record.__dict__.items():
+            if k not in _RESERVED and v is not None:
+                out[k] = v
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    В очередь — копия записи с готовым msg и текстом исключения, без JSON:
+    форматирование — в потоке-слушателе. Полная очередь — запись отбрасывается.
+    """
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if getattr(record, "request_id", None) is None:
+            record.request_id = request_id.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _start_listener() -> None:
+    global _listener
+    out = logging.StreamHandler(sys.stderr)
+    out.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(_handler.queue, out)
+    _listener.start()
+
+
+def setup(level: str = "INFO", queue_size: int = 10000) -> None:
+    """Корневой логгер -> очередь -> JSON в stderr. Повторный вызов ничего не делает."""
+    global _handler
+    with _lock:
+        if _handler is not None:
+            return
+        _handler = _QueueHandler(queue.Queue(queue_size))
+        root = logging.getLogger()
+        root.addHandler(_handler)
+        root.setLevel(level)
+        _start_listener()
+        os.register_at_fork(after_in_child=_after_fork)
+
+
+def _after_fork() -> None:
+    # поток не переживает fork; копия очереди — записи родителя (их пишет он сам),
+    # и её блокировку мог держать его слушатель: у дочернего процесса — новая очередь
+    _handler.queue = queue.Queue(_handler.queue.maxsize)
+    _start_listener()
+
+
+def shutdown() -> None:
+    """Дописать очередь и остановить поток-слушатель."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped() -> int:
+    return _handler.dropped if _handler is not None else 0
+
+
+def parse_sample(spec: str) -> dict[str, float]:
+    """'/api/visit=0.01,/api/stats=0.1' -> {шаблон маршрута: доля}."""
+    out = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        route, _, rate = part.partition("=")
+        out[route.strip()] = float(rate)
+    return out
+
+
+# ----------------- Журнал запросов -----------------
+def _route(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    return "<static>" if scope.get("path", "").startswith("/static") else "<other>"
+
+
+class RequestLogMiddleware:
+    """ASGI-middleware: request_id на время запроса и запись в logger "access"."""
+
+    def __init__(
+        self,
+        app,
+        sample: Optional[dict[str, float]] = None,
+        slow_ms: float = 500,
+        extra: Optional[Callable[[dict], dict]] = None,
+    ):
+        self.app = app
+        self.sample = sample or {}
+        self.slow_ms = slow_ms
+        self.extra = extra
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        t0 = time.perf_counter()
+        rid = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                rid = value.decode("latin-1")
+                break
+        if rid is None or not _REQUEST_ID.match(rid):
+            rid = os.urandom(8).hex()
+        token = request_id.set(rid)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [
+                    *message.get("headers", ()),
+                    (b"x-request-id", rid.encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id.reset(token)
+            self._log(scope, rid, status, (time.perf_counter() - t0) * 1000)
+
+    def _log(self, scope, rid: str, status: int, ms: float) -> None:
+        if not access_log.isEnabledFor(logging.INFO):
+            return
+        route = _route(scope)
+        rate = self.sample.get(route)
+        if (
+            rate is not None
+            and status < 500
+            and ms < self.slow_ms
+            and random.random() >= rate
+        ):
+            return
+        session = scope.get("session") or {}
+        fields = {
+            "request_id": rid,
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": route,
+            "status": status,
+            "latency_ms": round(ms, 3),
+            "user_id": session.get("user_id"),
+        }
+        if rate is not None:
+            fields["sample"] = rate
+        if self.extra is not None:
+            fields.update(self.extra(scope))
+        access_log.info(
+            "%s %s %s %.1fms", scope["method"], scope["path"], status, ms, extra=fields
+        )
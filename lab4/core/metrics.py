@@ -0,0 +1,380 @@
+# core/metrics.py
+"""
+Метрики приложения в формате Prometheus (text exposition 0.0.4).
+
+Что собирается:
+- http_request_duration_seconds{method,route,status} — гистограмма латентности
+  по шаблону маршрута ("/api/users/{user_id}", а не конкретный URL);
+- http_request_db_queries{route} / http_request_db_seconds{route} — число SQL
+  и время в БД на запрос (события before/after_cursor_execute на engine);
+- счётчики/гейджи других модулей (counter()/gauge()).
+
+Запись — это bisect + пара сложений под локом (~1 мкс на запрос).
+
+Несколько воркеров uvicorn: если задан METRICS_DIR, каждый воркер раз в
+METRICS_FLUSH_SEC сбрасывает свой снимок в METRICS_DIR/<pid>.json, а /metrics
+на любом воркере суммирует все файлы (гейджи с merge="max" — берёт наибольшее).
+Без METRICS_DIR — только свой процесс.
+
+Подключение (main.py):
+  metrics.instrument_engine(engine)
+  app.add_middleware(metrics.MetricsMiddleware)
+"""
+
+from __future__ import annotations
+import contextvars
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Optional
+
+from sqlalchemy import event
+
+from core.config import METRICS_DIR, METRICS_FLUSH_SEC
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+DB_QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50)
+
+_lock = threading.Lock()
+
+
+class Histogram:
+    """Серии: labels(tuple) -> [счётчики по корзинам..., +Inf, сумма]."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple, buckets: tuple):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.buckets = buckets
+        self.series: dict = {}
+
+    def observe(self, labels: tuple, value: float) -> None:
+        with _lock:
+            s = self.series.get(labels)
+            if s is None:
+                s = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            s[bisect_left(self.buckets, value)] += 1
+            s[-1] += value
+
+    def render(self, series: dict) -> list[str]:
+        out = []
+        for labels, s in sorted(series.items()):
+            base = _labels(self.labelnames, labels)
+            acc = 0
+            for le, n in zip(self.buckets + ("+Inf",), s[:-1]):
+                acc += n
+                out.append(f"{self.name}_bucket{_labels_le(base, le)} {acc}")
+            out.append(f"{self.name}_sum{_braces(base)} {s[-1]}")
+            out.append(f"{self.name}_count{_braces(base)} {acc}")
+        return out
+
+
+class Counter:
+    """Серии: labels(tuple) -> [значение]."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.series: dict = {}
+
+    def inc(self, labels: tuple = (), value: float = 1) -> None:
+        with _lock:
+            s = self.series.get(labels)
+            if s is None:
+                s = self.series[labels] = [0]
+            s[0] += value
+
+    def render(self, series: dict) -> list[str]:
+        return [
+            f"{self.name}{_braces(_labels(self.labelnames, labels))} {s[0]}"
+            for labels, s in sorted(series.items())
+        ]
+
+
+class Gauge(Counter):
+    """
+    Текущее значение. Снимки воркеров сводятся по merge: "sum" — сумма (запросы
+    в обработке на всех воркерах), "max" — наибольшее (состояние, флаг).
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: tuple, merge: str = "sum"):
+        super().__init__(name, help, labelnames)
+        if merge not in ("sum", "max"):
+            raise ValueError(f"gauge {name}: merge must be sum or max, got {merge!r}")
+        self.merge = merge
+
+    def set(self, labels: tuple, value: float) -> None:
+        with _lock:
+            self.series[labels] = [value]
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+
+def _braces(s: str) -> str:
+    return "{" + s + "}" if s else ""
+
+
+def _labels_le(base: str, le) -> str:
+    le_s = f'le="{le}"'
+    return "{" + (base + "," + le_s if base else le_s) + "}"
+
+
+# ----------------- Реестр -----------------
+_registry: dict[str, object] = {}
+
+
+def histogram(name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+    with _lock:
+        m = _registry.get(name)
+        if m is None:
+            m = _registry[name] = Histogram(name, help, tuple(labelnames), buckets)
+    return m
+
+
+def counter(name: str, help: str, labelnames=()):
+    with _lock:
+        m = _registry.get(name)
+        if m is None:
+            m = _registry[name] = Counter(name, help, tuple(labelnames))
+    return m
+
+
+def gauge(name: str, help: str, labelnames=(), merge: str = "sum"):
+    with _lock:
+        m = _registry.get(name)
+        if m is None:
+            m = _registry[name] = Gauge(name, help, tuple(labelnames), merge)
+    return m
+
+
+HTTP_LATENCY = histogram(
+    "http_request_duration_seconds",
+    "Латентность HTTP-запросов",
+    ("method", "route", "status"),
+)
+DB_QUERIES = histogram(
+    "http_request_db_queries",
+    "Число SQL-запросов на HTTP-запрос",
+    ("route",),
+    DB_QUERIES_BUCKETS,
+)
+DB_TIME = histogram(
+    "http_request_db_seconds",
+    "Время в БД на HTTP-запрос",
+    ("route",),
+    DB_TIME_BUCKETS,
+)
+DB_QUERIES_TOTAL = counter(
+    "db_queries_total", "SQL-запросы (включая фоновые задачи)", ("route",)
+)
+
+
+# ----------------- Запрос: контекст и БД -----------------
+class RequestStats:
+    """Накопитель на время одного HTTP-запроса (виден и в потоке threadpool)."""
+
+    __slots__ = ("scope", "db_queries", "db_time")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.db_queries = 0
+        self.db_time = 0.0
+
+    @property
+    def route(self) -> str:
+        return route_of(self.scope)
+
+
+current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "request_stats", default=None
+)
+
+
+def _before_cursor_execute(conn, cursor, statement, params, context, executemany):
+    context._metrics_t0 = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, params, context, executemany):
+    dt = time.perf_counter() - context._metrics_t0
+    st = current.get()
+    if st is not None:
+        st.db_queries += 1
+        st.db_time += dt
+    DB_QUERIES_TOTAL.inc((st.route if st is not None else "-",))
+
+
+def instrument_engine(engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def request_fields(scope) -> dict:
+    """SQL текущего запроса — поля записи журнала запросов (core/jsonlog.py)."""
+    st = current.get()
+    if st is None or not st.db_queries:
+        return {}
+    return {"db_queries": st.db_queries, "db_ms": round(st.db_time * 1000, 3)}
+
+
+def route_of(scope) -> str:
+    """Шаблон маршрута (после роутинга FastAPI кладёт APIRoute в scope)."""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    return "<static>" if scope.get("path", "").startswith("/static") else "<other>"
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: латентность по маршруту/статусу + время БД на запрос."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        t0 = time.perf_counter()
+        stats = RequestStats(scope)
+        token = current.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current.reset(token)
+            route = route_of(scope)
+            HTTP_LATENCY.observe(
+                (scope["method"], route, str(status)), time.perf_counter() - t0
+            )
+            if stats.db_queries:
+                DB_QUERIES.observe((route,), stats.db_queries)
+                DB_TIME.observe((route,), stats.db_time)
+
+
+# ----------------- Экспорт и воркеры -----------------
+def _snapshot() -> dict:
+    with _lock:
+        return {
+            name: [[list(k), list(v)] for k, v in m.series.items()]
+            for name, m in _registry.items()
+        }
+
+
+def _merge(into: dict, snap: dict) -> None:
+    for name, series in snap.items():
+        dst = into.setdefault(name, {})
+        use_max = getattr(_registry.get(name), "merge", "sum") == "max"
+        for labels, values in series:
+            key = tuple(labels)
+            cur = dst.get(key)
+            if cur is None:
+                dst[key] = list(values)
+            else:
+                for i, v in enumerate(values):
+                    cur[i] = max(cur[i], v) if use_max else cur[i] + v
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def flush() -> None:
+    """Сбросить снимок своего процесса в METRICS_DIR (атомарно через rename)."""
+    if not METRICS_DIR:
+        return
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp, path)
+
+
+def render() -> str:
+    """Текст для /metrics: свой процесс + снимки остальных воркеров."""
+    merged: dict = {}
+    _merge(merged, _snapshot())
+    if METRICS_DIR:
+        me = f"{os.getpid()}.json"
+        for fn in os.listdir(METRICS_DIR):
+            if not fn.endswith(".json") or fn == me:
+                continue
+            path = os.path.join(METRICS_DIR, fn)
+            pid = fn[: -len(".json")]
+            if pid.isdigit() and not _pid_alive(int(pid)):
+                # воркер завершился — его счётчики сбрасываются; файл мог уже
+                # удалить /metrics на другом воркере
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    _merge(merged, json.load(f))
+            except (OSError, ValueError):
+                continue
+
+    lines = []
+    for name, m in _registry.items():
+        lines.append(f"# HELP {name} {m.help}")
+        lines.append(f"# TYPE {name} {m.kind}")
+        lines.extend(m.render(merged.get(name, {})))
+    return "\n".join(lines) + "\n"
+
+
+_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+def _flush_loop() -> None:
+    while not _stop.wait(METRICS_FLUSH_SEC):
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def start() -> None:
+    global _thread
+    if not METRICS_DIR or (_thread is not None and _thread.is_alive()):
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    _stop.clear()
+    _thread = threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True)
+    _thread.start()
+
+
+def stop() -> None:
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+    if METRICS_DIR:
+        try:
+            flush()
+        except OSError:
+            pass
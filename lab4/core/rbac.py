@@ -0,0 +1,135 @@
+# core/rbac.py
+"""
+Авторизация по ролям (RBAC) для маршрутов API.
+
+Эффективные роли пользователя = назначенные в auth.user_roles и включённые
+(is_enabled) в реестре ролей. Назначения читаются из БД один раз и кладутся
+в ограниченный LRU-кеш процесса; на горячем пути проверка — это поиск в dict
+и пересечение множеств (единицы микросекунд).
+
+Инвалидация:
+- запись кеша хранит версию реестра ролей: переименование/выключение роли
+  пересчитывает имена без запроса к БД;
+- у удалённого (deleted_at) пользователя ролей нет, пока его строки дочищаются;
+- grant/revoke/удаление пользователя сбрасывают запись пользователя после COMMIT
+  (invalidate) и через NOTIFY "user_roles_changed" — в других воркерах
+  (GRANTS_NOTIFY в RETURNING той же команды).
+
+Использование (декларативно на маршруте):
+  @router.delete("/users/{user_id}", dependencies=[Depends(require_roles("admin"))])
+"""
+
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from sqlalchemy import text
+
+from core.config import RBAC_CACHE_SIZE
+from db import notify
+from db.database import engine
+from utils import role_registry
+
+CHANNEL = "user_roles_changed"
+
+# user_id -> (role_ids, версия реестра, frozenset имён включённых ролей)
+_cache: "OrderedDict[int, tuple]" = OrderedDict()
+_lock = threading.Lock()
+# растёт при каждом invalidate(): прочитанное до сброса в кеш не кладётся
+_generation = 0
+
+
+def _load_role_ids(user_id: int) -> tuple:
+    with engine.connect() as conn:
+        return tuple(
+            conn.execute(
+                text(
+                    "SELECT ur.role_id FROM auth.user_roles ur "
+                    "JOIN auth.users u ON u.user_id = ur.user_id "
+                    "WHERE ur.user_id = :uid AND u.deleted_at IS NULL"
+                ),
+                {"uid": user_id},
+            ).scalars()
+        )
+
+
+def _names(role_ids: tuple, snap) -> frozenset:
+    by_id = snap.by_id
+    return frozenset(
+        by_id[r]["name"] for r in role_ids if r in by_id and by_id[r]["is_enabled"]
+    )
+
+
+def effective_roles(user_id: int) -> frozenset:
+    """Имена включённых ролей пользователя (из кеша; промах — один SELECT)."""
+    snap = role_registry.get()
+    with _lock:
+        generation = _generation
+        entry = _cache.get(user_id)
+        if entry is not None:
+            _cache.move_to_end(user_id)
+    if entry is None:
+        role_ids = _load_role_ids(user_id)
+    else:
+        role_ids, version, names = entry
+        if version == snap.version:
+            return names
+    names = _names(role_ids, snap)
+    with _lock:
+        if _generation != generation:
+            # между чтением и записью сброшен кеш (grant/revoke после COMMIT):
+            # прочитанные роли могли устареть — ответ этим, кеш не трогаем
+            return names
+        _cache[user_id] = (role_ids, snap.version, names)
+        _cache.move_to_end(user_id)
+        while len(_cache) > RBAC_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return names
+
+
+def invalidate(user_id: Optional[int] = None) -> None:
+    """Сбросить кеш пользователя (или весь кеш при user_id=None)."""
+    global _generation
+    with _lock:
+        _generation += 1
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+
+# для RETURNING команды, меняющей роли пользователя (столбец user_id): другим воркерам;
+# в своём процессе — invalidate(user_id) после COMMIT (раньше — промах кеша мог бы
+# перечитать старые роли и держать их до следующего изменения)
+GRANTS_NOTIFY = notify.expr(CHANNEL, "user_id::text")
+
+
+def _on_notify(payload: Optional[str]) -> None:
+    invalidate(int(payload) if payload else None)
+
+
+notify.subscribe(CHANNEL, _on_notify)
+
+
+# ----------------- Зависимости FastAPI -----------------
+def require_roles(*required: str):
+    """
+    Зависимость: пользователь сессии должен иметь хотя бы одну из ролей required.
+    401 — нет сессии, 403 — нет нужной роли.
+    """
+    required_set = frozenset(required)
+
+    def dependency(request: Request) -> int:
+        user_id = request.session.get("user_id")
+        if not user_id:
+            raise HTTPException(status_code=401, detail="Не авторизован")
+        if required_set.isdisjoint(effective_roles(user_id)):
+            raise HTTPException(status_code=403, detail="Недостаточно прав")
+        return user_id
+
+    return dependency
+
+
+require_admin = require_roles("admin")
@@ -0,0 +1,356 @@
+# core/scheduler.py
+"""
+Фоновый планировщик периодических задач.
+
+Свой поток-планировщик и свой пул потоков для задач (SCHEDULER_THREADS) —
+задачи никогда не занимают threadpool обработчиков запросов.
+
+Триггеры:
+  every(60)             — каждые 60 с от старта процесса;
+  cron("*/15 * * * *")  — minute hour day month weekday (время UTC; *, */n, a-b, a,b,c).
+jitter — случайная задержка 0..jitter с к каждому запуску (воркеры не бьют в БД одновременно).
+
+single=True — задача одна на все воркеры/хосты:
+  1. pg_try_advisory_lock(ключ задачи) на соединении планировщика (одно на воркер,
+     вне пула, см. _sql): не взяли — другой процесс уже выполняет её сейчас, пропуск;
+  2. взяли — по auth.scheduler_runs проверяется, не выполнял ли её другой процесс
+     в этом же периоде (для cron — после времени срабатывания, для every — за
+     последние полпериода); выполнял — пропуск;
+  3. в auth.scheduler_runs пишутся начало, конец, длительность, статус и ошибка.
+single=False — задача каждого процесса (например, обновление его кешей).
+
+Перекрытие: если прошлый запуск ещё идёт, новый пропускается (overlaps += 1).
+Метрики: scheduler_job_runs_total{job,status}, scheduler_job_duration_seconds{job}.
+Состояние: GET /api/admin/jobs.
+"""
+
+from __future__ import annotations
+import logging
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+import psycopg
+
+from core import metrics
+from core.config import SCHEDULER_ENABLED, SCHEDULER_THREADS
+from db.database import engine
+
+log = logging.getLogger("scheduler")
+
+LOCK_NAMESPACE = 7301  # первый ключ pg_advisory_lock(int, int) — «планировщик lab4»
+
+JOB_RUNS = metrics.counter(
+    "scheduler_job_runs_total", "Запуски фоновых задач по статусу", ("job", "status")
+)
+JOB_DURATION = metrics.histogram(
+    "scheduler_job_duration_seconds",
+    "Длительность фоновых задач",
+    ("job",),
+    (0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0),
+)
+
+
+# ----------------- Триггеры -----------------
+class every:
+    def __init__(self, seconds: float):
+        self.seconds = float(seconds)
+
+    def next_after(self, now: datetime) -> datetime:
+        return now + timedelta(seconds=self.seconds)
+
+    def recent_cutoff(self, fire: datetime) -> datetime:
+        # у воркеров свои моменты старта — «этот период» = последние полпериода
+        return datetime.now(timezone.utc) - timedelta(seconds=self.seconds / 2)
+
+    def __repr__(self) -> str:
+        return f"every({self.seconds:g}s)"
+
+
+def _cron_field(spec: str, lo: int, hi: int) -> frozenset:
+    values = set()
+    for part in spec.split(","):
+        step = 1
+        if "/" in part:
+            part, s = part.split("/")
+            step = int(s)
+        if part == "*":
+            a, b = lo, hi
+        elif "-" in part:
+            a, b = map(int, part.split("-"))
+        else:
+            a = b = int(part)
+        if a < lo or b > hi or a > b or step < 1:
+            raise ValueError(f"cron: поле {spec!r} вне {lo}..{hi}")
+        values.update(range(a, b + 1, step))
+    return frozenset(values)
+
+
+class cron:
+    def __init__(self, expr: str):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron: нужно 5 полей, получено {expr!r}")
+        self.expr = expr
+        self.minutes = _cron_field(fields[0], 0, 59)
+        self.hours = _cron_field(fields[1], 0, 23)
+        self.days = _cron_field(fields[2], 1, 31)
+        self.months = _cron_field(fields[3], 1, 12)
+        # 0 и 7 — воскресенье; в Python понедельник = 0
+        dow = _cron_field(fields[4], 0, 7)
+        self.weekdays = frozenset((d - 1) % 7 for d in dow)
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_ok(self, t: datetime) -> bool:
+        dom = t.day in self.days
+        dow = t.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return dom and dow
+        return dom or dow  # как в cron: оба поля заданы — достаточно одного
+
+    def next_after(self, now: datetime) -> datetime:
+        t = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 4)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1) + timedelta(days=32)).replace(
+                    day=1, hour=0, minute=0
+                )
+            elif not self._day_ok(t):
+                t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+            elif t.hour not in self.hours:
+                t = (t + timedelta(hours=1)).replace(minute=0)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"cron: {self.expr!r} не срабатывает")
+
+    def recent_cutoff(self, fire: datetime) -> datetime:
+        # время срабатывания у всех воркеров одно и то же (без jitter)
+        return fire
+
+    def __repr__(self) -> str:
+        return f"cron({self.expr!r})"
+
+
+# ----------------- Задачи -----------------
+class Job:
+    def __init__(self, name: str, fn: Callable[[], None], trigger, jitter, single):
+        self.name, self.fn, self.trigger = name, fn, trigger
+        self.jitter, self.single = jitter, single
+        self.lock_key = zlib.crc32(name.encode("utf-8")) & 0x7FFFFFFF
+        self.running = False
+        self.fire_at: Optional[datetime] = None  # время срабатывания без jitter
+        self.next_run: Optional[datetime] = None  # с jitter
+        self.runs = self.failures = self.overlaps = self.skipped = 0
+        self.last_started: Optional[datetime] = None
+        self.last_duration_ms: Optional[float] = None
+        self.last_status: Optional[str] = None
+        self.last_error: Optional[str] = None
+
+    def schedule(self, now: datetime) -> None:
+        self.fire_at = self.trigger.next_after(now)
+        self.next_run = self.fire_at + timedelta(seconds=random.uniform(0, self.jitter))
+
+    def info(self) -> dict:
+        return {
+            "name": self.name,
+            "trigger": repr(self.trigger),
+            "single": self.single,
+            "running": self.running,
+            "next_run": self.next_run,
+            "runs": self.runs,
+            "failures": self.failures,
+            "overlaps": self.overlaps,
+            "skipped": self.skipped,
+            "last_started": self.last_started,
+            "last_duration_ms": self.last_duration_ms,
+            "last_status": self.last_status,
+            "last_error": self.last_error,
+        }
+
+
+_jobs: dict[str, Job] = {}
+_jobs_lock = threading.Lock()
+_stop = threading.Event()
+_wakeup = threading.Event()
+_thread: Optional[threading.Thread] = None
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def add(name: str, fn, trigger, jitter: float = 0.0, single: bool = True) -> Job:
+    job = Job(name, fn, trigger, jitter, single)
+    with _jobs_lock:
+        _jobs[name] = job
+    _wakeup.set()
+    return job
+
+
+def jobs() -> list[dict]:
+    with _jobs_lock:
+        return [j.info() for j in _jobs.values()]
+
+
+# ----------------- Выполнение -----------------
+def _execute(job: Job) -> str:
+    """Выполнить fn и учесть результат; возвращает статус ok|failed."""
+    t0 = time.perf_counter()
+    job.last_started = datetime.now(timezone.utc)
+    error = None
+    try:
+        job.fn()
+    except Exception as e:
+        log.exception("job %s failed", job.name)
+        error = f"{type(e).__name__}: {e}"
+    job.last_duration_ms = round((time.perf_counter() - t0) * 1000, 1)
+    status = "failed" if error else "ok"
+    job.runs += 1
+    job.last_status, job.last_error = status, error
+    JOB_DURATION.observe((job.name,), job.last_duration_ms / 1000)
+    return status
+
+
+def _skip(job: Job, reason: str) -> str:
+    job.skipped += 1
+    return reason
+
+
+# ----------------- Соединение координации -----------------
+# Advisory-блокировки single-задач и записи auth.scheduler_runs — на одном своём
+# соединении (autocommit, вне пула SQLAlchemy; учтено в RESERVED_PER_WORKER,
+# core/server.py): долгая задача не держит соединение пула без overflow.
+# Потоки задач пользуются им по очереди, каждая команда — короткая.
+# Обрыв соединения снимает все блокировки сессии — при переподключении пишем в лог.
+_db: Optional[psycopg.Connection] = None
+_db_lock = threading.Lock()
+
+
+def _sql(query: str, params: Optional[dict] = None) -> Optional[tuple]:
+    """Одна команда на соединении планировщика; первая строка результата."""
+    global _db
+    with _db_lock:
+        if _db is None or _db.closed or _db.broken:
+            if _db is not None:
+                log.warning("scheduler connection lost, advisory locks released")
+            dsn = engine.url.set(drivername="postgresql")
+            _db = psycopg.connect(
+                dsn.render_as_string(hide_password=False), autocommit=True
+            )
+        cur = _db.execute(query, params)
+        return cur.fetchone() if cur.description else None
+
+
+def _close_db() -> None:
+    global _db
+    with _db_lock:
+        if _db is not None:
+            _db.close()
+            _db = None
+
+
+def _run_single(job: Job, fire: datetime) -> str:
+    lock = {"ns": LOCK_NAMESPACE, "key": job.lock_key}
+    (got,) = _sql("SELECT pg_try_advisory_lock(%(ns)s, %(key)s)", lock)
+    if not got:
+        return _skip(job, "skipped_locked")
+    try:
+        recent = _sql(
+            "SELECT 1 FROM auth.scheduler_runs "
+            "WHERE job_name = %(name)s AND last_started_at >= %(cutoff)s",
+            {"name": job.name, "cutoff": job.trigger.recent_cutoff(fire)},
+        )
+        if recent is not None:
+            return _skip(job, "skipped_recent")
+        _sql(
+            """
+            INSERT INTO auth.scheduler_runs (job_name, last_started_at, last_status)
+            VALUES (%(name)s, now(), 'running')
+            ON CONFLICT (job_name) DO UPDATE
+            SET last_started_at = now(), last_status = 'running'
+        """,
+            {"name": job.name},
+        )
+
+        status = _execute(job)
+        _sql(
+            """
+            UPDATE auth.scheduler_runs
+            SET last_finished_at = now(), last_status = %(status)s,
+                last_error = %(error)s, last_duration_ms = %(ms)s, runs = runs + 1,
+                failures = failures + %(failed)s
+            WHERE job_name = %(name)s
+        """,
+            {
+                "name": job.name,
+                "status": status,
+                "error": job.last_error,
+                "ms": job.last_duration_ms,
+                "failed": int(status == "failed"),
+            },
+        )
+        return status
+    finally:
+        _sql("SELECT pg_advisory_unlock(%(ns)s, %(key)s)", lock)
+
+
+def _run(job: Job, fire: datetime) -> None:
+    status = "failed"
+    try:
+        status = _run_single(job, fire) if job.single else _execute(job)
+    except Exception as e:  # сбой самой координации (БД недоступна и т.п.)
+        log.exception("job %s: scheduler error", job.name)
+        job.last_status, job.last_error = "failed", f"{type(e).__name__}: {e}"
+    finally:
+        if status == "failed":
+            job.failures += 1
+        JOB_RUNS.inc((job.name, status))
+        job.running = False
+
+
+def _loop() -> None:
+    while not _stop.is_set():
+        now = datetime.now(timezone.utc)
+        with _jobs_lock:
+            pending = list(_jobs.values())
+        wait = 60.0
+        for job in pending:
+            if job.next_run is None:
+                job.schedule(now)
+            if job.next_run <= now:
+                fire = job.fire_at
+                job.schedule(now)
+                if job.running:
+                    job.overlaps += 1
+                    JOB_RUNS.inc((job.name, "skipped_overlap"))
+                else:
+                    job.running = True
+                    _pool.submit(_run, job, fire)
+            wait = min(wait, (job.next_run - now).total_seconds())
+        _wakeup.wait(max(wait, 0.05))
+        _wakeup.clear()
+
+
+def start() -> None:
+    global _thread, _pool
+    if not SCHEDULER_ENABLED or (_thread is not None and _thread.is_alive()):
+        return
+    _stop.clear()
+    _pool = ThreadPoolExecutor(SCHEDULER_THREADS, thread_name_prefix="job")
+    _thread = threading.Thread(target=_loop, name="scheduler", daemon=True)
+    _thread.start()
+
+
+def stop() -> None:
+    _stop.set()
+    _wakeup.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _close_db()
@@ -0,0 +1,48 @@
+# core/server.py
+"""
+Параметры процессов для прод-запуска: число воркеров и размер пула БД на воркер.
+
+Пул считается из общего бюджета DB_MAX_CONNECTIONS, чтобы N воркеров вместе
+никогда не открыли больше соединений, чем выделено приложению в Postgres:
+  на воркер = DB_MAX_CONNECTIONS // workers,
+  из них 2 — отдельные соединения LISTEN (db/notify.py) и координации планировщика
+  (core/scheduler.py), остальное — пул без overflow.
+"""
+
+from __future__ import annotations
+import os
+
+from core.config import DB_MAX_CONNECTIONS, WEB_WORKERS
+
+# соединения воркера вне пула SQLAlchemy: LISTEN/NOTIFY и advisory-блокировки планировщика
+RESERVED_PER_WORKER = 2
+
+
+def cpu_count() -> int:
+    """CPU, доступные процессу (учитывает affinity/cpuset контейнера)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # не Linux
+        return os.cpu_count() or 1
+
+
+def worker_count() -> int:
+    return WEB_WORKERS if WEB_WORKERS > 0 else cpu_count()
+
+
+def pool_limits(workers: int | None = None) -> dict:
+    """
+    Аргументы create_engine для пула одного воркера. Пустой dict — бюджет
+    не задан, остаются умолчания SQLAlchemy (pool_size=5, max_overflow=10).
+    """
+    if DB_MAX_CONNECTIONS <= 0:
+        return {}
+    workers = workers or worker_count()
+    per_worker = DB_MAX_CONNECTIONS // workers
+    pool_size = per_worker - RESERVED_PER_WORKER
+    if pool_size < 1:
+        raise RuntimeError(
+            f"DB_MAX_CONNECTIONS={DB_MAX_CONNECTIONS} мало для {workers} воркеров: "
+            f"нужно хотя бы {workers * (RESERVED_PER_WORKER + 1)}"
+        )
+    return {"pool_size": pool_size, "max_overflow": 0}
@@ -0,0 +1,254 @@
+# core/timing.py
+"""
+Разбивка времени запроса по фазам -> заголовок Server-Timing (видно в DevTools).
+
+Фазы:
+  session   — разбор и проверка подписи cookie сессии (+ подпись на ответе);
+  validate  — разбор/валидация параметров и тела (зависимости FastAPI);
+  pool      — ожидание соединения из пула;
+  db        — выполнение SQL (desc — число запросов);
+  app       — код обработчика без pool/db;
+  serialize — response_model / сериализация ответа;
+  total     — всё время внутри middleware.
+
+Включается на запрос заголовком "X-Server-Timing: 1"; заголовок ответа выдаётся
+только пользователю с ролью admin. SERVER_TIMING_LOG=true — дополнительно пишет
+фазы в лог "timing" полями записи (extra). Без заголовка запроса замеры не ведутся.
+
+Подключение:
+  - TimedRoute — route_class всех APIRouter;
+  - SessionMark — middleware внутри SessionMiddleware, ServerTimingMiddleware — снаружи;
+  - pool/db — TimedQueuePool и события engine (db/database.py).
+"""
+
+from __future__ import annotations
+import contextvars
+import functools
+import logging
+import time
+from inspect import iscoroutinefunction
+from typing import Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+
+from core.config import SERVER_TIMING_LOG
+
+log = logging.getLogger("timing")
+
+HEADER = b"x-server-timing"
+PHASES = ("session", "validate", "pool", "db", "app", "serialize", "total")
+
+
+class Timing:
+    """Засечки одного запроса (perf_counter, секунды)."""
+
+    __slots__ = (
+        "t_start",
+        "t_inner",
+        "t_route",
+        "t_call",
+        "t_call_end",
+        "t_route_end",
+        "t_resp",
+        "pool",
+        "db",
+        "db_queries",
+    )
+
+    def __init__(self):
+        self.t_start = time.perf_counter()
+        self.t_inner = self.t_route = self.t_call = None
+        self.t_call_end = self.t_route_end = self.t_resp = None
+        self.pool = self.db = 0.0
+        self.db_queries = 0
+
+    def phases(self, now: float) -> dict:
+        """Длительности фаз в миллисекундах (неизмеренные — пропускаются)."""
+        ms = {}
+
+        def span(name, a, b):
+            if a is not None and b is not None:
+                ms[name] = (b - a) * 1000
+
+        span("session", self.t_start, self.t_inner)
+        span("validate", self.t_route, self.t_call)
+        if self.t_call is not None and self.t_call_end is not None:
+            handler = (self.t_call_end - self.t_call) * 1000
+            ms["app"] = max(0.0, handler - (self.pool + self.db) * 1000)
+        span("serialize", self.t_call_end, self.t_route_end)
+        if self.t_resp is not None and "session" in ms:
+            ms["session"] += (now - self.t_resp) * 1000  # подпись cookie
+        ms["pool"] = self.pool * 1000
+        ms["db"] = self.db * 1000
+        ms["total"] = (now - self.t_start) * 1000
+        return ms
+
+
+current: contextvars.ContextVar[Optional[Timing]] = contextvars.ContextVar(
+    "timing", default=None
+)
+
+
+def header_value(ms: dict, db_queries: int) -> str:
+    parts = []
+    for name in PHASES:
+        if name in ms:
+            desc = f';desc="{db_queries} queries"' if name == "db" else ""
+            parts.append(f"{name};dur={ms[name]:.2f}{desc}")
+    return ", ".join(parts)
+
+
+# ----------------- Маршруты FastAPI -----------------
+class TimedRoute(APIRoute):
+    """APIRoute с засечками: начало маршрута, вызов обработчика, конец ответа."""
+
+    def get_route_handler(self):
+        call = self.dependant.call
+        if iscoroutinefunction(call):
+
+            @functools.wraps(call)
+            async def timed_call(*args, **kwargs):
+                t = current.get()
+                if t is None:
+                    return await call(*args, **kwargs)
+                t.t_call = time.perf_counter()
+                try:
+                    return await call(*args, **kwargs)
+                finally:
+                    t.t_call_end = time.perf_counter()
+
+        else:
+
+            @functools.wraps(call)
+            def timed_call(*args, **kwargs):
+                t = current.get()
+                if t is None:
+                    return call(*args, **kwargs)
+                t.t_call = time.perf_counter()
+                try:
+                    return call(*args, **kwargs)
+                finally:
+                    t.t_call_end = time.perf_counter()
+
+        self.dependant.call = timed_call
+        handler = super().get_route_handler()
+
+        async def route_handler(request):
+            t = current.get()
+            if t is None:
+                return await handler(request)
+            t.t_route = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                t.t_route_end = time.perf_counter()
+
+        return route_handler
+
+
+# ----------------- Пул и SQL -----------------
+class TimedQueuePool(QueuePool):
+    """QueuePool, который учитывает ожидание соединения в фазе pool."""
+
+    def _do_get(self):
+        t = current.get()
+        if t is None:
+            return super()._do_get()
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            t.pool += time.perf_counter() - t0
+
+
+def _before_cursor_execute(conn, cursor, statement, params, context, executemany):
+    context._timing_t0 = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, params, context, executemany):
+    t = current.get()
+    if t is not None:
+        t.db += time.perf_counter() - context._timing_t0
+        t.db_queries += 1
+
+
+def instrument_engine(engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ----------------- Middleware -----------------
+class SessionMark:
+    """Внутри SessionMiddleware: отмечает конец разбора cookie и начало ответа."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        t = current.get() if scope["type"] == "http" else None
+        if t is None:
+            return await self.app(scope, receive, send)
+        t.t_inner = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                t.t_resp = time.perf_counter()
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+async def _is_admin(scope) -> bool:
+    # импорт по требованию: core.rbac -> db.database -> core.timing (цикл)
+    from core.rbac import effective_roles
+
+    user_id = (scope.get("session") or {}).get("user_id")
+    if not user_id:
+        return False
+    # промах кеша ролей — SELECT: в threadpool, не в event loop
+    return "admin" in await run_in_threadpool(effective_roles, user_id)
+
+
+class ServerTimingMiddleware:
+    """Снаружи SessionMiddleware: включает замеры по заголовку и выдаёт Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not any(
+            k == HEADER and v == b"1" for k, v in scope["headers"]
+        ):
+            return await self.app(scope, receive, send)
+
+        t = Timing()
+        token = current.set(t)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                ms = t.phases(time.perf_counter())
+                queries = t.db_queries  # до проверки роли: её SELECT не в счёт
+                if await _is_admin(scope):
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", header_value(ms, queries)
+                    )
+                if SERVER_TIMING_LOG:
+                    log.info(
+                        "timing",
+                        extra={
+                            "path": scope["path"],
+                            "status": message["status"],
+                            "db_queries": queries,
+                            **{f"{k}_ms": round(v, 3) for k, v in ms.items()},
+                        },
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current.reset(token)
@@ -0,0 +1,175 @@
+# core/warmup.py
+"""
+Прогрев воркера после старта и состояние готовности для балансировщика.
+
+Прогрев (в фоновом потоке, запускается из lifespan):
+  1. imports    — модули, которые иначе грузятся на первом запросе (numpy,
+                  драйвер psycopg, валидатор email);
+  2. pool       — WARMUP_CONNECTIONS соединений пула открываются одновременно
+                  и остаются в пуле (не больше pool_size);
+  3. statements — на каждом соединении выполняются горячие запросы: у backend'а
+                  Postgres прогреваются кеши каталога, в shared buffers — индексы;
+  4. caches     — реестр ролей, снапшот аналитики каталога и Bloom-фильтр
+                  логинов/email.
+
+/healthz — процесс жив (без БД и без threadpool).
+/readyz  — 200 только после прогрева и при живой БД; проверка SELECT 1
+           кешируется на READY_PROBE_TTL_SEC, одновременно идёт не больше одной.
+"""
+
+from __future__ import annotations
+import importlib
+import logging
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import text
+
+from core.config import READY_PROBE_TTL_SEC, WARMUP_CONNECTIONS
+from db.database import engine
+
+log = logging.getLogger("warmup")
+
+LAZY_MODULES = ("numpy", "psycopg", "email_validator", "utils.catalog_snapshot")
+
+# (search_path, SQL, параметры) — те же таблицы/индексы, что у горячих маршрутов
+PRIME_STATEMENTS = (
+    (
+        "auth",
+        "SELECT user_id, login, salt, password_hash, last_name, first_name "
+        "FROM auth.users WHERE login = :login AND deleted_at IS NULL",
+        {"login": ""},
+    ),
+    (
+        "auth",
+        "SELECT ur.role_id FROM auth.user_roles ur "
+        "JOIN auth.users u ON u.user_id = ur.user_id "
+        "WHERE ur.user_id = :uid AND u.deleted_at IS NULL",
+        {"uid": 0},
+    ),
+    (
+        "auth",
+        "SELECT COUNT(*) FROM auth.user_visits WHERE user_id = :uid AND page_name = :pname",
+        {"uid": 0, "pname": ""},
+    ),
+    ("auth", "SELECT COUNT(*) FROM auth.users u WHERE u.deleted_at IS NULL", {}),
+    (
+        "catalog",
+        "SELECT company_id, name FROM catalog.companies ORDER BY name LIMIT 1",
+        {},
+    ),
+    (
+        "catalog",
+        "SELECT car_id FROM catalog.cars WHERE company_id = :cid LIMIT 1",
+        {"cid": 0},
+    ),
+)
+
+
+class State:
+    __slots__ = ("ready", "started_at", "finished_at", "steps", "error")
+
+    def __init__(self):
+        self.ready = False
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.steps: dict = {}  # шаг -> мс
+        self.error: Optional[str] = None
+
+
+state = State()
+
+
+# ----------------- Прогрев -----------------
+def _step(name: str, fn) -> None:
+    t0 = time.perf_counter()
+    fn()
+    state.steps[name] = round((time.perf_counter() - t0) * 1000, 1)
+
+
+def _import_lazy() -> None:
+    for name in LAZY_MODULES:
+        importlib.import_module(name)
+
+
+def _open_pool() -> None:
+    n = min(WARMUP_CONNECTIONS, engine.pool.size())
+    conns = []
+    try:
+        for _ in range(n):
+            conns.append(engine.connect())
+        for conn in conns:
+            for schema, sql, params in PRIME_STATEMENTS:
+                conn.execute(text(f"SET search_path TO {schema}, public"))
+                conn.execute(text(sql), params)
+            conn.rollback()
+    finally:
+        for conn in conns:
+            conn.close()  # соединение возвращается в пул открытым
+
+
+def _load_caches() -> None:
+    from utils import role_registry, user_bloom
+    from utils.catalog_snapshot import get_snapshot
+
+    role_registry.reload()
+    get_snapshot()
+    user_bloom.rebuild()
+
+
+def warm_up() -> None:
+    state.started_at = time.monotonic()
+    try:
+        _step("imports", _import_lazy)
+        _step("pool_and_statements", _open_pool)
+        _step("caches", _load_caches)
+    except Exception as e:
+        # воркер всё равно станет готов: прогрев — оптимизация, а БД проверит /readyz
+        state.error = f"{type(e).__name__}: {e}"
+        log.exception("warm-up failed")
+    state.finished_at = time.monotonic()
+    state.ready = True
+    log.info("warm-up done in %s ms", state.steps)
+
+
+def start() -> None:
+    threading.Thread(target=warm_up, name="warmup", daemon=True).start()
+
+
+# ----------------- Готовность -----------------
+_probe_lock = threading.Lock()
+_probe_at = 0.0
+_probe_ok = False
+_probe_detail: Optional[str] = None
+
+
+def _probe() -> None:
+    global _probe_at, _probe_ok, _probe_detail
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        _probe_ok, _probe_detail = True, None
+    except Exception as e:
+        _probe_ok, _probe_detail = False, f"{type(e).__name__}: {e}"
+    _probe_at = time.monotonic()
+
+
+def readiness() -> tuple[bool, dict]:
+    """(готов?, тело ответа /readyz)."""
+    body = {"warmup": state.steps, "warmup_error": state.error}
+    if not state.ready:
+        return False, {"status": "warming_up", **body}
+
+    now = time.monotonic()
+    if now - _probe_at >= READY_PROBE_TTL_SEC and _probe_lock.acquire(blocking=False):
+        try:
+            _probe()
+        finally:
+            _probe_lock.release()
+    # проверку ведёт другой поток и она зависла (пул исчерпан, БД не отвечает)
+    stale = time.monotonic() - _probe_at > 3 * READY_PROBE_TTL_SEC
+    ok = _probe_ok and not stale
+    body["db"] = "ok" if ok else (_probe_detail or "probe timeout")
+    body["db_checked_sec_ago"] = round(time.monotonic() - _probe_at, 3)
+    return ok, {"status": "ready" if ok else "not_ready", **body}
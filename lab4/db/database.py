@@ -3,6 +3,9 @@ from dotenv import load_dotenv
 from sqlalchemy import create_engine
 from sqlalchemy.engine import URL
 
+from core import timing
+from core.server import pool_limits
+
 # ----------------- Подключение к БД -----------------
 load_dotenv()
 url = URL.create(
@@ -14,4 +17,23 @@ url = URL.create(
     database=os.getenv("DB_NAME", "webapp_db"),
 )
 
-engine = create_engine(url, future=True)
+# TimedQueuePool — учёт ожидания соединения в Server-Timing (core/timing.py);
+# размер пула — из бюджета соединений на все воркеры (core/server.py)
+engine = create_engine(
+    url, future=True, poolclass=timing.TimedQueuePool, **pool_limits()
+)
+timing.instrument_engine(engine)
+
+
+def autocommit():
+    """
+    Соединение пула без BEGIN/COMMIT: одна команда — сама себе транзакция и
+    один round trip до Postgres (для записей из одной команды).
+    """
+    return engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+# ----------------- Журнал медленных запросов -----------------
+from db import slowlog  # noqa: E402
+
+slowlog.instrument(engine)
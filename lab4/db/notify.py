@@ -0,0 +1,104 @@
+# db/notify.py
+"""
+Межпроцессные сигналы через Postgres LISTEN/NOTIFY.
+
+Каждый воркер держит одно выделенное соединение (вне пула) и поток-слушатель.
+Модули подписываются на канал колбэком; колбэк вызывается в потоке-слушателе
+с payload (str). После переподключения все колбэки вызываются с payload=None —
+уведомления за время разрыва потеряны, подписчик должен пересинхронизироваться.
+
+Использование:
+  from db import notify
+  notify.subscribe("roles_changed", lambda payload: registry.reload())
+  ...
+  with engine.begin() as conn:
+      ...
+      notify.send(conn, "roles_changed")   # уйдёт после COMMIT
+  # или в той же команде, что и запись (без лишнего round trip):
+  conn.execute(text(f"UPDATE ... RETURNING ..., {notify.expr('roles_changed')}"))
+"""
+
+from __future__ import annotations
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Optional
+
+import psycopg
+from sqlalchemy import text
+
+from db.database import engine
+
+log = logging.getLogger(__name__)
+
+_callbacks: dict[str, list[Callable[[Optional[str]], None]]] = defaultdict(list)
+_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+def subscribe(channel: str, callback: Callable[[Optional[str]], None]) -> None:
+    """Подписка на канал. Вызывать до start() (обычно при импорте модуля)."""
+    _callbacks[channel].append(callback)
+
+
+def send(conn, channel: str, payload: str = "") -> None:
+    """NOTIFY в текущей транзакции conn (доставляется подписчикам после COMMIT)."""
+    conn.execute(
+        text("SELECT pg_notify(:ch, :payload)"), {"ch": channel, "payload": payload}
+    )
+
+
+def expr(channel: str, payload_sql: str = "''") -> str:
+    """
+    pg_notify(...) как выражение SQL для RETURNING: оповещение уходит одной командой
+    с записью и только для действительно изменённых строк. payload_sql — выражение
+    над столбцами строки (например, "user_id::text").
+    """
+    return f"pg_notify('{channel}', {payload_sql})"
+
+
+def _dispatch(channel: str, payload: Optional[str]) -> None:
+    for cb in _callbacks.get(channel, ()):
+        try:
+            cb(payload)
+        except Exception:
+            log.exception("notify callback failed: channel=%s", channel)
+
+
+def _listen_loop() -> None:
+    dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+    backoff = 1.0
+    while not _stop.is_set():
+        try:
+            with psycopg.connect(dsn, autocommit=True) as conn:
+                for channel in _callbacks:
+                    conn.execute(f'LISTEN "{channel}"')
+                # (пере)подключились: пропущенное надо перечитать
+                for channel in list(_callbacks):
+                    _dispatch(channel, None)
+                backoff = 1.0
+                while not _stop.is_set():
+                    for n in conn.notifies(timeout=1.0):
+                        _dispatch(n.channel, n.payload)
+        except Exception:
+            log.exception("notify listener disconnected, retry in %.0fs", backoff)
+            _stop.wait(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+
+def start() -> None:
+    """Запускает поток-слушатель (идемпотентно)."""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    if not _callbacks:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_listen_loop, name="pg-notify", daemon=True)
+    _thread.start()
+
+
+def stop() -> None:
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
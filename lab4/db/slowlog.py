@@ -0,0 +1,172 @@
+# db/slowlog.py
+"""
+Журнал медленных SQL-запросов.
+
+События before/after_cursor_execute на engine: если запрос выполнялся дольше
+SLOW_QUERY_MS, в лог (logger "slow_query") пишется нормализованный SQL (литералы
+заменены на ?), «форма» параметров (типы, длины списков, без значений) и маршрут,
+из которого пришёл запрос. Последние записи хранятся в кольцевом буфере.
+
+Для доли SLOW_QUERY_EXPLAIN_SAMPLE медленных SELECT в фоне (отдельное соединение,
+один поток) снимается EXPLAIN (ANALYZE, BUFFERS) с теми же параметрами. Изменяющие
+запросы не перевыполняются — для них EXPLAIN без ANALYZE.
+Буферы смотреть: GET /api/admin/slow-queries (роль admin).
+"""
+
+from __future__ import annotations
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+
+from core.config import (
+    SLOW_QUERY_BUFFER,
+    SLOW_QUERY_EXPLAIN_SAMPLE,
+    SLOW_QUERY_MS,
+)
+from core.metrics import current
+
+log = logging.getLogger("slow_query")
+
+recent: deque = deque(maxlen=SLOW_QUERY_BUFFER)
+explains: deque = deque(maxlen=SLOW_QUERY_BUFFER)
+
+_explain_queue: queue.Queue = queue.Queue(maxsize=16)
+_engine = None
+_worker_pid = None  # поток EXPLAIN не переживает fork (preload в gunicorn)
+
+# ----------------- Нормализация -----------------
+_RE_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_RE_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_SPACE = re.compile(r"\s+")
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b", re.I)
+_READONLY = re.compile(r"^\s*(SELECT|WITH\s+[\s\S]*?\bSELECT)\b", re.I)
+_WRITES = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE)\b", re.I)
+# SELECT с побочным эффектом: ANALYZE выполнил бы его ещё раз (NOTIFY, advisory-блокировка,
+# шаг последовательности, блокировка строк) — для таких только EXPLAIN без выполнения
+_SIDE_EFFECTS = re.compile(
+    r"\b(pg_notify|pg_(try_)?advisory\w*|nextval|setval|set_config"
+    r"|pg_cancel_backend|pg_terminate_backend)\s*\("
+    r"|\bFOR\s+(NO\s+KEY\s+UPDATE|UPDATE|KEY\s+SHARE|SHARE)\b",
+    re.I,
+)
+
+
+def normalize(statement: str) -> str:
+    s = _RE_COMMENT.sub(" ", statement)
+    s = _RE_STRING.sub("?", s)
+    s = _RE_NUMBER.sub("?", s)
+    s = _RE_IN_LIST.sub("(...)", s)
+    return _RE_SPACE.sub(" ", s).strip()
+
+
+def param_shape(params):
+    """Типы параметров без значений: {"uid": "int", "ids": "list[42]"}."""
+    if isinstance(params, (list, tuple)):
+        if params and isinstance(params[0], dict):  # executemany
+            return {"executemany": len(params), "row": param_shape(params[0])}
+        return [_shape(v) for v in params]
+    if isinstance(params, dict):
+        return {k: _shape(v) for k, v in params.items()}
+    return None
+
+
+def _shape(v) -> str:
+    if isinstance(v, (list, tuple, set)):
+        return f"{type(v).__name__}[{len(v)}]"
+    if isinstance(v, str):
+        return f"str[{len(v)}]"
+    return type(v).__name__
+
+
+# ----------------- События engine -----------------
+def _before(conn, cursor, statement, params, context, executemany):
+    context._slowlog_t0 = time.perf_counter()
+
+
+def _after(conn, cursor, statement, params, context, executemany):
+    ms = (time.perf_counter() - context._slowlog_t0) * 1000
+    if ms < SLOW_QUERY_MS or statement.lstrip()[:7].upper() == "EXPLAIN":
+        return
+    st = current.get()
+    entry = {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "ms": round(ms, 2),
+        "route": st.route if st is not None else None,
+        "sql": normalize(statement),
+        "params": param_shape(params),
+    }
+    recent.append(entry)
+    log.warning(
+        "slow query %.1f ms route=%s sql=%s params=%s",
+        ms,
+        entry["route"],
+        entry["sql"],
+        entry["params"],
+    )
+    if (
+        SLOW_QUERY_EXPLAIN_SAMPLE > 0
+        and not executemany
+        and _EXPLAINABLE.match(statement)
+        and random.random() < SLOW_QUERY_EXPLAIN_SAMPLE
+    ):
+        _ensure_worker()
+        try:
+            _explain_queue.put_nowait((entry, statement, params))
+        except queue.Full:
+            pass  # EXPLAIN — best effort, запрос не ждёт
+
+
+def _explain_worker() -> None:
+    while True:
+        entry, statement, params = _explain_queue.get()
+        analyze = (
+            _READONLY.match(statement)
+            and not _WRITES.search(statement)
+            and not _SIDE_EFFECTS.search(statement)
+        )
+        opts = "ANALYZE, BUFFERS" if analyze else "COSTS"
+        try:
+            raw = _engine.raw_connection()
+            try:
+                cur = raw.cursor()
+                cur.execute(f"EXPLAIN ({opts}) {statement}", params)
+                plan = "\n".join(r[0] for r in cur.fetchall())
+                raw.rollback()
+            finally:
+                raw.close()
+        except Exception as e:
+            plan = f"EXPLAIN failed: {e}"
+        explains.append({**entry, "analyze": bool(analyze), "plan": plan})
+
+
+_worker_lock = threading.Lock()
+
+
+def _ensure_worker() -> None:
+    """Запустить поток EXPLAIN в текущем процессе (лениво, один раз на pid)."""
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    with _worker_lock:
+        if _worker_pid != os.getpid():
+            threading.Thread(
+                target=_explain_worker, name="slowlog-explain", daemon=True
+            ).start()
+            _worker_pid = os.getpid()
+
+
+def instrument(engine) -> None:
+    global _engine
+    _engine = engine
+    event.listen(engine, "before_cursor_execute", _before)
+    event.listen(engine, "after_cursor_execute", _after)
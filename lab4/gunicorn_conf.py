@@ -0,0 +1,51 @@
+# gunicorn_conf.py
+"""
+Прод-запуск: gunicorn (мастер) + воркеры uvicorn на uvloop/httptools.
+
+  python run.py --prod
+  # или напрямую: gunicorn -c gunicorn_conf.py main:app
+
+- воркеров — WEB_WORKERS или по числу CPU;
+- preload_app: приложение импортируется в мастере до fork (быстрый старт воркеров,
+  общие страницы памяти); соединения пула, открытые в мастере, сбрасываются в post_fork;
+- WEB_REUSE_PORT: SO_REUSEPORT — у каждого воркера свой слушающий сокет, соединения
+  распределяет ядро (ровнее при многих ядрах), но принятые в очередь, но не
+  обработанные соединения воркера сбрасываются при его перезапуске;
+- max_requests (+jitter): воркер мягко перезапускается после N запросов;
+- пул БД на воркер — из бюджета DB_MAX_CONNECTIONS (core/server.py).
+"""
+
+from uvicorn_worker import UvicornWorker
+
+from core.config import (
+    HOST,
+    PORT,
+    WEB_GRACEFUL_TIMEOUT,
+    WEB_MAX_REQUESTS,
+    WEB_MAX_REQUESTS_JITTER,
+    WEB_REUSE_PORT,
+)
+from core.server import worker_count
+
+
+class ProdWorker(UvicornWorker):
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+
+bind = f"{HOST}:{PORT}"
+workers = worker_count()
+worker_class = ProdWorker
+preload_app = True
+reuse_port = WEB_REUSE_PORT
+max_requests = WEB_MAX_REQUESTS
+max_requests_jitter = WEB_MAX_REQUESTS_JITTER if WEB_MAX_REQUESTS else 0
+graceful_timeout = WEB_GRACEFUL_TIMEOUT
+keepalive = 5
+
+
+def post_fork(server, worker):
+    # соединения, унаследованные от мастера, не трогаем (close=False) — их
+    # закроет мастер; воркер откроет свои
+    from db.database import engine
+
+    engine.dispose(close=False)
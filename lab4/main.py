@@ -1,21 +1,106 @@
 # main.py
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 
-from core.config import SESSION_SECRET
-from routers import userRouter, roleRouter, authRouter, visitsRouter, cartRouter
+from core import (
+    admission,
+    disconnect,
+    jobs,
+    jsonlog,
+    metrics,
+    scheduler,
+    timing,
+    warmup,
+)
+from core.config import (
+    LOG_ACCESS,
+    LOG_LEVEL,
+    LOG_QUEUE_SIZE,
+    LOG_SAMPLE,
+    LOG_SLOW_MS,
+    SESSION_SECRET,
+)
+from db import notify
+from db.database import engine
+from utils import visit_feed, visit_sketches
+from routers import (
+    userRouter,
+    roleRouter,
+    authRouter,
+    visitsRouter,
+    cartRouter,
+    catalogRouter,
+    analyticsRouter,
+    metricsRouter,
+    adminRouter,
+    healthRouter,
+    batchRouter,
+    searchRouter,
+)
+
+# JSON-лог через очередь — при импорте приложения, до старта воркера (lifespan)
+jsonlog.setup(LOG_LEVEL, LOG_QUEUE_SIZE)
+
+
+# ----------------- Жизненный цикл -----------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # LISTEN/NOTIFY: сигналы об изменениях от других воркеров (реестр ролей и т.п.)
+    notify.start()
+    metrics.start()
+    # прогрев пула/кешей в фоне: воркер сразу принимает /healthz, а /readyz
+    # отвечает 200 только после прогрева
+    warmup.start()
+    # периодические задачи: свой поток и пул, не threadpool запросов
+    jobs.register()
+    scheduler.start()
+    # приращения посещений для SSE: один кадр на интервал всем подписчикам
+    visit_feed.start()
+    yield
+    visit_feed.stop()
+    scheduler.stop()
+    # несброшенные приращения счётчиков посещений — в БД
+    visit_sketches.stop()
+    metrics.stop()
+    notify.stop()
+    jsonlog.shutdown()
+
 
 # ----------------- FastAPI + статика -----------------
-app = FastAPI(title="Пользователи и роли — меню и редактирование")
+app = FastAPI(title="Пользователи и роли — меню и редактирование", lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# --- Сессии: обязательный middleware ---
+# --- Сессии: обязательный middleware (вокруг него — засечки Server-Timing) ---
+app.add_middleware(timing.SessionMark)
 app.add_middleware(
     SessionMiddleware,
     secret_key=SESSION_SECRET,  # замените секретную строку на свою в проде
 )
+app.add_middleware(timing.ServerTimingMiddleware)
+
+# --- Отмена SQL, если клиент ушёл (внутри контроля допуска: это не отказ БД) ---
+disconnect.instrument_engine(engine)
+app.add_middleware(disconnect.DisconnectMiddleware)
+
+# --- Контроль допуска к БД: до сессий и роутинга, быстрый 503 при перегрузке ---
+app.add_middleware(admission.AdmissionMiddleware)
+
+# --- Журнал запросов: request_id виден всем записям запроса, SQL — из метрик ---
+if LOG_ACCESS:
+    app.add_middleware(
+        jsonlog.RequestLogMiddleware,
+        sample=jsonlog.parse_sample(LOG_SAMPLE),
+        slow_ms=LOG_SLOW_MS,
+        extra=metrics.request_fields,
+    )
+
+# --- Метрики: добавляется последним, чтобы измерять весь стек (включая сессии) ---
+metrics.instrument_engine(engine)
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Подключаем роутеры
 app.include_router(userRouter.router, prefix="/api")
@@ -23,6 +108,13 @@ app.include_router(roleRouter.router, prefix="/api")
 app.include_router(authRouter.router, prefix="/auth")
 app.include_router(visitsRouter.router, prefix="/api")
 app.include_router(cartRouter.router, prefix="/api")
+app.include_router(catalogRouter.router, prefix="/api")
+app.include_router(analyticsRouter.router, prefix="/api")
+app.include_router(metricsRouter.router)
+app.include_router(adminRouter.router, prefix="/api")
+app.include_router(healthRouter.router)
+app.include_router(batchRouter.router, prefix="/api")
+app.include_router(searchRouter.router, prefix="/api")
 
 
 # ----------------- Главная -----------------
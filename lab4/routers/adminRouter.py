@@ -0,0 +1,85 @@
+# routers/admin_router.py
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import text
+
+from core import scheduler
+from core.rbac import require_admin
+from core.timing import TimedRoute
+from db import slowlog
+from db.database import engine
+from utils.fastjson import FastJSONResponse
+
+router = APIRouter(
+    route_class=TimedRoute,
+    tags=["admin"],
+    dependencies=[Depends(require_admin)],
+    responses={404: {"description": "Not Found"}},
+)
+
+
+# ----------------- Медленные запросы -----------------
+@router.get("/admin/slow-queries")
+def slow_queries(limit: int = Query(50, ge=1, le=1000)):
+    """Последние медленные запросы и снятые для них планы (свежие первыми)."""
+    return {
+        "recent": list(reversed(slowlog.recent))[:limit],
+        "explains": list(reversed(slowlog.explains))[:limit],
+    }
+
+
+# ----------------- Фоновые задачи -----------------
+@router.get("/admin/jobs")
+def scheduler_jobs():
+    """Задачи планировщика: состояние в этом воркере и общий журнал запусков из БД."""
+    with engine.connect() as conn:
+        conn.execute(text("SET search_path TO auth, public"))
+        runs = (
+            conn.execute(text("SELECT * FROM auth.scheduler_runs ORDER BY job_name"))
+            .mappings()
+            .all()
+        )
+    return FastJSONResponse(
+        {"worker": scheduler.jobs(), "runs": [dict(r) for r in runs]}
+    )
+
+
+# ----------------- Очистка удалённых пользователей -----------------
+@router.get("/admin/purges")
+def user_purges(limit: int = Query(50, ge=1, le=1000)):
+    """
+    Ход очистки мягко удалённых пользователей (задача user_purge): ожидающие
+    (ещё не начатые) и журнал auth.user_purges — этап и число удалённых строк.
+    """
+    with engine.connect() as conn:
+        conn.execute(text("SET search_path TO auth, public"))
+        queued = (
+            conn.execute(
+                text(
+                    """
+                SELECT u.user_id, u.login, u.deleted_at
+                FROM auth.users u
+                WHERE u.deleted_at IS NOT NULL
+                  AND NOT EXISTS (SELECT 1 FROM auth.user_purges p WHERE p.user_id = u.user_id)
+                ORDER BY u.deleted_at
+                LIMIT :limit
+            """
+                ),
+                {"limit": limit},
+            )
+            .mappings()
+            .all()
+        )
+        purges = (
+            conn.execute(
+                text(
+                    "SELECT * FROM auth.user_purges "
+                    "ORDER BY finished_at IS NULL DESC, deleted_at DESC LIMIT :limit"
+                ),
+                {"limit": limit},
+            )
+            .mappings()
+            .all()
+        )
+    return FastJSONResponse(
+        {"queued": [dict(r) for r in queued], "purges": [dict(r) for r in purges]}
+    )
@@ -0,0 +1,165 @@
+# routers/analytics_router.py
+import time
+from datetime import date
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from sqlalchemy.exc import SQLAlchemyError
+
+from core.config import VISIT_ANALYTICS_HOURLY_MAX_DAYS, VISIT_ANALYTICS_MAX_DAYS
+from core import disconnect
+from core.timing import TimedRoute
+from utils import visit_analytics, visit_sketches
+from utils.fastjson import FastJSONResponse
+
+router = APIRouter(
+    route_class=TimedRoute,
+    tags=["analytics"],
+    responses={404: {"description": "Not Found"}},
+)
+
+
+# ----------------- Аналитика цен каталога -----------------
+@router.get("/catalog/analytics")
+def catalog_analytics(company_id: Optional[list[int]] = Query(None)):
+    """
+    Ценовая аналитика по catalog.cars из снапшота в памяти (см. utils/catalog_snapshot).
+    company_id (можно несколько раз) ограничивает выборку набором фирм.
+    Возвращает: по фирмам min/max/mean/median, перцентили цены (p5..p95),
+    гистограмму по годам со средней ценой на год.
+    """
+    # numpy грузится здесь (или при прогреве), а не при импорте приложения
+    from utils.catalog_snapshot import get_snapshot
+
+    snap = get_snapshot()
+    t0 = time.perf_counter()
+    ids = sorted(set(company_id)) if company_id else None
+    body = {
+        "cars": len(snap),
+        "snapshot_age_sec": round(time.monotonic() - snap.loaded_at, 3),
+        "companies": snap.company_stats(ids),
+        "percentiles": snap.percentiles(ids),
+        "years": snap.year_stats(ids),
+    }
+    body["compute_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+    return FastJSONResponse(body)
+
+
+# ----------------- Аналитика посещений -----------------
+# Окно — дни UTC [start, end] включительно (ГГГГ-ММ-ДД); по умолчанию — последние дни
+# до сегодня. Расчёт и кеш — utils/visit_analytics.py. Требует авторизации.
+def _require_login(request: Request) -> None:
+    if not request.session.get("user_id"):
+        raise HTTPException(status_code=401, detail="Не авторизован")
+
+
+def _analytics(fn, *args) -> FastJSONResponse:
+    try:
+        return FastJSONResponse(fn(*args))
+    except SQLAlchemyError as e:
+        if disconnect.disconnected():
+            raise  # отмена при обрыве — 499 в DisconnectMiddleware, не отказ БД
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+
+
+@router.get("/visits/analytics/top-pages")
+def visits_top_pages(
+    request: Request,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = Query(10, ge=1, le=100),
+):
+    """Самые посещаемые страницы за окно (по умолчанию 30 дней): page, visits."""
+    _require_login(request)
+    start, end = visit_analytics.window(start, end, 30, VISIT_ANALYTICS_MAX_DAYS)
+    return _analytics(visit_analytics.top_pages, start, end, limit)
+
+
+@router.get("/visits/analytics/series")
+def visits_series(
+    request: Request,
+    page: Optional[str] = Query(None, max_length=100),
+    bucket: Literal["hour", "day"] = "day",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+):
+    """
+    Ряд visits/visitors по интервалам bucket (пустые — нули).
+    day — по дневным итогам страницы (page обязателен, окно до VISIT_ANALYTICS_MAX_DAYS,
+    по умолчанию 90 дней); hour — по сырым визитам (page не обязателен, окно до
+    VISIT_ANALYTICS_HOURLY_MAX_DAYS, по умолчанию сегодня).
+    """
+    _require_login(request)
+    if bucket == "day":
+        if page is None:
+            raise HTTPException(
+                status_code=400, detail="Для дневного ряда нужен параметр page"
+            )
+        start, end = visit_analytics.window(start, end, 90, VISIT_ANALYTICS_MAX_DAYS)
+        return _analytics(visit_analytics.daily_series, page, start, end)
+    start, end = visit_analytics.window(start, end, 1, VISIT_ANALYTICS_HOURLY_MAX_DAYS)
+    return _analytics(visit_analytics.hourly_series, page, start, end)
+
+
+@router.get("/visits/analytics/unique")
+def visits_unique(
+    request: Request,
+    page: Optional[str] = Query(None, max_length=100),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+):
+    """Различные посетители за окно (по умолчанию 30 дней), page не задан — все страницы."""
+    _require_login(request)
+    start, end = visit_analytics.window(start, end, 30, VISIT_ANALYTICS_MAX_DAYS)
+    return _analytics(visit_analytics.unique_visitors, page, start, end)
+
+
+@router.get("/visits/analytics/recency")
+def visits_recency(
+    request: Request,
+    login: Optional[str] = Query(None, max_length=100),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+):
+    """
+    Давность посещений пользователя login (по умолчанию — текущего) по страницам:
+    last_visit_at, days_since, active_days и visits за окно (по умолчанию 90 дней).
+    """
+    _require_login(request)
+    login = login or request.session.get("login")
+    start, end = visit_analytics.window(start, end, 90, VISIT_ANALYTICS_MAX_DAYS)
+    return _analytics(visit_analytics.user_recency, login, start, end)
+
+
+# ----------------- Приближённые оценки (HLL / Count-Min) -----------------
+# Без запросов к визитам: слияние сохранённых скетчей по дням окна (utils/visit_sketches.py).
+@router.get("/visits/approx/unique")
+def visits_approx_unique(
+    request: Request,
+    page: Optional[str] = Query(None, max_length=100),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+):
+    """
+    Оценка различных посетителей за окно (по умолчанию 30 дней; page не задан —
+    все страницы): стандартная ошибка ≈ 0.81%, ci95 — интервал ±2 ошибки.
+    """
+    _require_login(request)
+    start, end = visit_analytics.window(start, end, 30, VISIT_ANALYTICS_MAX_DAYS)
+    return _analytics(visit_sketches.unique, page, start, end)
+
+
+@router.get("/visits/approx/top-pages")
+def visits_approx_top_pages(
+    request: Request,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = Query(10, ge=1, le=100),
+):
+    """
+    Оценка топа страниц за окно (по умолчанию 30 дней): visits не меньше истинного
+    и больше не более чем на error_bound (≈ 0.13% всех визитов) с вероятностью confidence.
+    """
+    _require_login(request)
+    start, end = visit_analytics.window(start, end, 30, VISIT_ANALYTICS_MAX_DAYS)
+    return _analytics(visit_sketches.top_pages, start, end, limit)
@@ -1,11 +1,14 @@
 # routers/auth_router.py
 from fastapi import APIRouter, HTTPException, Request, Form
 from sqlalchemy import text
+from core.timing import TimedRoute
 from db.database import engine
 
 from utils.passwords import verify_md5_with_salt
 
-router = APIRouter(tags=["auth"], responses={404: {"description": "Not Found"}})
+router = APIRouter(
+    route_class=TimedRoute, tags=["auth"], responses={404: {"description": "Not Found"}}
+)
 
 
 @router.post("/login")
@@ -16,7 +19,8 @@ def login(request: Request, login: str = Form(...), password: str = Form(...)):
         row = (
             conn.execute(
                 text(
-                    "SELECT user_id, login, salt, password_hash, last_name, first_name FROM auth.users WHERE login = :login"
+                    "SELECT user_id, login, salt, password_hash, last_name, first_name "
+                    "FROM auth.users WHERE login = :login AND deleted_at IS NULL"
                 ),
                 {"login": login},
             )
@@ -24,10 +28,9 @@ def login(request: Request, login: str = Form(...), password: str = Form(...)):
             .first()
         )
 
-        salt = row["salt"]
-        expected = row["password_hash"]
-
-        if not row or not verify_md5_with_salt(password, salt, expected):
+        if not row or not verify_md5_with_salt(
+            password, row["salt"], row["password_hash"]
+        ):
             raise HTTPException(status_code=401, detail="Неверный логин/пароль")
 
         # Успешная авторизация: сохраняем в сессии
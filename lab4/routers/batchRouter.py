@@ -0,0 +1,252 @@
+# routers/batch_router.py
+"""
+POST /api/batch — несколько операций над пользователями, ролями и корзиной
+за один HTTP-запрос, на одном соединении и в одной транзакции (один COMMIT).
+
+Тело:
+  {"atomic": true, "ops": [
+      {"method": "PUT", "path": "/api/users/5", "body": {"first_name": "Иван"},
+       "if_match": "3"},
+      {"method": "POST", "path": "/api/users/5/roles", "body": {"role_id": 2}},
+      {"method": "DELETE", "path": "/api/users/5/roles/3"}
+  ]}
+
+Операции выполняются по порядку теми же функциями, что и одиночные маршруты
+(_update_user, _grant_role, ...), поэтому ответы и ошибки совпадают.
+atomic=true (по умолчанию) — всё или ничего: первая ошибка откатывает
+транзакцию, остальные операции не выполняются (424), код ответа — код ошибки.
+atomic=false — каждая операция в своей точке сохранения (SAVEPOINT): ошибочная
+откатывается одна, успешные фиксируются общим COMMIT, код ответа 200.
+Изменения корзины сохраняются в сессию только после COMMIT.
+Если среди операций есть изменения пользователей/ролей — нужна роль admin.
+"""
+
+import json
+import re
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from core.rbac import invalidate, require_admin
+from core.timing import TimedRoute
+from db.database import engine
+from routers.cartRouter import _cart_add, _get_cart_set, _save_cart_set
+from routers.roleRouter import (
+    RoleCreate,
+    RoleGrant,
+    RoleUpdate,
+    _create_role,
+    _delete_role,
+    _grant_role,
+    _revoke_role,
+    _update_role,
+)
+from routers.userRouter import (
+    UserCreate,
+    UserUpdate,
+    _create_user,
+    _delete_user,
+    _update_user,
+)
+from utils import role_registry
+from utils.etag import parse_if_match
+from utils.fastjson import FastJSONResponse
+
+router = APIRouter(
+    route_class=TimedRoute,
+    tags=["batch"],
+    responses={404: {"description": "Not Found"}},
+)
+
+BATCH_MAX_OPS = 100
+
+
+# ----------------- Модели -----------------
+class BatchOp(BaseModel):
+    method: str = Field(..., min_length=1, max_length=10)
+    path: str = Field(..., min_length=1, max_length=200)
+    body: Optional[dict] = None
+    if_match: Optional[str] = None  # как заголовок If-Match у PUT/DELETE
+
+
+class BatchRequest(BaseModel):
+    atomic: bool = True
+    ops: list[BatchOp] = Field(..., min_length=1, max_length=BATCH_MAX_OPS)
+
+
+# ----------------- Таблица операций -----------------
+class _Ctx:
+    """Общее для операций пакета: соединение, корзина сессии, что перечитать."""
+
+    __slots__ = ("conn", "cart", "roles_changed", "grants_changed")
+
+    def __init__(self, conn, cart: set):
+        self.conn = conn
+        self.cart = cart
+        self.roles_changed = False
+        # user_id: сбросить кеш ролей после COMMIT
+        self.grants_changed: set[int] = set()
+
+
+def _op_create_user(ctx: _Ctx, body: dict, version) -> dict:
+    return _create_user(ctx.conn, UserCreate.model_validate(body))
+
+
+def _op_update_user(ctx: _Ctx, body: dict, version, user_id: int) -> dict:
+    return _update_user(ctx.conn, user_id, UserUpdate.model_validate(body), version)
+
+
+def _op_delete_user(ctx: _Ctx, body: dict, version, user_id: int) -> dict:
+    out = _delete_user(ctx.conn, user_id, version)
+    ctx.grants_changed.add(user_id)
+    return out
+
+
+def _op_grant_role(ctx: _Ctx, body: dict, version, user_id: int) -> dict:
+    out = _grant_role(ctx.conn, user_id, RoleGrant.model_validate(body).role_id)
+    ctx.grants_changed.add(user_id)
+    return out
+
+
+def _op_revoke_role(ctx: _Ctx, body: dict, version, user_id: int, role_id: int) -> dict:
+    out = _revoke_role(ctx.conn, user_id, role_id)
+    ctx.grants_changed.add(user_id)
+    return out
+
+
+def _op_create_role(ctx: _Ctx, body: dict, version) -> dict:
+    out = _create_role(ctx.conn, RoleCreate.model_validate(body))
+    ctx.roles_changed = True
+    return out
+
+
+def _op_update_role(ctx: _Ctx, body: dict, version, role_id: int) -> dict:
+    out = _update_role(ctx.conn, role_id, RoleUpdate.model_validate(body), version)
+    ctx.roles_changed = True
+    return out
+
+
+def _op_delete_role(ctx: _Ctx, body: dict, version, role_id: int) -> dict:
+    out = _delete_role(ctx.conn, role_id, version)
+    ctx.roles_changed = True
+    return out
+
+
+def _op_cart_add(ctx: _Ctx, body: dict, version) -> dict:
+    return _cart_add(ctx.conn, ctx.cart, body)
+
+
+def _op_cart_clear(ctx: _Ctx, body: dict, version) -> dict:
+    ctx.cart.clear()
+    return {"status": "ok", "message": "Корзина очищена"}
+
+
+# (метод, шаблон пути, нужен admin, код успеха, fn(ctx, body, версия из if_match, *id из пути))
+OPS = [
+    ("POST", r"/api/users", True, 201, _op_create_user),
+    ("PUT", r"/api/users/(\d+)", True, 200, _op_update_user),
+    ("DELETE", r"/api/users/(\d+)", True, 200, _op_delete_user),
+    ("POST", r"/api/users/(\d+)/roles", True, 201, _op_grant_role),
+    ("DELETE", r"/api/users/(\d+)/roles/(\d+)", True, 200, _op_revoke_role),
+    ("POST", r"/api/roles", True, 201, _op_create_role),
+    ("PUT", r"/api/roles/(\d+)", True, 200, _op_update_role),
+    ("DELETE", r"/api/roles/(\d+)", True, 200, _op_delete_role),
+    ("POST", r"/api/cart/add", False, 200, _op_cart_add),
+    ("POST", r"/api/cart/clear", False, 200, _op_cart_clear),
+]
+_OPS = [(m, re.compile(p + r"\Z"), admin, code, fn) for m, p, admin, code, fn in OPS]
+
+
+def _resolve(op: BatchOp):
+    method = op.method.upper()
+    for m, rx, admin, code, fn in _OPS:
+        match = rx.match(op.path)
+        if m == method and match:
+            ids = [int(g) for g in match.groups()]
+            if any(i < 1 for i in ids):
+                return None
+            return admin, code, fn, ids
+    return None
+
+
+def _run_op(ctx: _Ctx, index: int, op: BatchOp, resolved) -> dict:
+    """Выполнить операцию; исключения разбирает вызывающий (batch)."""
+    _, code, fn, ids = resolved
+    out = fn(ctx, op.body or {}, parse_if_match(op.if_match), *ids)
+    return {"index": index, "status": code, "body": out}
+
+
+def _error(index: int, status: int, detail) -> dict:
+    return {"index": index, "status": status, "detail": detail}
+
+
+# ----------------- Маршрут -----------------
+@router.post("/batch")
+def batch(payload: BatchRequest, request: Request):
+    resolved = [_resolve(op) for op in payload.ops]
+    bad = [i for i, r in enumerate(resolved) if r is None]
+    if bad:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестные операции: {', '.join(map(str, bad))}",
+        )
+    if any(r[0] for r in resolved):
+        require_admin(request)  # 401/403 на весь пакет, до обращения к БД
+
+    cart = _get_cart_set(request)
+    cart_before = set(cart)
+    results: list[dict] = []
+    failed: Optional[dict] = None
+
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SET search_path TO auth, public"))
+            ctx = _Ctx(conn, cart)
+            for i, (op, r) in enumerate(zip(payload.ops, resolved)):
+                if failed is not None and payload.atomic:
+                    results.append(
+                        _error(
+                            i, 424, f"Не выполнена: ошибка в операции {failed['index']}"
+                        )
+                    )
+                    continue
+                savepoint = None if payload.atomic else conn.begin_nested()
+                try:
+                    results.append(_run_op(ctx, i, op, r))
+                    if savepoint is not None:
+                        savepoint.commit()
+                    continue
+                except HTTPException as e:
+                    res = _error(i, e.status_code, e.detail)
+                except ValidationError as e:
+                    res = _error(i, 422, json.loads(e.json(include_url=False)))
+                except SQLAlchemyError as e:
+                    res = _error(i, 500, f"DB error: {e}")
+                if savepoint is not None:
+                    savepoint.rollback()
+                results.append(res)
+                failed = failed or res
+
+            committed = failed is None or not payload.atomic
+            if committed:
+                conn.commit()
+            else:
+                conn.rollback()
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+
+    if committed:
+        for user_id in ctx.grants_changed:
+            invalidate(user_id)
+        if ctx.roles_changed:
+            role_registry.refresh()
+        if cart != cart_before:
+            _save_cart_set(request, cart)
+
+    status = failed["status"] if failed is not None and payload.atomic else 200
+    return FastJSONResponse(
+        {"committed": committed, "results": results}, status_code=status
+    )
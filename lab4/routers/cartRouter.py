@@ -1,9 +1,12 @@
 # routers/cart_router.py
 from fastapi import APIRouter, Request, HTTPException, Body
 from sqlalchemy import text
+from core.timing import TimedRoute
 from db.database import engine
 
-router = APIRouter(tags=["cart"], responses={404: {"description": "Not Found"}})
+router = APIRouter(
+    route_class=TimedRoute, tags=["cart"], responses={404: {"description": "Not Found"}}
+)
 
 
 # --- Вспомог: получить cart из сессии как set of ints ---
@@ -85,12 +88,8 @@ def company_cars(company_id: int, request: Request):
 
 
 # ----------------- Добавление автомобиля в корзину (POST) -----------------
-@router.post("/cart/add")
-def cart_add(request: Request, payload: dict = Body(...)):
-    """
-    Ожидает JSON: {"car_id": <int>}
-    Добавляет car_id в request.session['cart'] (множество).
-    """
+def _cart_add(conn, cart: set, payload: dict) -> dict:
+    """Проверить car_id и добавить его в cart (множество из сессии)."""
     car_id = payload.get("car_id")
     if car_id is None:
         raise HTTPException(status_code=400, detail="car_id required")
@@ -100,23 +99,55 @@ def cart_add(request: Request, payload: dict = Body(...)):
         raise HTTPException(status_code=400, detail="car_id must be integer")
 
     # Проверим, что такой автомобиль есть
-    with engine.connect() as conn:
-        conn.execute(text("SET search_path TO catalog, public"))
-        row = conn.execute(
-            text("SELECT car_id FROM catalog.cars WHERE car_id = :cid"), {"cid": car_id}
-        ).scalar_one_or_none()
-        if row is None:
-            raise HTTPException(status_code=404, detail="Автомобиль не найден")
+    row = conn.execute(
+        text("SELECT car_id FROM catalog.cars WHERE car_id = :cid"), {"cid": car_id}
+    ).scalar_one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Автомобиль не найден")
 
-    cart = _get_cart_set(request)
     if car_id in cart:
         return {"status": "ok", "message": "Уже в корзине", "cart_count": len(cart)}
     cart.add(car_id)
-    _save_cart_set(request, cart)
     return {"status": "ok", "message": "Добавлено в заказ", "cart_count": len(cart)}
 
 
+@router.post("/cart/add")
+def cart_add(request: Request, payload: dict = Body(...)):
+    """
+    Ожидает JSON: {"car_id": <int>}
+    Добавляет car_id в request.session['cart'] (множество).
+    """
+    cart = _get_cart_set(request)
+    before = len(cart)
+    with engine.connect() as conn:
+        conn.execute(text("SET search_path TO catalog, public"))
+        out = _cart_add(conn, cart, payload)
+    if len(cart) != before:
+        _save_cart_set(request, cart)
+    return out
+
+
 # ----------------- Просмотр корзины -----------------
+def _cart_items(rows):
+    """Строки корзины -> (items, сумма цен)."""
+    items = []
+    total = 0.0
+    for r in rows:
+        price = float(r["price"]) if r.get("price") is not None else 0.0
+        items.append(
+            {
+                "car_id": r["car_id"],
+                "company_id": r["company_id"],
+                "company_name": r["company_name"],
+                "model": r["model"],
+                "year": r.get("year"),
+                "price": price,
+            }
+        )
+        total += price
+    return items, total
+
+
 @router.get("/cart")
 def cart_view(request: Request):
     cart = _get_cart_set(request)
@@ -142,21 +173,7 @@ def cart_view(request: Request):
             .all()
         )
 
-    items = []
-    total = 0.0
-    for r in rows:
-        price = float(r["price"]) if r.get("price") is not None else 0.0
-        items.append(
-            {
-                "car_id": r["car_id"],
-                "company_id": r["company_id"],
-                "company_name": r["company_name"],
-                "model": r["model"],
-                "year": r.get("year"),
-                "price": price,
-            }
-        )
-        total += price
+    items, total = _cart_items(rows)
     return {"items": items, "total": total, "count": len(items)}
 
 
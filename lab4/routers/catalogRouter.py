@@ -0,0 +1,168 @@
+# routers/catalog_router.py
+import base64
+import json
+from decimal import Decimal
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from sqlalchemy import text
+
+from core.timing import TimedRoute
+from db.database import engine
+from utils.fastjson import FastJSONResponse
+
+router = APIRouter(
+    route_class=TimedRoute,
+    tags=["catalog"],
+    responses={404: {"description": "Not Found"}},
+)
+
+
+# ----------------- Поиск автомобилей -----------------
+# Сортировка: колонка + keyset по (колонка, car_id). Индексы — sql/migrate_001_cars_search.sql
+CARS_ALLOWED_ORDER = {
+    "id": "c.car_id",
+    "price": "c.price",
+    "year": "c.year",
+}
+CARS_ALLOWED_DIR = {"asc": "ASC", "desc": "DESC"}
+
+
+def _encode_cursor(order: str, direction: str, key, car_id: int) -> str:
+    # Decimal (NUMERIC) храним строкой, чтобы не терять точность;
+    # order и direction — курсор годится только для той сортировки, для которой выдан
+    if isinstance(key, Decimal):
+        key = str(key)
+    raw = json.dumps([order, direction, key, car_id], separators=(",", ":"))
+    raw = raw.encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, order: str, direction: str):
+    """(ключ сортировки нужного типа, car_id); чужой или испорченный курсор — 400."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        c_order, c_direction, key, car_id = json.loads(raw)
+        if c_order != order or c_direction != direction or type(car_id) is not int:
+            raise ValueError(cursor)
+        if order == "price":
+            key = Decimal(key)
+            if not key.is_finite():
+                raise ValueError(cursor)
+        elif order == "year" and type(key) is not int:
+            raise ValueError(cursor)
+        return key, car_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Некорректный cursor")
+
+
+def _like_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@router.get("/cars/search")
+def cars_search(
+    # Decimal, а не float: параметр float8 сравнивался бы с price как double
+    # precision — мимо индексов по NUMERIC-столбцу
+    price_min: Optional[Decimal] = Query(None, ge=0),
+    price_max: Optional[Decimal] = Query(None, ge=0),
+    year_min: Optional[int] = Query(None),
+    year_max: Optional[int] = Query(None),
+    company_id: Optional[list[int]] = Query(None),
+    model: Optional[str] = Query(None, max_length=200),
+    order: str = Query("id"),
+    direction: str = Query("asc"),
+    limit: int = Query(25, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+):
+    """
+    Поиск автомобилей по всем фирмам: диапазоны цены/года, набор фирм (company_id
+    можно передать несколько раз), подстрока модели, сортировка order=(id|price|year)
+    и direction=(asc|desc).
+    Пагинация keyset: в ответе next_cursor, который передаётся в следующий запрос.
+    При сортировке по price/year автомобили без значения этого поля не выводятся.
+    """
+    order = order.lower()
+    if order not in CARS_ALLOWED_ORDER:
+        order = "id"
+    order_col = CARS_ALLOWED_ORDER[order]
+    direction = direction.lower()
+    if direction not in CARS_ALLOWED_DIR:
+        direction = "asc"
+    dir_sql = CARS_ALLOWED_DIR[direction]
+
+    where = []
+    params = {"limit": limit + 1}
+    if price_min is not None:
+        where.append("c.price >= :price_min")
+        params["price_min"] = price_min
+    if price_max is not None:
+        where.append("c.price <= :price_max")
+        params["price_max"] = price_max
+    if year_min is not None:
+        where.append("c.year >= :year_min")
+        params["year_min"] = year_min
+    if year_max is not None:
+        where.append("c.year <= :year_max")
+        params["year_max"] = year_max
+    if company_id:
+        where.append("c.company_id = ANY(:company_ids)")
+        params["company_ids"] = list(set(company_id))
+    model = (model or "").strip()
+    if model:
+        where.append("c.model ILIKE :model")
+        params["model"] = f"%{_like_escape(model)}%"
+
+    if order_col != "c.car_id":
+        where.append(f"{order_col} IS NOT NULL")
+
+    if cursor:
+        key, last_id = _decode_cursor(cursor, order, direction)
+        cmp = ">" if dir_sql == "ASC" else "<"
+        if order_col == "c.car_id":
+            where.append(f"c.car_id {cmp} :k_id")
+        else:
+            # сравнение кортежей использует индекс (колонка, car_id)
+            where.append(f"({order_col}, c.car_id) {cmp} (:k_val, :k_id)")
+            params["k_val"] = key
+        params["k_id"] = last_id
+
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+    order_sql = (
+        f"c.car_id {dir_sql}"
+        if order_col == "c.car_id"
+        else f"{order_col} {dir_sql}, c.car_id {dir_sql}"
+    )
+
+    with engine.connect() as conn:
+        conn.execute(text("SET search_path TO catalog, public"))
+        rows = (
+            conn.execute(
+                text(
+                    f"""
+                SELECT c.car_id, c.model, c.year, c.price,
+                       c.company_id, comp.name AS company_name
+                FROM catalog.cars c
+                JOIN catalog.companies comp ON comp.company_id = c.company_id
+                {where_sql}
+                ORDER BY {order_sql}
+                LIMIT :limit
+            """
+                ),
+                params,
+            )
+            .mappings()
+            .all()
+        )
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        key = last["car_id"] if order_col == "c.car_id" else last[order]
+        next_cursor = _encode_cursor(order, direction, key, last["car_id"])
+
+    return FastJSONResponse(
+        {"items": [dict(r) for r in rows], "next_cursor": next_cursor}
+    )
@@ -0,0 +1,21 @@
+# routers/health_router.py
+from fastapi import APIRouter
+
+from core import warmup
+from core.timing import TimedRoute
+from utils.fastjson import FastJSONResponse
+
+router = APIRouter(route_class=TimedRoute, tags=["health"])
+
+
+@router.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness: процесс отвечает. async — не ждёт очереди threadpool и БД."""
+    return FastJSONResponse({"status": "ok"})
+
+
+@router.get("/readyz", include_in_schema=False)
+def readyz():
+    """Readiness: прогрев завершён и БД отвечает (проверка кешируется)."""
+    ok, body = warmup.readiness()
+    return FastJSONResponse(body, status_code=200 if ok else 503)
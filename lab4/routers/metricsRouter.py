@@ -0,0 +1,16 @@
+# routers/metrics_router.py
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from core import metrics
+from core.timing import TimedRoute
+
+router = APIRouter(route_class=TimedRoute, tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics_page():
+    """Метрики всех воркеров в текстовом формате Prometheus."""
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
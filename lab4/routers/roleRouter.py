@@ -1,13 +1,22 @@
-from fastapi import APIRouter, HTTPException, Path, Request
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Request
 from datetime import datetime
 from typing import Optional
 from pydantic import BaseModel, Field
 from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
-from db.database import engine
+from core.rbac import GRANTS_NOTIFY, invalidate, require_admin
+from core.timing import TimedRoute
+from db.database import autocommit, engine
+from utils import role_registry
+from utils.etag import check, etag, parse_if_match, versioned
+from utils.fastjson import FastJSONResponse
 
-router = APIRouter(tags=["roles"], responses={404: {"description": "Not Found"}})
+router = APIRouter(
+    route_class=TimedRoute,
+    tags=["roles"],
+    responses={404: {"description": "Not Found"}},
+)
 
 
 # ----------------- Модели ролей -----------------
@@ -16,6 +25,7 @@ class RoleOut(BaseModel):
     name: str
     is_enabled: bool
     created_at: Optional[datetime] = None
+    row_version: Optional[int] = None
 
 
 class RoleCreate(BaseModel):
@@ -28,15 +38,24 @@ class RoleUpdate(BaseModel):
     is_enabled: Optional[bool] = None
 
 
-def _row_to_roleout(row) -> RoleOut:
-    return RoleOut(
-        role_id=row["role_id"],
-        name=row["name"],  # SELECT ... AS name
-        is_enabled=bool(row["is_enabled"]),
-        created_at=row.get("created_at"),
+ROLE_OUT_FIELDS = tuple(RoleOut.model_fields)
+
+
+def _row_to_roleout(row) -> dict:
+    # SELECT ... AS name; строка доверенная — без повторной валидации Pydantic
+    return {f: row.get(f) for f in ROLE_OUT_FIELDS}
+
+
+def _role_response(out: dict, status_code: int = 200) -> FastJSONResponse:
+    return FastJSONResponse(
+        out, status_code=status_code, headers={"ETag": etag(out["row_version"])}
     )
 
 
+def _by_name(r):
+    return r["name"]
+
+
 # ---- модель для выдачи роли пользователю
 class RoleGrant(BaseModel):
     role_id: int = Field(..., ge=1)
@@ -45,93 +64,129 @@ class RoleGrant(BaseModel):
 # ----------------- Управление ролями пользователя -----------------
 @router.get("/users/{user_id}/roles")
 def user_roles(user_id: int = Path(..., ge=1)):
-    """Получить роли, назначенные пользователю."""
+    """Получить роли, назначенные пользователю (удалённый пользователь — 404)."""
     with engine.connect() as conn:
         conn.execute(text("SET search_path TO auth, public"))
-        rows = (
-            conn.execute(
-                text(
-                    """
-                SELECT ur.role_id, r.role_name AS name, r.is_enabled
-                FROM auth.user_roles ur
-                JOIN auth.roles r ON r.role_id = ur.role_id
-                WHERE ur.user_id = :uid
-                ORDER BY r.role_name
+        role_ids = conn.execute(
+            text(
+                """
+                SELECT ARRAY(SELECT role_id FROM auth.user_roles ur
+                             WHERE ur.user_id = u.user_id)
+                FROM auth.users u
+                WHERE u.user_id = :uid AND u.deleted_at IS NULL
             """
-                ),
-                {"uid": user_id},
-            )
-            .mappings()
-            .all()
-        )
+            ),
+            {"uid": user_id},
+        ).scalar()
+    if role_ids is None:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    # имена и статусы — из реестра ролей, без JOIN с auth.roles
+    by_id = role_registry.get().by_id
+    roles = sorted((by_id[rid] for rid in role_ids if rid in by_id), key=_by_name)
     return {
         "items": [
-            {
-                "role_id": r["role_id"],
-                "name": r["name"],
-                "is_enabled": bool(r["is_enabled"]),
-            }
-            for r in rows
+            {"role_id": r["role_id"], "name": r["name"], "is_enabled": r["is_enabled"]}
+            for r in roles
         ]
     }
 
 
-@router.post("/users/{user_id}/roles", status_code=201)
-def grant_role(user_id: int = Path(..., ge=1), payload: RoleGrant = ...):
-    """Выдать роль пользователю (id роли в теле)."""
+def _grant_role(conn, user_id: int, role_id: int) -> dict:
+    if role_id not in role_registry.get().by_id:
+        raise HTTPException(status_code=404, detail="Роль не найдена")
+
+    # Одна команда: вставка только для живого пользователя (удалённый — «не найден»;
+    # FOR SHARE не даёт удалить его, пока вставка не завершится);
+    # ON CONFLICT DO NOTHING делает операцию идемпотентной (и без NOTIFY)
     try:
-        with engine.begin() as conn:
-            conn.execute(text("SET search_path TO auth, public"))
-            # Проверяем наличие пользователя и роли
-            if not conn.execute(
-                text("SELECT 1 FROM auth.users WHERE user_id=:uid"), {"uid": user_id}
-            ).first():
-                raise HTTPException(status_code=404, detail="Пользователь не найден")
-            if not conn.execute(
-                text("SELECT 1 FROM auth.roles WHERE role_id=:rid"),
-                {"rid": payload.role_id},
-            ).first():
-                raise HTTPException(status_code=404, detail="Роль не найдена")
-
-            # ON CONFLICT DO NOTHING позволит делать операцию идемпотентной
-            conn.execute(
-                text(
-                    """
+        live = conn.execute(
+            text(
+                f"""
+                WITH u AS (
+                    SELECT user_id FROM auth.users
+                    WHERE user_id = :uid AND deleted_at IS NULL
+                    FOR SHARE
+                ),
+                ins AS (
                     INSERT INTO auth.user_roles (user_id, role_id)
-                    VALUES (:uid, :rid)
+                    SELECT user_id, :rid FROM u
                     ON CONFLICT DO NOTHING
-                """
-                ),
-                {"uid": user_id, "rid": payload.role_id},
-            )
-        return {"status": "ok"}
+                    RETURNING {GRANTS_NOTIFY}
+                )
+                SELECT EXISTS (SELECT 1 FROM u), (SELECT count(*) FROM ins)
+            """
+            ),
+            {"uid": user_id, "rid": role_id},
+        ).first()[0]
+    except IntegrityError:
+        # роль удалена другим воркером, а реестр ещё не перечитан
+        raise HTTPException(status_code=404, detail="Роль не найдена")
+    if not live:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    return {"status": "ok"}
+
+
+def _revoke_role(conn, user_id: int, role_id: int) -> dict:
+    row = conn.execute(
+        text(
+            "DELETE FROM auth.user_roles WHERE user_id=:uid AND role_id=:rid "
+            f"RETURNING {GRANTS_NOTIFY}"
+        ),
+        {"uid": user_id, "rid": role_id},
+    ).first()
+    if row is None:
+        raise HTTPException(
+            status_code=404, detail="Связь пользователь–роль не найдена"
+        )
+    return {"status": "ok"}
+
+
+@router.post(
+    "/users/{user_id}/roles", status_code=201, dependencies=[Depends(require_admin)]
+)
+def grant_role(user_id: int = Path(..., ge=1), payload: RoleGrant = ...):
+    """Выдать роль пользователю (id роли в теле)."""
+    try:
+        with autocommit() as conn:
+            out = _grant_role(conn, user_id, payload.role_id)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=f"DB error: {e}")
+    invalidate(user_id)  # после COMMIT: иначе промах кеша перечитал бы старые роли
+    return out
 
 
-@router.delete("/users/{user_id}/roles/{role_id}")
+@router.delete(
+    "/users/{user_id}/roles/{role_id}", dependencies=[Depends(require_admin)]
+)
 def revoke_role(user_id: int = Path(..., ge=1), role_id: int = Path(..., ge=1)):
     """Снять роль у пользователя."""
-    with engine.begin() as conn:
-        conn.execute(text("SET search_path TO auth, public"))
-        res = conn.execute(
-            text("DELETE FROM auth.user_roles WHERE user_id=:uid AND role_id=:rid"),
-            {"uid": user_id, "rid": role_id},
-        )
-        if res.rowcount == 0:
-            raise HTTPException(
-                status_code=404, detail="Связь пользователь–роль не найдена"
-            )
-    return {"status": "ok"}
+    with autocommit() as conn:
+        out = _revoke_role(conn, user_id, role_id)
+    invalidate(user_id)
+    return out
 
 
 # ----------------- Список ролей (до /{role_id}) -----------------
+# Справочник маленький — фильтрация/сортировка/пагинация по снапшоту реестра
 ROLES_ALLOWED_ORDER = {
-    "id": "r.role_id",
-    "name": "r.role_name",
-    "status": "r.is_enabled",
+    "id": lambda r: r["role_id"],
+    "name": _by_name,
+    "status": lambda r: (r["is_enabled"], r["role_id"]),
 }
-ROLES_ALLOWED_DIR = {"asc": "ASC", "desc": "DESC"}
+ROLES_ALLOWED_DIR = {"asc": False, "desc": True}
+
+
+def _select_roles(items, q: str, status: str, order: str, direction: str) -> list:
+    """Фильтр по подстроке имени и статусу + сортировка (без пагинации)."""
+    order_key = ROLES_ALLOWED_ORDER.get(order, ROLES_ALLOWED_ORDER["id"])
+    reverse = ROLES_ALLOWED_DIR.get(direction, False)
+    if q:
+        ql = q.lower()
+        items = [r for r in items if ql in r["name"].lower()]
+    if status in ("enabled", "disabled"):
+        st = status == "enabled"
+        items = [r for r in items if r["is_enabled"] == st]
+    return sorted(items, key=order_key, reverse=reverse)
 
 
 @router.get("/roles/list")
@@ -156,151 +211,58 @@ def roles_list(request: Request):
 
     offset = max(0, offset)
     limit = min(max(1, limit), 100)
-    order_by = ROLES_ALLOWED_ORDER.get(order, ROLES_ALLOWED_ORDER["id"])
-    dir_sql = ROLES_ALLOWED_DIR.get(direction, "ASC")
-
-    where_sql = "WHERE 1=1"
-    params_where = {}
-
-    if q:
-        where_sql += " AND (lower(r.role_name) LIKE :q)"
-        params_where["q"] = f"%{q.lower()}%"
-
-    if status in ("enabled", "disabled"):
-        where_sql += " AND r.is_enabled = :st"
-        params_where["st"] = status == "enabled"
-
-    with engine.connect() as conn:
-        conn.execute(text("SET search_path TO auth, public"))
-
-        total = conn.execute(
-            text(f"SELECT COUNT(*) FROM auth.roles r {where_sql}"),
-            params_where,
-        ).scalar_one()
-
-        params_paging = {**params_where, "limit": limit, "offset": offset}
-        rows = (
-            conn.execute(
-                text(
-                    f"""
-                SELECT
-                    r.role_id,
-                    r.role_name AS name,
-                    r.is_enabled,
-                    r.created_at
-                FROM auth.roles r
-                {where_sql}
-                ORDER BY {order_by} {dir_sql}
-                LIMIT :limit OFFSET :offset
-            """
-                ),
-                params_paging,
-            )
-            .mappings()
-            .all()
-        )
-
-    return {
-        "total": total,
-        "items": [
-            {
-                "role_id": r["role_id"],
-                "name": r["name"],
-                "is_enabled": bool(r["is_enabled"]),
-                "created_at": r["created_at"].isoformat() if r["created_at"] else None,
-            }
-            for r in rows
-        ],
-    }
+    items = _select_roles(role_registry.get().items, q, status, order, direction)
+    return FastJSONResponse(
+        {
+            "total": len(items),
+            "items": [dict(r) for r in items[offset : offset + limit]],
+        }
+    )
 
 
 # Полный справочник ролей для UI (селект)
 @router.get("/roles/all")
 def roles_all():
-    with engine.connect() as conn:
-        conn.execute(text("SET search_path TO auth, public"))
-        rows = (
-            conn.execute(
-                text(
-                    """
-                SELECT role_id, role_name AS name, is_enabled, created_at
-                FROM auth.roles
-                ORDER BY role_name ASC
-            """
-                )
-            )
-            .mappings()
-            .all()
-        )
-    return {
-        "items": [
-            {
-                "role_id": r["role_id"],
-                "name": r["name"],
-                "is_enabled": bool(r["is_enabled"]),
-                "created_at": r["created_at"].isoformat() if r["created_at"] else None,
-            }
-            for r in rows
-        ]
-    }
+    return FastJSONResponse({"items": [dict(r) for r in role_registry.get().items]})
 
 
-# ----------------- Создание роли (до /{role_id}) -----------------
-@router.post("/roles", response_model=RoleOut, status_code=201)
-def create_role(payload: RoleCreate):
-    try:
-        with engine.begin() as conn:
-            conn.execute(text("SET search_path TO auth, public"))
-            row = (
-                conn.execute(
-                    text(
-                        """
-                    INSERT INTO auth.roles (role_name, is_enabled, created_at)
-                    VALUES (:name, :is_enabled, NOW())
-                    RETURNING role_id, role_name AS name, is_enabled, created_at
-                """
-                    ),
-                    {"name": payload.name, "is_enabled": payload.is_enabled},
-                )
-                .mappings()
-                .first()
-            )
-            return _row_to_roleout(row)
-    except IntegrityError:
-        raise HTTPException(
-            status_code=409, detail="Роль с таким именем уже существует"
-        )
-    except SQLAlchemyError as e:
-        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+# ----------------- Операции в транзакции conn (для обработчиков и /batch) -----------------
+# Каждая запись — одна команда; оповещение воркеров — в её RETURNING.
+# После COMMIT вызывающий делает role_registry.refresh()
+ROLE_RETURNING = (
+    "role_id, role_name AS name, is_enabled, created_at, row_version, "
+    + role_registry.NOTIFY
+)
 
 
-# ----------------- CRUD по конкретной роли -----------------
-@router.get("/roles/{role_id}", response_model=RoleOut)
-def get_role(role_id: int = Path(..., ge=1)):
-    with engine.connect() as conn:
-        conn.execute(text("SET search_path TO auth, public"))
+def _create_role(conn, payload: RoleCreate) -> dict:
+    try:
         row = (
             conn.execute(
                 text(
-                    """
-                SELECT role_id, role_name AS name, is_enabled, created_at
-                FROM auth.roles WHERE role_id = :rid
+                    f"""
+                INSERT INTO auth.roles (role_name, is_enabled, created_at)
+                VALUES (:name, :is_enabled, NOW())
+                RETURNING {ROLE_RETURNING}
             """
                 ),
-                {"rid": role_id},
+                {"name": payload.name, "is_enabled": payload.is_enabled},
             )
             .mappings()
             .first()
         )
-        if not row:
-            raise HTTPException(status_code=404, detail="Роль не найдена")
-        return _row_to_roleout(row)
+    except IntegrityError:
+        raise HTTPException(
+            status_code=409, detail="Роль с таким именем уже существует"
+        )
+    return _row_to_roleout(row)
 
 
-@router.put("/roles/{role_id}", response_model=RoleOut)
-def update_role(payload: RoleUpdate, role_id: int = Path(..., ge=1)):
+def _update_role(
+    conn, role_id: int, payload: RoleUpdate, version: Optional[list[int]] = None
+) -> dict:
     fields = []
-    params = {"rid": role_id}
+    params = {"rid": role_id, "ver": version}
     if payload.name is not None:
         fields.append("role_name = :name")
         params["name"] = payload.name
@@ -311,49 +273,91 @@ def update_role(payload: RoleUpdate, role_id: int = Path(..., ge=1)):
     if not fields:
         raise HTTPException(status_code=400, detail="Нет полей для обновления")
 
-    sql = f"UPDATE auth.roles SET {', '.join(fields)} WHERE role_id = :rid"
-
+    fields.append("row_version = row_version + 1")
+    sql = versioned(
+        f"UPDATE auth.roles SET {', '.join(fields)}",
+        "role_id = :rid",
+        ROLE_RETURNING,
+        "auth.roles",
+        version,
+    )
     try:
-        with engine.begin() as conn:
-            conn.execute(text("SET search_path TO auth, public"))
-            res = conn.execute(text(sql), params)
-            if res.rowcount == 0:
-                raise HTTPException(status_code=404, detail="Роль не найдена")
-            row = (
-                conn.execute(
-                    text(
-                        """
-                    SELECT role_id, role_name AS name, is_enabled, created_at
-                    FROM auth.roles WHERE role_id = :rid
-                """
-                    ),
-                    {"rid": role_id},
-                )
-                .mappings()
-                .first()
-            )
-            return _row_to_roleout(row)
+        row = conn.execute(text(sql), params).mappings().first()
     except IntegrityError:
         raise HTTPException(status_code=409, detail="Конфликт уникальности имени роли")
-    except SQLAlchemyError as e:
-        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+    return _row_to_roleout(check(row, "role_id", "Роль не найдена"))
 
 
-@router.delete("/roles/{role_id}")
-def delete_role(role_id: int = Path(..., ge=1)):
+def _delete_role(conn, role_id: int, version: Optional[list[int]] = None) -> dict:
+    sql = versioned(
+        "DELETE FROM auth.roles",
+        "role_id = :rid",
+        f"role_id, {role_registry.NOTIFY}",
+        "auth.roles",
+        version,
+    )
     try:
-        with engine.begin() as conn:
-            conn.execute(text("SET search_path TO auth, public"))
-            res = conn.execute(
-                text("DELETE FROM auth.roles WHERE role_id = :rid"), {"rid": role_id}
-            )
-            if res.rowcount == 0:
-                raise HTTPException(status_code=404, detail="Роль не найдена")
-        return {"status": "success", "deleted_role_id": role_id}
+        row = (
+            conn.execute(text(sql), {"rid": role_id, "ver": version}).mappings().first()
+        )
     except IntegrityError:
         # если есть связи в auth.user_roles и нет ON DELETE CASCADE
         raise HTTPException(
             status_code=409, detail="Нельзя удалить роль: есть связанные пользователи"
         )
+    check(row, "role_id", "Роль не найдена")
+    return {"status": "success", "deleted_role_id": role_id}
+
+
+# ----------------- Создание роли (до /{role_id}) -----------------
+@router.post(
+    "/roles",
+    response_model=RoleOut,
+    status_code=201,
+    dependencies=[Depends(require_admin)],
+)
+def create_role(payload: RoleCreate):
+    try:
+        with autocommit() as conn:
+            out = _create_role(conn, payload)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+    role_registry.refresh()
+    return _role_response(out, status_code=201)
+
+
+# ----------------- CRUD по конкретной роли -----------------
+@router.get("/roles/{role_id}", response_model=RoleOut)
+def get_role(role_id: int = Path(..., ge=1)):
+    row = role_registry.get().by_id.get(role_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="Роль не найдена")
+    return _role_response(_row_to_roleout(row))
+
+
+@router.put(
+    "/roles/{role_id}", response_model=RoleOut, dependencies=[Depends(require_admin)]
+)
+def update_role(
+    payload: RoleUpdate,
+    role_id: int = Path(..., ge=1),
+    if_match: Optional[str] = Header(None),
+):
+    try:
+        with autocommit() as conn:
+            out = _update_role(conn, role_id, payload, parse_if_match(if_match))
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+    role_registry.refresh()
+    return _role_response(out)
+
+
+@router.delete("/roles/{role_id}", dependencies=[Depends(require_admin)])
+def delete_role(role_id: int = Path(..., ge=1), if_match: Optional[str] = Header(None)):
+    try:
+        with autocommit() as conn:
+            out = _delete_role(conn, role_id, parse_if_match(if_match))
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=f"DB error: {e}")
+    role_registry.refresh()
+    return out
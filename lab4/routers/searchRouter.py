@@ -0,0 +1,139 @@
+# routers/search_router.py
+import re
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from sqlalchemy import text
+
+from core.rbac import effective_roles
+from core.timing import TimedRoute
+from db.database import engine
+from utils.fastjson import FastJSONResponse
+
+router = APIRouter(
+    route_class=TimedRoute,
+    tags=["search"],
+    responses={404: {"description": "Not Found"}},
+)
+
+
+# ----------------- Глобальный поиск -----------------
+# Подзапрос на каждый тип: id, title, subtitle, ссылка на связанный объект (ref_id),
+# rank; каждый сам упорядочен по рангу и ограничен :lim (limit + 1 — для has_more).
+# Условие search_tsv @@ (SELECT q FROM q) — по GIN-индексу search_tsv (миграция 007).
+# Ранг — по префиксному запросу q плюс по точному qx: gen_4 выше gen_40.
+_TYPE_SQL = {
+    "user": """
+        SELECT 'user' AS type, u.user_id AS id, u.login::text AS title,
+               u.last_name || ' ' || u.first_name || ', ' || u.email::text AS subtitle,
+               NULL::int AS ref_id, ts_rank(u.search_tsv, (SELECT q FROM q))
+               + ts_rank(u.search_tsv, (SELECT qx FROM q)) AS rank
+        FROM auth.users u
+        WHERE u.search_tsv @@ (SELECT q FROM q) AND u.deleted_at IS NULL
+        ORDER BY rank DESC, u.user_id
+        LIMIT :lim
+    """,
+    "company": """
+        SELECT 'company' AS type, co.company_id AS id, co.name::text AS title,
+               NULL::text AS subtitle, NULL::int AS ref_id,
+               ts_rank(co.search_tsv, (SELECT q FROM q))
+               + ts_rank(co.search_tsv, (SELECT qx FROM q)) AS rank
+        FROM catalog.companies co
+        WHERE co.search_tsv @@ (SELECT q FROM q)
+        ORDER BY rank DESC, co.company_id
+        LIMIT :lim
+    """,
+    "car": """
+        SELECT 'car' AS type, c.car_id AS id, c.model::text AS title,
+               concat_ws(', ', co.name, c.year::text) AS subtitle,
+               c.company_id AS ref_id, ts_rank(c.search_tsv, (SELECT q FROM q))
+               + ts_rank(c.search_tsv, (SELECT qx FROM q)) AS rank
+        FROM catalog.cars c
+        JOIN catalog.companies co ON co.company_id = c.company_id
+        WHERE c.search_tsv @@ (SELECT q FROM q)
+        ORDER BY rank DESC, c.car_id
+        LIMIT :lim
+    """,
+}
+# пользователи (с email) — только администраторам; каталог открыт всем
+_ADMIN_TYPES = {"user"}
+
+
+def _allowed_types(request: Request) -> set[str]:
+    user_id = request.session.get("user_id")
+    if user_id and "admin" in effective_roles(user_id):
+        return set(_TYPE_SQL)
+    return set(_TYPE_SQL) - _ADMIN_TYPES
+
+
+@router.get("/search")
+def search(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    types: Optional[str] = Query(None, description="user,company,car"),
+    limit: int = Query(5, ge=1, le=50),
+):
+    """
+    Поиск по пользователям, фирмам и автомобилям одним запросом к БД.
+    Слова q ищутся по префиксу ('ива пет' найдёт «Иванов Пётр»), все слова
+    обязательны. Текст разбивается на слова тем же парсером, что и документы
+    (to_tsvector 'simple'), — поэтому логин gen_42 и email ищутся так же, как хранятся.
+    types — через запятую (по умолчанию все доступные: user — только администратору);
+    limit — не больше limit результатов каждого типа.
+    Ответ: items — все найденные, по убыванию ранга (ts_rank, вес A у главного поля);
+    has_more — по типам, есть ли ещё результаты сверх limit.
+    """
+    allowed = _allowed_types(request)
+    if types is None:
+        wanted = [t for t in _TYPE_SQL if t in allowed]
+    else:
+        wanted = list(dict.fromkeys(t.strip() for t in types.split(",") if t.strip()))
+        unknown = [t for t in wanted if t not in _TYPE_SQL]
+        if unknown:
+            raise HTTPException(
+                status_code=400, detail=f"Неизвестный тип поиска: {', '.join(unknown)}"
+            )
+        if not wanted:
+            raise HTTPException(status_code=400, detail="Не указан тип поиска")
+        if any(t not in allowed for t in wanted):
+            if not request.session.get("user_id"):
+                raise HTTPException(status_code=401, detail="Не авторизован")
+            raise HTTPException(status_code=403, detail="Недостаточно прав")
+
+    has_more = {t: False for t in wanted}
+    # без букв и цифр запрос пустой — to_tsquery('') ничего не найдёт, в БД не идём
+    if not re.search(r"\w", q):
+        return FastJSONResponse({"q": q, "items": [], "has_more": has_more})
+
+    union = " UNION ALL ".join(f"({_TYPE_SQL[t]})" for t in wanted)
+    with engine.connect() as conn:
+        conn.execute(text("SET search_path TO auth, public"))
+        rows = (
+            conn.execute(
+                text(
+                    f"""
+                    WITH q AS (
+                        SELECT to_tsquery('simple', string_agg(
+                                   quote_literal(lexeme) || ':*', ' & ')) AS q,
+                               to_tsquery('simple', string_agg(
+                                   quote_literal(lexeme), ' & ')) AS qx
+                        FROM unnest(to_tsvector('simple', translate(:q, '@', ' ')))
+                    )
+                    SELECT type, id, title, subtitle, ref_id, rank FROM ({union}) r
+                    ORDER BY rank DESC, type, id
+                    """
+                ),
+                {"q": q, "lim": limit + 1},
+            )
+            .mappings()
+            .all()
+        )
+
+    items, counts = [], dict.fromkeys(wanted, 0)
+    for r in rows:
+        counts[r["type"]] += 1
+        if counts[r["type"]] > limit:
+            has_more[r["type"]] = True
+            continue
+        items.append({**r, "rank": round(r["rank"], 6)})
+    return FastJSONResponse({"q": q, "items": items, "has_more": has_more})
@@ -1,14 +1,24 @@
-from fastapi import APIRouter, HTTPException, Path, Request
-from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Query, Request
+from datetime import datetime
 from typing import Optional
 from pydantic import BaseModel, Field, EmailStr
 from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
-from db.database import engine
+from core import metrics
+from core.rbac import GRANTS_NOTIFY, invalidate, require_admin
+from core.timing import TimedRoute
+from db.database import autocommit, engine
+from utils import user_bloom
+from utils.etag import check, etag, parse_if_match, versioned
+from utils.fastjson import FastJSONResponse
 from utils.passwords import generate_salt, hash_md5_with_salt, verify_md5_with_salt
 
-router = APIRouter(tags=["users"], responses={404: {"description": "Not Found"}})
+router = APIRouter(
+    route_class=TimedRoute,
+    tags=["users"],
+    responses={404: {"description": "Not Found"}},
+)
 
 
 # ----------------- Модели пользователей -----------------
@@ -20,6 +30,7 @@ class UserOut(BaseModel):
     login: str
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
+    row_version: Optional[int] = None
 
 
 class UserUpdate(BaseModel):
@@ -38,19 +49,32 @@ class UserCreate(BaseModel):
     password: str = Field(..., min_length=1, max_length=200)  # в ЛР без хеширования
 
 
-def _row_to_userout(row) -> UserOut:
-    return UserOut(
-        user_id=row["user_id"],
-        last_name=row["last_name"],
-        first_name=row["first_name"],
-        email=row["email"],
-        login=row["login"],
-        created_at=row.get("created_at"),
-        updated_at=row.get("updated_at"),
+USER_OUT_FIELDS = tuple(UserOut.model_fields)
+
+
+def _row_to_userout(row) -> dict:
+    # Строка из БД уже соответствует схеме UserOut — собираем dict без валидации,
+    # а ответ отдаём через FastJSONResponse (response_model остаётся для OpenAPI).
+    return {f: row.get(f) for f in USER_OUT_FIELDS}
+
+
+def _user_response(out: dict, status_code: int = 200) -> FastJSONResponse:
+    return FastJSONResponse(
+        out, status_code=status_code, headers={"ETag": etag(out["row_version"])}
     )
 
 
 # ----------------- Список пользователей (до /{user_id}) -----------------
+def _row_to_list_item(r) -> dict:
+    return {
+        "user_id": r["user_id"],
+        "name": f'{r["last_name"]} {r["first_name"]}',
+        "login": r["login"],
+        "email": r["email"],
+        "created_at": r["created_at"],  # datetime сериализует orjson
+    }
+
+
 ALLOWED_ORDER = {
     "id": "u.user_id",
     "login": "u.login",
@@ -81,7 +105,7 @@ def users_list(request: Request):
     order_by = ALLOWED_ORDER.get(order, ALLOWED_ORDER["id"])
     dir_sql = ALLOWED_DIR.get(direction, "ASC")
 
-    where_sql = "WHERE 1=1"
+    where_sql = "WHERE u.deleted_at IS NULL"
     params_where = {}
     if q:
         where_sql += (
@@ -116,87 +140,123 @@ def users_list(request: Request):
             .all()
         )
 
-    return {
-        "total": total,
-        "items": [
-            {
-                "user_id": r["user_id"],
-                "name": f'{r["last_name"]} {r["first_name"]}',
-                "login": r["login"],
-                "email": r["email"],
-                "created_at": r["created_at"].isoformat() if r["created_at"] else None,
-            }
-            for r in rows
-        ],
-    }
+    return FastJSONResponse(
+        {
+            "total": total,
+            "items": [_row_to_list_item(r) for r in rows],
+        }
+    )
 
 
-# ----------------- Создание пользователя (до /{user_id}) -----------------
-@router.post("/users", response_model=UserOut, status_code=201)
-def create_user(payload: UserCreate):
-    salt = generate_salt()  # 8 символов по умолчанию
-    password_hash = hash_md5_with_salt(payload.password, salt)  # хешируем пароль
-
-    try:
-        with engine.begin() as conn:
+# ----------------- Доступность логина/email (до /{user_id}) -----------------
+AVAILABILITY_CHECKS = metrics.counter(
+    "user_availability_checks_total",
+    "Проверки доступности логина/email: result=bloom (свободно по фильтру), "
+    "db_free (ложное срабатывание фильтра), db_taken",
+    ("field", "result"),
+)
+
+
+@router.get("/users/availability", dependencies=[Depends(require_admin)])
+def users_availability(
+    login: Optional[str] = Query(None, max_length=100),
+    email: Optional[str] = Query(None, max_length=254),
+    exclude_user_id: Optional[int] = Query(None, ge=1),
+):
+    """
+    Свободны ли login / email (без учёта регистра). Отсутствующее в Bloom-фильтре
+    свободно без запроса к БД; остальное проверяется по уникальным индексам.
+    exclude_user_id — редактируемый пользователь: его собственные значения свободны.
+    """
+    checks = {
+        field: value.strip()
+        for field, value in (("login", login), ("email", email))
+        if value and value.strip()
+    }
+    if not checks:
+        raise HTTPException(status_code=400, detail="Укажите login или email")
+
+    out, maybe = {}, {}
+    for field, value in checks.items():
+        key = user_bloom.login_key if field == "login" else user_bloom.email_key
+        if user_bloom.might_contain(key(value)):
+            maybe[field] = value
+        else:
+            out[field] = {"value": value, "available": True, "source": "bloom"}
+            AVAILABILITY_CHECKS.inc((field, "bloom"))
+
+    if maybe:
+        # одна команда: по индексу на каждое поле (BitmapOr)
+        taken = ", ".join(f"coalesce(bool_or({f} = :{f}), false) AS {f}" for f in maybe)
+        where = " OR ".join(f"{f} = :{f}" for f in maybe)
+        params = dict(maybe)
+        if exclude_user_id is not None:
+            where = f"({where}) AND user_id <> :exclude"
+            params["exclude"] = exclude_user_id
+        with engine.connect() as conn:
             conn.execute(text("SET search_path TO auth, public"))
             row = (
                 conn.execute(
-                    text(
-                        """
-                    INSERT INTO auth.users (
-                        last_name, first_name, email, login, salt, password_hash, created_at, updated_at
-                    )
-                    VALUES (:last_name, :first_name, :email, :login, :salt, :password_hash, NOW(), NOW())
-                    RETURNING user_id, last_name, first_name, email, login, created_at, updated_at
-                """
-                    ),
-                    {
-                        "last_name": payload.last_name,
-                        "first_name": payload.first_name,
-                        "email": str(payload.email),
-                        "login": payload.login,
-                        "salt": salt,
-                        "password_hash": password_hash,
-                    },
+                    text(f"SELECT {taken} FROM auth.users WHERE {where}"), params
                 )
                 .mappings()
-                .first()
+                .one()
             )
-            return _row_to_userout(row)
-    except IntegrityError:
-        raise HTTPException(status_code=409, detail="Конфликт уникальности email/login")
-    except SQLAlchemyError as e:
-        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+        for field, value in maybe.items():
+            out[field] = {"value": value, "available": not row[field], "source": "db"}
+            AVAILABILITY_CHECKS.inc((field, "db_taken" if row[field] else "db_free"))
 
+    return FastJSONResponse(out)
 
-# ----------------- CRUD по пользователю -----------------
-@router.get("/users/{user_id}", response_model=UserOut)
-def get_user(user_id: int = Path(..., ge=1)):
-    with engine.connect() as conn:
-        conn.execute(text("SET search_path TO auth, public"))
+
+# ----------------- Операции в транзакции conn (для обработчиков и /batch) -----------------
+# Каждая запись — одна команда (RETURNING вместо повторного SELECT, NOTIFY — в RETURNING).
+# version — из If-Match: 412, если строку уже изменил кто-то другой.
+# Удалённые (deleted_at) пользователи для всех операций — «не найден».
+# Новые login/email — в Bloom-фильтр этого воркера и NOTIFY остальным (NAMES_NOTIFY).
+USER_RETURNING = (
+    "user_id, last_name, first_name, email, login, created_at, updated_at, row_version"
+)
+
+
+def _create_user(conn, payload: UserCreate) -> dict:
+    salt = generate_salt()  # 8 символов по умолчанию
+    password_hash = hash_md5_with_salt(payload.password, salt)  # хешируем пароль
+    try:
         row = (
             conn.execute(
                 text(
-                    """
-                SELECT user_id, last_name, first_name, email, login, created_at, updated_at
-                FROM auth.users WHERE user_id = :uid
+                    f"""
+                INSERT INTO auth.users (
+                    last_name, first_name, email, login, salt, password_hash, created_at, updated_at
+                )
+                VALUES (:last_name, :first_name, :email, :login, :salt, :password_hash, NOW(), NOW())
+                RETURNING {USER_RETURNING}, {user_bloom.NAMES_NOTIFY}
             """
                 ),
-                {"uid": user_id},
+                {
+                    "last_name": payload.last_name,
+                    "first_name": payload.first_name,
+                    "email": str(payload.email),
+                    "login": payload.login,
+                    "salt": salt,
+                    "password_hash": password_hash,
+                },
             )
             .mappings()
             .first()
         )
-        if not row:
-            raise HTTPException(status_code=404, detail="Пользователь не найден")
-        return _row_to_userout(row)
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Конфликт уникальности email/login")
+    user_bloom.add(row["login"], row["email"])
+    return _row_to_userout(row)
 
 
-@router.put("/users/{user_id}", response_model=UserOut)
-def update_user(payload: UserUpdate, user_id: int = Path(..., ge=1)):
+def _update_user(
+    conn, user_id: int, payload: UserUpdate, version: Optional[list[int]] = None
+) -> dict:
     fields = []
-    params = {"uid": user_id, "updated_at": datetime.now(timezone.utc)}
+    params = {"uid": user_id, "ver": version}
     if payload.last_name is not None:
         fields.append("last_name = :last_name")
         params["last_name"] = payload.last_name
@@ -210,48 +270,109 @@ def update_user(payload: UserUpdate, user_id: int = Path(..., ge=1)):
         fields.append("login = :login")
         params["login"] = payload.login
     if payload.password not in (None, ""):
-        fields.append("password_hash = :password_hash")
-        params["password_hash"] = payload.password
+        fields.append("salt = :salt, password_hash = :password_hash")
+        params["salt"] = generate_salt()
+        params["password_hash"] = hash_md5_with_salt(payload.password, params["salt"])
 
     if not fields:
         raise HTTPException(status_code=400, detail="Нет полей для обновления")
 
-    fields.append("updated_at = :updated_at")
-    sql = f"UPDATE auth.users SET {', '.join(fields)} WHERE user_id = :uid"
-
+    fields.append("updated_at = now(), row_version = row_version + 1")
+    names_changed = payload.login is not None or payload.email is not None
+    sql = versioned(
+        f"UPDATE auth.users SET {', '.join(fields)}",
+        "user_id = :uid AND deleted_at IS NULL",
+        (
+            f"{USER_RETURNING}, {user_bloom.NAMES_NOTIFY}"
+            if names_changed
+            else USER_RETURNING
+        ),
+        "auth.users",
+        version,
+    )
     try:
-        with engine.begin() as conn:
-            conn.execute(text("SET search_path TO auth, public"))
-            res = conn.execute(text(sql), params)
-            if res.rowcount == 0:
-                raise HTTPException(status_code=404, detail="Пользователь не найден")
-            row = (
-                conn.execute(
-                    text(
-                        """
-                    SELECT user_id, last_name, first_name, email, login, created_at, updated_at
-                    FROM auth.users WHERE user_id = :uid
-                """
-                    ),
-                    {"uid": user_id},
-                )
-                .mappings()
-                .first()
-            )
-            return _row_to_userout(row)
+        row = conn.execute(text(sql), params).mappings().first()
     except IntegrityError:
         raise HTTPException(status_code=409, detail="Конфликт уникальности email/login")
+    row = check(row, "user_id", "Пользователь не найден")
+    if names_changed:
+        user_bloom.add(row["login"], row["email"])
+    return _row_to_userout(row)
+
+
+def _delete_user(conn, user_id: int, version: Optional[list[int]] = None) -> dict:
+    """
+    Мягкое удаление: одна UPDATE по первичному ключу — время не зависит от объёма
+    посещений. Пользователь сразу скрыт, не входит и теряет роли; его строки
+    удаляет пачками фоновая задача user_purge (core/jobs.py), ход — /api/admin/purges.
+    """
+    sql = versioned(
+        "UPDATE auth.users SET deleted_at = now(), row_version = row_version + 1",
+        "user_id = :uid AND deleted_at IS NULL",
+        f"user_id, {GRANTS_NOTIFY}",
+        "auth.users",
+        version,
+    )
+    row = conn.execute(text(sql), {"uid": user_id, "ver": version}).mappings().first()
+    check(row, "user_id", "Пользователь не найден")
+    return {"status": "success", "deleted_user_id": user_id, "purge": "scheduled"}
+
+
+# ----------------- Создание пользователя (до /{user_id}) -----------------
+@router.post(
+    "/users",
+    response_model=UserOut,
+    status_code=201,
+    dependencies=[Depends(require_admin)],
+)
+def create_user(payload: UserCreate):
+    try:
+        with autocommit() as conn:
+            return _user_response(_create_user(conn, payload), status_code=201)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=f"DB error: {e}")
 
 
-@router.delete("/users/{user_id}")
-def delete_user(user_id: int = Path(..., ge=1)):
-    with engine.begin() as conn:
+# ----------------- CRUD по пользователю -----------------
+@router.get("/users/{user_id}", response_model=UserOut)
+def get_user(user_id: int = Path(..., ge=1)):
+    with engine.connect() as conn:
         conn.execute(text("SET search_path TO auth, public"))
-        res = conn.execute(
-            text("DELETE FROM auth.users WHERE user_id = :uid"), {"uid": user_id}
+        row = (
+            conn.execute(
+                text(
+                    f"SELECT {USER_RETURNING} FROM auth.users "
+                    "WHERE user_id = :uid AND deleted_at IS NULL"
+                ),
+                {"uid": user_id},
+            )
+            .mappings()
+            .first()
         )
-        if res.rowcount == 0:
+        if not row:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
-    return {"status": "success", "deleted_user_id": user_id}
+        return _user_response(_row_to_userout(row))
+
+
+@router.put(
+    "/users/{user_id}", response_model=UserOut, dependencies=[Depends(require_admin)]
+)
+def update_user(
+    payload: UserUpdate,
+    user_id: int = Path(..., ge=1),
+    if_match: Optional[str] = Header(None),
+):
+    try:
+        with autocommit() as conn:
+            out = _update_user(conn, user_id, payload, parse_if_match(if_match))
+            return _user_response(out)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+
+
+@router.delete("/users/{user_id}", dependencies=[Depends(require_admin)])
+def delete_user(user_id: int = Path(..., ge=1), if_match: Optional[str] = Header(None)):
+    with autocommit() as conn:
+        out = _delete_user(conn, user_id, parse_if_match(if_match))
+    invalidate(user_id)  # после COMMIT
+    return out
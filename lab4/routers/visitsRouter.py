@@ -1,17 +1,30 @@
 # routers/visits_router.py
+import asyncio
+import json
+
 from fastapi import APIRouter, Request, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
+from starlette.concurrency import run_in_threadpool
+from core.timing import TimedRoute
 from db.database import engine
+from utils import visit_feed, visit_sketches
+
+SSE_PING_SEC = 15  # комментарий-пинг, чтобы прокси не закрывали простаивающий поток
 
-router = APIRouter(tags=["visits"], responses={404: {"description": "Not Found"}})
+router = APIRouter(
+    route_class=TimedRoute,
+    tags=["visits"],
+    responses={404: {"description": "Not Found"}},
+)
 
 
 @router.get("/visit")
 def visit_page(request: Request, page: str = Query("protected_page")):
     """
     Записывает визит текущего пользователя в auth.user_visits и возвращает общее количество его заходов на page.
-    Если нет сессии — 401.
+    Если нет сессии или пользователь удалён — 401.
     """
     user_id = request.session.get("user_id")
     if not user_id:
@@ -20,12 +33,18 @@ def visit_page(request: Request, page: str = Query("protected_page")):
     try:
         with engine.begin() as conn:
             conn.execute(text("SET search_path TO auth, public"))
-            conn.execute(
+            # удалённому пользователю визиты не пишутся: их дочищает user_purge
+            inserted = conn.execute(
                 text(
-                    "INSERT INTO auth.user_visits (user_id, page_name) VALUES (:uid, :pname)"
+                    "INSERT INTO auth.user_visits (user_id, page_name) "
+                    "SELECT user_id, :pname FROM auth.users "
+                    "WHERE user_id = :uid AND deleted_at IS NULL"
                 ),
                 {"uid": user_id, "pname": page},
-            )
+            ).rowcount
+            if not inserted:
+                request.session.clear()
+                raise HTTPException(status_code=401, detail="Не авторизован")
             cnt = conn.execute(
                 text(
                     "SELECT COUNT(*) FROM auth.user_visits WHERE user_id = :uid AND page_name = :pname"
@@ -35,6 +54,9 @@ def visit_page(request: Request, page: str = Query("protected_page")):
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=f"DB error: {e}")
 
+    visit_feed.record(page, request.session.get("login") or str(user_id))
+    visit_sketches.record(page, user_id)
+
     return {
         "user_id": user_id,
         "page": page,
@@ -61,7 +83,7 @@ def stats(request: Request, page: str = Query("protected_page")):
                     """
                 SELECT u.login, v.page_name, COUNT(*) AS cnt
                 FROM auth.user_visits v
-                JOIN auth.users u ON u.user_id = v.user_id
+                JOIN auth.users u ON u.user_id = v.user_id AND u.deleted_at IS NULL
                 WHERE v.page_name = :pname
                 GROUP BY u.login, v.page_name
                 ORDER BY cnt DESC, u.login
@@ -79,3 +101,49 @@ def stats(request: Request, page: str = Query("protected_page")):
         for r in rows
     ]
     return {"page": page, "items": items}
+
+
+# ----------------- Поток приращений (SSE) -----------------
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.get("/visits/stream")
+async def visits_stream(request: Request, page: str = Query("protected_page")):
+    """
+    Server-Sent Events: сначала "snapshot" (login -> count по page), затем раз в
+    интервал "delta" с приращениями; "snapshot" повторяется при пересинхронизации.
+    Запросов к БД на клиента нет — см. utils/visit_feed.py. Требует авторизации.
+    """
+    user_id = request.session.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Не авторизован")
+
+    try:
+        sub, counts = await run_in_threadpool(
+            visit_feed.subscribe, page, asyncio.get_running_loop()
+        )
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            yield _sse("snapshot", {"page": page, "counts": counts})
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(
+                        sub.queue.get(), timeout=SSE_PING_SEC
+                    )
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield _sse(event, data)
+        finally:
+            visit_feed.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,5 +1,29 @@
+import argparse
+import os
+import sys
+
 import uvicorn
-from core.config import HOST, PORT, DEBUG
+from core.config import HOST, PORT, DEBUG, LOG_ACCESS
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host=HOST, port=PORT, reload=DEBUG)
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--prod",
+        action="store_true",
+        help="gunicorn + воркеры uvicorn (gunicorn_conf.py)",
+    )
+    args = ap.parse_args()
+
+    if args.prod:
+        from gunicorn.app.wsgiapp import run
+
+        conf = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "gunicorn_conf.py"
+        )
+        sys.argv = ["gunicorn", "-c", conf, "main:app"]
+        run()
+    else:
+        # журнал запросов пишет core/jsonlog.py (JSON) — текстовый uvicorn не дублирует
+        uvicorn.run(
+            "main:app", host=HOST, port=PORT, reload=DEBUG, access_log=not LOG_ACCESS
+        )
@@ -0,0 +1,22 @@
+-- Миграция 001: индексы для поиска автомобилей (/api/cars/search)
+-- Рассчитано на каталог ~10M строк. CONCURRENTLY — без блокировки записи,
+-- поэтому скрипт выполняется вне транзакции (psql -f, без BEGIN).
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Подстрока модели: ILIKE '%...%' по триграммам
+CREATE INDEX CONCURRENTLY IF NOT EXISTS cars_model_trgm_idx
+    ON catalog.cars USING gin (model gin_trgm_ops);
+
+-- Keyset-пагинация по сортировкам: (ключ, car_id)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS cars_price_id_idx
+    ON catalog.cars (price, car_id) WHERE price IS NOT NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS cars_year_id_idx
+    ON catalog.cars (year, car_id) WHERE year IS NOT NULL;
+
+-- Фильтр по набору фирм + сортировка по цене (частый сценарий «фирма, дешевле N»)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS cars_company_price_id_idx
+    ON catalog.cars (company_id, price, car_id);
+
+ANALYZE catalog.cars;
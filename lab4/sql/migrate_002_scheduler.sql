@@ -0,0 +1,29 @@
+-- Миграция 002: фоновые задачи (core/scheduler.py, core/jobs.py)
+
+-- Журнал запусков задач с single=True: координация воркеров и история
+CREATE TABLE IF NOT EXISTS auth.scheduler_runs (
+    job_name VARCHAR(100) PRIMARY KEY,
+    last_started_at TIMESTAMPTZ,
+    last_finished_at TIMESTAMPTZ,
+    last_status VARCHAR(20),
+    last_error TEXT,
+    last_duration_ms DOUBLE PRECISION,
+    runs BIGINT NOT NULL DEFAULT 0,
+    failures BIGINT NOT NULL DEFAULT 0
+);
+
+-- Дневные итоги посещений (задача visit_rollup)
+CREATE TABLE IF NOT EXISTS auth.user_visits_daily (
+    day DATE NOT NULL,
+    user_id BIGINT NOT NULL REFERENCES auth.users(user_id) ON DELETE CASCADE,
+    page_name VARCHAR(100) NOT NULL,
+    cnt BIGINT NOT NULL,
+    PRIMARY KEY (day, user_id, page_name)
+);
+
+-- Докуда (visit_id) посещения уже учтены в user_visits_daily
+CREATE TABLE IF NOT EXISTS auth.visit_rollup_state (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    last_visit_id BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO auth.visit_rollup_state (id) VALUES (1) ON CONFLICT DO NOTHING;
@@ -0,0 +1,5 @@
+-- Миграция 003: версия строки для оптимистической блокировки (ETag / If-Match, utils/etag.py)
+-- ADD COLUMN с постоянным DEFAULT в PostgreSQL 11+ не переписывает таблицу.
+
+ALTER TABLE auth.users ADD COLUMN IF NOT EXISTS row_version INT NOT NULL DEFAULT 1;
+ALTER TABLE auth.roles ADD COLUMN IF NOT EXISTS row_version INT NOT NULL DEFAULT 1;
@@ -0,0 +1,33 @@
+-- Миграция 004: мягкое удаление пользователей и фоновая очистка (задача user_purge, core/jobs.py)
+-- ADD COLUMN без DEFAULT не переписывает таблицу; индексы — CONCURRENTLY,
+-- поэтому скрипт выполняется вне транзакции (psql -f, без BEGIN).
+
+-- Отметка удаления: пользователь скрыт сразу, строки удаляются позже пачками
+ALTER TABLE auth.users ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMPTZ;
+
+-- Очередь очистки — только помеченные строки
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_deleted_at_idx
+    ON auth.users (deleted_at) WHERE deleted_at IS NOT NULL;
+
+-- Пачки удаления по пользователю (без них каждая пачка — полный проход таблицы)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_visits_user_id_idx
+    ON auth.user_visits (user_id, visit_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_visits_daily_user_id_idx
+    ON auth.user_visits_daily (user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_roles_granted_by_idx
+    ON auth.user_roles (granted_by) WHERE granted_by IS NOT NULL;
+
+-- Ход очистки (без FK: строка остаётся после удаления пользователя)
+CREATE TABLE IF NOT EXISTS auth.user_purges (
+    user_id BIGINT PRIMARY KEY,
+    login VARCHAR(100) NOT NULL,
+    deleted_at TIMESTAMPTZ NOT NULL,
+    started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    finished_at TIMESTAMPTZ,
+    stage VARCHAR(20) NOT NULL DEFAULT 'visits',
+    batches INT NOT NULL DEFAULT 0,
+    visits_deleted BIGINT NOT NULL DEFAULT 0,
+    daily_deleted BIGINT NOT NULL DEFAULT 0,
+    roles_deleted BIGINT NOT NULL DEFAULT 0,
+    grants_cleared BIGINT NOT NULL DEFAULT 0
+);
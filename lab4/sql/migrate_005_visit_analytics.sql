@@ -0,0 +1,39 @@
+-- Миграция 005: аналитика посещений (/api/visits/analytics/*, utils/visit_analytics.py)
+-- Индексы — CONCURRENTLY, поэтому скрипт выполняется вне транзакции (psql -f, без BEGIN).
+
+-- Диапазоны по времени (почасовой ряд): BRIN на порядки меньше B-tree, а строки
+-- user_visits добавляются по возрастанию visited_at — диапазоны страниц почти не пересекаются.
+-- autosummarize: новый заполненный диапазон описывается сразу, а не при VACUUM
+-- (неописанные диапазоны читаются целиком при каждом запросе)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_visits_visited_at_brin
+    ON auth.user_visits USING brin (visited_at)
+    WITH (pages_per_range = 32, autosummarize = on);
+
+-- Почасовой ряд одной страницы — index-only scan
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_visits_page_time_idx
+    ON auth.user_visits (page_name, visited_at) INCLUDE (user_id);
+
+-- Последний визит пользователя на страницу (recency) — обратный index-only scan;
+-- он же отвечает на COUNT визитов пользователя по странице в GET /api/visit
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_visits_user_page_time_idx
+    ON auth.user_visits (user_id, page_name, visited_at);
+
+-- Уникальные посетители страницы за окно — index-only scan по дневным итогам
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_visits_daily_page_day_idx
+    ON auth.user_visits_daily (page_name, day) INCLUDE (user_id, cnt);
+
+-- Итоги страницы за день (ведёт задача visit_rollup): дневной ряд за 90 дней — 90 строк
+CREATE TABLE IF NOT EXISTS auth.page_visits_daily (
+    day DATE NOT NULL,
+    page_name VARCHAR(100) NOT NULL,
+    visits BIGINT NOT NULL,
+    visitors BIGINT NOT NULL,  -- различных пользователей за день
+    PRIMARY KEY (page_name, day)
+);
+
+-- Заполнение из уже свёрнутых дневных итогов пользователей
+INSERT INTO auth.page_visits_daily (day, page_name, visits, visitors)
+SELECT day, page_name, sum(cnt), count(*)
+FROM auth.user_visits_daily
+GROUP BY day, page_name
+ON CONFLICT (page_name, day) DO NOTHING;
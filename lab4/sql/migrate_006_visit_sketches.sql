@@ -0,0 +1,22 @@
+-- Миграция 006: вероятностные счётчики посещений (utils/visit_sketches.py)
+-- Строки пишут все воркеры: сброс своего приращения — слияние с сохранённым под FOR UPDATE.
+
+-- HyperLogLog уникальных посетителей: страница за день UTC ('*' — все страницы),
+-- 2^14 регистров по байту
+CREATE TABLE IF NOT EXISTS auth.visit_hll (
+    day DATE NOT NULL,
+    page_name VARCHAR(100) NOT NULL,
+    registers BYTEA NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (page_name, day)
+);
+
+-- Count-Min визитов по страницам за день (int64 little-endian, depth x width),
+-- total — всего визитов, candidates — кандидаты в топ страниц
+CREATE TABLE IF NOT EXISTS auth.visit_topk (
+    day DATE PRIMARY KEY,
+    counts BYTEA NOT NULL,
+    total BIGINT NOT NULL,
+    candidates TEXT[] NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,38 @@
+-- Миграция 007: глобальный поиск (/api/search, routers/searchRouter.py)
+-- search_tsv — вычисляемые tsvector-столбцы (конфигурация 'simple': без словарей и
+-- стемминга, подходит и для имён, и для моделей), веса: A — главное поле, B/C — прочие.
+-- ADD COLUMN ... STORED переписывает таблицу под ACCESS EXCLUSIVE: на больших
+-- таблицах — в окно обслуживания. Индексы — CONCURRENTLY, поэтому скрипт
+-- выполняется вне транзакции (psql -f, без BEGIN).
+-- В email '@' заменяется пробелом: 'ivanov' и 'example.com' — отдельные лексемы,
+-- запрос делает с текстом ту же замену.
+
+ALTER TABLE auth.users ADD COLUMN IF NOT EXISTS search_tsv tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', login::text), 'A')
+        || setweight(to_tsvector('simple', last_name), 'A')
+        || setweight(to_tsvector('simple', first_name), 'B')
+        || setweight(to_tsvector('simple', translate(email::text, '@', ' ')), 'C')
+    ) STORED;
+
+ALTER TABLE catalog.companies ADD COLUMN IF NOT EXISTS search_tsv tsvector
+    GENERATED ALWAYS AS (setweight(to_tsvector('simple', name), 'A')) STORED;
+
+ALTER TABLE catalog.cars ADD COLUMN IF NOT EXISTS search_tsv tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', model), 'A')
+        || setweight(to_tsvector('simple', coalesce(year::text, '')), 'C')
+    ) STORED;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_search_tsv_idx
+    ON auth.users USING gin (search_tsv);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS companies_search_tsv_idx
+    ON catalog.companies USING gin (search_tsv);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS cars_search_tsv_idx
+    ON catalog.cars USING gin (search_tsv);
+
+ANALYZE auth.users;
+ANALYZE catalog.companies;
+ANALYZE catalog.cars;
@@ -0,0 +1,19 @@
+-- Миграция 008: отметка свёртки посещений по видимости транзакций (core/jobs.py visit_rollup)
+-- visit_id выдаётся до COMMIT: визит с меньшим id может стать видимым позже отметки
+-- last_visit_id и не попасть ни в свёртку, ни в хвост. Теперь строка хранит xid
+-- вставившей транзакции; свёртка берёт только xid < pg_snapshot_xmin(снимка) —
+-- такие транзакции завершены, и их строки больше не появятся.
+-- Индекс — CONCURRENTLY, поэтому скрипт выполняется вне транзакции (psql -f, без BEGIN).
+
+-- Без DEFAULT в ADD COLUMN — без перезаписи таблицы. Строки до миграции (ins_xid IS NULL)
+-- все зафиксированы: SET DEFAULT ждёт завершения текущих вставок; их дочитывает
+-- свёртка по старой отметке last_visit_id.
+ALTER TABLE auth.user_visits ADD COLUMN IF NOT EXISTS ins_xid xid8;
+ALTER TABLE auth.user_visits ALTER COLUMN ins_xid SET DEFAULT pg_current_xact_id();
+
+-- Свёрнуто всё с ins_xid <= last_xid
+ALTER TABLE auth.visit_rollup_state ADD COLUMN IF NOT EXISTS last_xid xid8 NOT NULL DEFAULT '0';
+
+-- Хвост после отметки и пачки свёртки
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_visits_ins_xid_idx
+    ON auth.user_visits (ins_xid) WHERE ins_xid IS NOT NULL;
@@ -0,0 +1,309 @@
+# utils/catalog_snapshot.py
+"""
+Колоночный снапшот catalog.cars в памяти (NumPy) для аналитики цен.
+
+Снапшот неизменяемый: массивы car_id / company_id / year / price, отсортированные
+по (company_id, price). Агрегаты по фирмам, процентили и гистограмма по годам без
+фильтра считаются один раз при построении снапшота, поэтому запрос к аналитике —
+готовый результат или срезы и bincount по выбранным фирмам, а не GROUP BY в БД.
+
+Обновление:
+- инкрементальное (не чаще ANALYTICS_REFRESH_SEC): догружаются строки с car_id
+  больше последнего загруженного;
+- полное (раз в ANALYTICS_FULL_RELOAD_SEC): подхватывает UPDATE/DELETE, которые
+  по car_id не отследить.
+Снапшот собирается вне блокировки и подменяет старый атомарно (одно присваивание
+под блокировкой); пока идёт сборка, запросы получают прежний снапшот.
+
+Использование:
+  from utils.catalog_snapshot import get_snapshot
+  snap = get_snapshot()
+  snap.company_stats()  ->  {company_id: {...}}
+"""
+
+from __future__ import annotations
+import threading
+import time
+from functools import cached_property
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import text
+
+from core.config import ANALYTICS_FULL_RELOAD_SEC, ANALYTICS_REFRESH_SEC
+from db.database import engine
+
+PERCENTILES = (5, 25, 50, 75, 95)
+_CHUNK = 100_000
+
+
+class CatalogSnapshot:
+    """Неизменяемый набор массивов + производные агрегаты (кешируются, см. precompute)."""
+
+    def __init__(self, car_id, company_id, year, price, company_names, loaded_at):
+        # массивы уже отсортированы по (company_id, price), NaN-цены — в конце группы
+        self.car_id = car_id
+        self.company_id = company_id
+        self.year = year  # 0 = год не указан
+        self.price = price  # NaN = цена не указана
+        self.company_names = company_names
+        self.loaded_at = loaded_at
+        self.last_car_id = int(car_id.max()) if len(car_id) else 0
+        for a in (self.car_id, self.company_id, self.year, self.price):
+            a.setflags(write=False)
+
+    @classmethod
+    def from_columns(cls, car_id, company_id, year, price, company_names, loaded_at):
+        """Полная сборка: сортировка O(n log n)."""
+        order = np.lexsort((price, company_id))
+        return cls(
+            car_id[order],
+            company_id[order],
+            year[order],
+            price[order],
+            company_names,
+            loaded_at,
+        )
+
+    def merged(self, car_id, company_id, year, price, company_names, loaded_at):
+        """
+        Инкрементальная сборка: новые строки вставляются в отсортированные массивы
+        (поиск позиции внутри группы фирмы + один np.insert), без пересортировки.
+        """
+        order = np.lexsort((price, company_id))
+        car_id, company_id = car_id[order], company_id[order]
+        year, price = year[order], price[order]
+        ids, starts, counts, _ = self._groups
+        pos = np.empty(len(car_id), dtype=np.int64)
+        for i, (cid, pr) in enumerate(zip(company_id.tolist(), price.tolist())):
+            g = int(np.searchsorted(ids, cid))
+            if g < len(ids) and ids[g] == cid:
+                lo, hi = int(starts[g]), int(starts[g] + counts[g])
+                pos[i] = lo + int(np.searchsorted(self.price[lo:hi], pr, side="right"))
+            else:
+                pos[i] = int(starts[g]) if g < len(ids) else len(self)
+        return CatalogSnapshot(
+            np.insert(self.car_id, pos, car_id),
+            np.insert(self.company_id, pos, company_id),
+            np.insert(self.year, pos, year),
+            np.insert(self.price, pos, price),
+            company_names,
+            loaded_at,
+        )
+
+    def __len__(self) -> int:
+        return len(self.car_id)
+
+    # ---- группы фирм: начало/длина в отсортированных массивах ----
+    @cached_property
+    def _groups(self):
+        ids, starts, counts = np.unique(
+            self.company_id, return_index=True, return_counts=True
+        )
+        valid = (~np.isnan(self.price)).astype(np.int64)
+        # число строк с ценой в каждой группе (NaN в конце группы)
+        priced = np.add.reduceat(valid, starts) if len(starts) else starts
+        return ids, starts, counts, priced
+
+    @cached_property
+    def _company_stats(self) -> dict:
+        ids, starts, counts, priced = self._groups
+        has = priced > 0
+        s, n = starts[has], priced[has]
+        p = self.price
+        mins = p[s]
+        maxs = p[s + n - 1]
+        sums = np.add.reduceat(np.nan_to_num(p), starts)[has]
+        medians = (p[s + (n - 1) // 2] + p[s + n // 2]) / 2
+        out = {}
+        for i, cid in enumerate(ids[has].tolist()):
+            out[cid] = {
+                "company_id": cid,
+                "name": self.company_names.get(cid),
+                "count": int(n[i]),
+                "min": float(mins[i]),
+                "max": float(maxs[i]),
+                "mean": float(sums[i] / n[i]),
+                "median": float(medians[i]),
+            }
+        return out
+
+    def company_stats(self, company_ids: Optional[list[int]] = None) -> list[dict]:
+        stats = self._company_stats
+        keys = company_ids if company_ids else stats.keys()
+        return [stats[c] for c in keys if c in stats]
+
+    # ---- выборка по фирмам ----
+    def _mask(self, company_ids: Optional[list[int]]):
+        if not company_ids:
+            return slice(None)
+        ids, starts, counts, _ = self._groups
+        if not len(ids):
+            return np.empty(0, dtype=np.int64)
+        pos = np.searchsorted(ids, company_ids)
+        ok = (pos < len(ids)) & (ids[np.minimum(pos, len(ids) - 1)] == company_ids)
+        # строки фирмы идут подряд — собираем индексы из диапазонов
+        parts = [np.arange(starts[i], starts[i] + counts[i]) for i in pos[ok]]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    # ---- процентили цены и гистограмма по годам ----
+    @staticmethod
+    def _percentiles(price) -> dict:
+        p = price[~np.isnan(price)]
+        if not len(p):
+            return {}
+        values = np.percentile(p, PERCENTILES)
+        return {f"p{q}": float(v) for q, v in zip(PERCENTILES, values)}
+
+    @staticmethod
+    def _year_stats(year, price) -> list[dict]:
+        known = year > 0
+        year, price = year[known], price[known]
+        if not len(year):
+            return []
+        y0 = int(year.min())
+        bins = year - y0
+        counts = np.bincount(bins)
+        priced = ~np.isnan(price)
+        pcounts = np.bincount(bins[priced], minlength=len(counts))
+        psums = np.bincount(bins[priced], weights=price[priced], minlength=len(counts))
+        out = []
+        for i in np.flatnonzero(counts).tolist():
+            out.append(
+                {
+                    "year": y0 + i,
+                    "count": int(counts[i]),
+                    "mean_price": (
+                        float(psums[i] / pcounts[i]) if pcounts[i] else None
+                    ),
+                }
+            )
+        return out
+
+    @cached_property
+    def _all_percentiles(self) -> dict:
+        return self._percentiles(self.price)
+
+    @cached_property
+    def _all_year_stats(self) -> list[dict]:
+        return self._year_stats(self.year, self.price)
+
+    def precompute(self) -> None:
+        """Посчитать агрегаты без фильтра заранее — при сборке, а не в первом запросе."""
+        self._company_stats
+        self._all_percentiles
+        self._all_year_stats
+
+    def percentiles(self, company_ids: Optional[list[int]] = None) -> dict:
+        if not company_ids:
+            return self._all_percentiles
+        return self._percentiles(self.price[self._mask(company_ids)])
+
+    def year_stats(self, company_ids: Optional[list[int]] = None) -> list[dict]:
+        """Гистограмма по годам + средняя цена на год (кривая цена/год)."""
+        if not company_ids:
+            return self._all_year_stats
+        idx = self._mask(company_ids)
+        return self._year_stats(self.year[idx], self.price[idx])
+
+
+# ----------------- Загрузка из БД -----------------
+def _load_columns(conn, after_car_id: int):
+    """car_id > after_car_id -> 4 массива. Читаем потоком, пачками по _CHUNK."""
+    result = conn.execution_options(stream_results=True).execute(
+        text(
+            """
+            SELECT car_id, company_id, COALESCE(year, 0),
+                   COALESCE(price::float8, 'NaN'::float8)
+            FROM catalog.cars
+            WHERE car_id > :after
+            ORDER BY car_id
+        """
+        ),
+        {"after": after_car_id},
+    )
+    chunks = [np.array(part, dtype=np.float64) for part in result.partitions(_CHUNK)]
+    data = np.concatenate(chunks) if chunks else np.empty((0, 4))
+    return (
+        data[:, 0].astype(np.int64),
+        data[:, 1].astype(np.int64),
+        data[:, 2].astype(np.int32),
+        data[:, 3],
+    )
+
+
+def _load_company_names(conn) -> dict:
+    rows = conn.execute(text("SELECT company_id, name FROM catalog.companies"))
+    return {int(cid): name for cid, name in rows}
+
+
+def _build(prev: Optional[CatalogSnapshot]) -> CatalogSnapshot:
+    with engine.connect() as conn:
+        names = _load_company_names(conn)
+        after = prev.last_car_id if prev is not None else 0
+        car_id, company_id, year, price = _load_columns(conn, after)
+    now = time.monotonic()
+    if prev is None:
+        snap = CatalogSnapshot.from_columns(car_id, company_id, year, price, names, now)
+    elif not len(car_id) and names == prev.company_names:
+        # новых строк нет — оставляем агрегаты, сдвигаем только время проверки
+        prev.loaded_at = now
+        return prev
+    else:
+        snap = prev.merged(car_id, company_id, year, price, names, now)
+    snap.precompute()
+    return snap
+
+
+_snapshot: Optional[CatalogSnapshot] = None
+_full_loaded_at = 0.0
+# _lock — только для чтения/подмены состояния; сборка идёт вне его
+_lock = threading.Lock()
+_built = threading.Condition(_lock)
+_refreshing = False
+
+
+def get_snapshot(force_full: bool = False) -> CatalogSnapshot:
+    """
+    Текущий снапшот; при устаревании обновляет его. Собирает один поток и вне _lock:
+    остальные тем временем получают прежний снапшот, а ждут сборки, только если
+    снапшота ещё нет (или нужен принудительно полный).
+    """
+    global _snapshot, _full_loaded_at, _refreshing
+    snap = _snapshot
+    now = time.monotonic()
+    if (
+        snap is not None
+        and not force_full
+        and now - snap.loaded_at < ANALYTICS_REFRESH_SEC
+    ):
+        return snap
+    with _lock:
+        while True:
+            snap = _snapshot
+            now = time.monotonic()
+            full = force_full or now - _full_loaded_at >= ANALYTICS_FULL_RELOAD_SEC
+            if (
+                snap is not None
+                and not full
+                and now - snap.loaded_at < ANALYTICS_REFRESH_SEC
+            ):
+                return snap  # обновил другой поток
+            if not _refreshing:
+                break
+            if snap is not None and not force_full:
+                return snap  # обновляет другой поток — отдаём прежний
+            _built.wait()
+        _refreshing = True
+    new = None
+    try:
+        new = _build(None if full else snap)
+    finally:
+        with _lock:
+            _refreshing = False
+            if new is not None:
+                _snapshot = new
+                if full:
+                    _full_loaded_at = now
+            _built.notify_all()
+    return new
@@ -0,0 +1,75 @@
+# utils/etag.py
+"""
+Оптимистическая блокировка записей по столбцу row_version (миграция 003).
+
+Версия отдаётся заголовком ETag ("7") и полем row_version в теле. Клиент,
+приславший If-Match с прочитанной версией, получает 412 вместо молчаливой
+перезаписи чужих изменений; без If-Match запись безусловная, как раньше.
+If-Match сравнивается строго (RFC 9110): слабые теги W/"7" не совпадают ни с чем;
+из списка тегов подходит любой.
+
+Запись — одна команда: UPDATE/DELETE ... RETURNING. С If-Match команда
+оборачивается в CTE, которая в том же снимке читает текущую версию строки,
+чтобы без второго запроса отличить «нет строки» (404) от «версия другая» (412):
+
+  WITH w AS (UPDATE t SET ... WHERE id = :id AND row_version = ANY(:ver) RETURNING ...)
+  SELECT w.*, (SELECT row_version FROM t WHERE id = :id) AS current_version
+  FROM (SELECT 1) AS one LEFT JOIN w ON true
+"""
+
+from __future__ import annotations
+from typing import Optional
+
+from fastapi import HTTPException
+
+
+def etag(version) -> str:
+    return f'"{version}"'
+
+
+def parse_if_match(header: Optional[str]) -> Optional[list[int]]:
+    """
+    Допустимые версии из If-Match; None — условия нет (или "*").
+    Слабые теги и чужой формат не совпадают ни с чем (пустой список — всегда 412).
+    """
+    if header is None:
+        return None
+    versions = []
+    for tag in (t.strip() for t in header.split(",")):
+        if tag == "*":
+            return None
+        if len(tag) > 2 and tag[0] == tag[-1] == '"' and tag[1:-1].isdigit():
+            versions.append(int(tag[1:-1]))
+    return versions
+
+
+def versioned(
+    head: str, where: str, returning: str, table: str, version: Optional[list[int]]
+) -> str:
+    """
+    "{head} WHERE {where} RETURNING {returning}"; при version — с проверкой
+    row_version = ANY(:ver) и столбцом current_version (параметр :ver — список
+    версий из parse_if_match — добавляет вызывающий).
+    """
+    if version is None:
+        return f"{head} WHERE {where} RETURNING {returning}"
+    return (
+        f"WITH w AS ({head} WHERE {where} AND row_version = ANY(CAST(:ver AS int[])) "
+        f"RETURNING {returning}) "
+        f"SELECT w.*, (SELECT row_version FROM {table} WHERE {where}) AS current_version "
+        f"FROM (SELECT 1) AS one LEFT JOIN w ON true"
+    )
+
+
+def check(row, key: str, not_found: str):
+    """Строка результата versioned(): 404, 412 (с текущим ETag) или сама строка."""
+    if row is not None and row[key] is not None:
+        return row
+    current = row.get("current_version") if row is not None else None
+    if current is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    raise HTTPException(
+        status_code=412,
+        detail="Запись изменена другим пользователем — перезагрузите данные",
+        headers={"ETag": etag(current)},
+    )
@@ -0,0 +1,59 @@
+# utils/fastjson.py
+"""
+Быстрая сериализация ответов API.
+
+Строки, пришедшие из БД, уже прошли ограничения схемы (типы, NOT NULL, CHECK),
+поэтому повторно прогонять их через Pydantic (сначала в _row_to_*, потом ещё раз
+через response_model) не нужно. Обработчик отдаёт FastJSONResponse с обычным dict,
+а FastAPI, увидев готовый Response, пропускает валидацию и jsonable_encoder.
+
+Сериализация — через orjson (datetime/UUID нативно, Decimal — через default).
+Если orjson не установлен, используется стандартный json с тем же поведением.
+
+Использование:
+  from utils.fastjson import FastJSONResponse
+  return FastJSONResponse({"items": [dict(r) for r in rows]})
+"""
+
+from __future__ import annotations
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson опционален
+    orjson = None
+
+
+def _default(obj: Any):
+    """Типы, которые не умеет сериализатор: Decimal (NUMERIC), даты для json."""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Сериализует content в JSON (bytes)."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse без jsonable_encoder: content сериализуется как есть."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def rows_to_dicts(rows, columns) -> list[dict]:
+    """Берёт из строк (RowMapping) только нужные колонки, без конвертации значений."""
+    return [{c: r[c] for c in columns} for r in rows]
@@ -0,0 +1,115 @@
+# utils/role_registry.py
+"""
+Реестр ролей в памяти процесса.
+
+auth.roles — маленький справочник, который читается почти на каждом запросе
+(списки ролей, роли пользователя, проверка в grant_role). Реестр держит
+неизменяемый снапшот всех ролей с индексами по id и по имени; чтение —
+без обращения к БД.
+
+Перезагрузка:
+- после create_role / update_role / delete_role в этом процессе (refresh() — сбой
+  чтения только пишется в лог: запись уже зафиксирована, догонят NOTIFY и задача);
+- по NOTIFY "roles_changed" от другого воркера (см. db/notify.py).
+Новый снапшот собирается целиком и подменяет старый одним присваиванием.
+
+Использование:
+  from utils import role_registry
+  snap = role_registry.get()
+  snap.by_id.get(3)       -> {"role_id": 3, "name": "user", ...} | None
+  snap.by_name.get("admin")
+"""
+
+from __future__ import annotations
+import logging
+import threading
+from types import MappingProxyType
+from typing import Optional
+
+from sqlalchemy import text
+
+from db import notify
+from db.database import engine
+
+log = logging.getLogger("role_registry")
+
+CHANNEL = "roles_changed"
+
+
+class RoleSnapshot:
+    """Все роли на момент загрузки. items — по имени (как в /roles/all)."""
+
+    __slots__ = ("items", "by_id", "by_name", "version")
+
+    def __init__(self, rows, version: int):
+        items = tuple(
+            MappingProxyType(
+                {
+                    "role_id": r["role_id"],
+                    "name": r["name"],
+                    "is_enabled": r["is_enabled"],
+                    "created_at": r["created_at"],
+                    "row_version": r["row_version"],
+                }
+            )
+            for r in sorted(rows, key=lambda r: r["name"])
+        )
+        self.items = items
+        self.by_id = MappingProxyType({r["role_id"]: r for r in items})
+        self.by_name = MappingProxyType({r["name"]: r for r in items})
+        self.version = version
+
+
+_snapshot: Optional[RoleSnapshot] = None
+_version = 0
+_lock = threading.Lock()
+
+
+def _load() -> list:
+    with engine.connect() as conn:
+        return (
+            conn.execute(
+                text(
+                    "SELECT role_id, role_name AS name, is_enabled, created_at, row_version "
+                    "FROM auth.roles"
+                )
+            )
+            .mappings()
+            .all()
+        )
+
+
+def reload() -> RoleSnapshot:
+    """Перечитывает auth.roles и атомарно подменяет снапшот."""
+    global _snapshot, _version
+    with _lock:
+        rows = _load()
+        _version += 1
+        _snapshot = RoleSnapshot(rows, _version)
+        return _snapshot
+
+
+def refresh() -> None:
+    """reload() после записи в этом процессе; ошибка — в лог, а не вызывающему."""
+    try:
+        reload()
+    except Exception:
+        log.exception("role registry reload failed")
+
+
+def get() -> RoleSnapshot:
+    """Текущий снапшот (при первом обращении — загрузка)."""
+    snap = _snapshot
+    if snap is None:
+        with _lock:
+            snap = _snapshot
+        if snap is None:
+            snap = reload()
+    return snap
+
+
+# для RETURNING команды, меняющей auth.roles: оповестит другие воркеры
+NOTIFY = notify.expr(CHANNEL)
+
+
+notify.subscribe(CHANNEL, lambda payload: reload())
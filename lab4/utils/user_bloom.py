@@ -0,0 +1,150 @@
+# utils/user_bloom.py
+"""
+Bloom-фильтр занятых логинов и email в памяти процесса — для проверки
+доступности (GET /api/users/availability) по мере ввода в форме пользователя.
+
+Фильтр не даёт ложных «нет»: если значения в нём нет, оно свободно, и ответ
+получается без обращения к БД. «Возможно есть» (занято или ложное срабатывание,
+доля — USER_BLOOM_FP_RATE) проверяется запросом по уникальным индексам
+users.login / users.email (citext — без учёта регистра, поэтому ключи фильтра
+в нижнем регистре).
+
+Наполнение:
+- rebuild() — все логины и email (и удалённых: их строки держат уникальность, пока
+  не очищены); вызывается при прогреве и задачей user_bloom раз в
+  USER_BLOOM_REBUILD_SEC — тогда же уходят освобождённые значения, а размер
+  подстраивается под число пользователей. Новый фильтр собирается целиком и
+  подменяет старый; добавленное за время сборки дописывается в новый;
+- add() — после создания/изменения пользователя в этом процессе;
+- NOTIFY "user_names" (NAMES_NOTIFY в RETURNING той же команды) — записи других
+  воркеров; после переподключения слушателя — rebuild().
+
+Строки, вставленные в обход API (скрипты, bench.gen_data), видны после rebuild();
+до этого ответ «свободно» может оказаться неверным — INSERT всё равно вернёт 409.
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import math
+import threading
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+
+from core.config import USER_BLOOM_FP_RATE, USER_BLOOM_MIN_CAPACITY
+from db import notify
+from db.database import engine
+
+CHANNEL = "user_names"
+# payload — JSON-массив [login, email] изменённой строки
+NAMES_NOTIFY = notify.expr(CHANNEL, "json_build_array(login, email)::text")
+
+
+class BloomFilter:
+    """m бит, k позиций на ключ (двойное хеширование blake2b)."""
+
+    __slots__ = ("m", "k", "bits", "count")
+
+    def __init__(self, capacity: int, fp_rate: float):
+        self.m = max(64, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.k = max(1, round(self.m / capacity * math.log(2)))
+        self.bits = bytearray((self.m + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        d = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        return [(h1 + i * h2) % self.m for i in range(self.k)]
+
+    def add(self, key: str) -> None:
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+
+def login_key(login: str) -> str:
+    return "l:" + login.lower()
+
+
+def email_key(email: str) -> str:
+    return "e:" + email.lower()
+
+
+_filter: Optional[BloomFilter] = None
+_pending: Optional[list[str]] = None  # ключи, добавленные во время rebuild()
+_lock = threading.Lock()
+_rebuild_lock = threading.Lock()
+
+
+def ready() -> bool:
+    return _filter is not None
+
+
+def might_contain(key: str) -> bool:
+    """False — точно свободно; True — возможно занято (или фильтр ещё не собран)."""
+    f = _filter
+    return f is None or key in f
+
+
+def _add_keys(keys: Iterable[str]) -> None:
+    with _lock:
+        for key in keys:
+            if _filter is not None:
+                _filter.add(key)
+            if _pending is not None:
+                _pending.append(key)
+
+
+def add(login: str, email: str) -> None:
+    _add_keys((login_key(login), email_key(email)))
+
+
+def rebuild() -> BloomFilter:
+    """Собрать фильтр по auth.users заново и подменить текущий."""
+    global _filter, _pending
+    with _rebuild_lock:
+        with _lock:
+            _pending = []
+        try:
+            with engine.connect() as conn:
+                n = conn.execute(text("SELECT count(*) FROM auth.users")).scalar_one()
+                # ключей — 2 на пользователя (login и email), ёмкость — с запасом
+                # вдвое: доля ложных срабатываний держится до следующей пересборки
+                keys = 2 * n
+                new = BloomFilter(
+                    max(USER_BLOOM_MIN_CAPACITY, 2 * keys), USER_BLOOM_FP_RATE
+                )
+                rows = conn.execution_options(yield_per=10000).execute(
+                    text("SELECT login, email FROM auth.users")
+                )
+                for login, email in rows:
+                    new.add(login_key(login))
+                    new.add(email_key(email))
+        except BaseException:
+            with _lock:
+                _pending = None
+            raise
+        with _lock:
+            for key in _pending:
+                new.add(key)
+            _filter, _pending = new, None
+    return new
+
+
+def _on_notify(payload: Optional[str]) -> None:
+    if payload is None:
+        # слушатель переподключился — записи за время разрыва потеряны
+        if ready():
+            rebuild()
+        return
+    login, email = json.loads(payload)
+    add(login, email)
+
+
+notify.subscribe(CHANNEL, _on_notify)
@@ -0,0 +1,340 @@
+# utils/visit_analytics.py
+"""
+Аналитика посещений по времени (/api/visits/analytics/*).
+
+Источники (время — UTC):
+- auth.page_visits_daily — итоги страницы за день (visits, visitors), ведёт
+  задача visit_rollup: дневной ряд за 90 дней — 90 строк по первичному ключу;
+- auth.user_visits_daily — итоги пользователя за день: уникальные посетители
+  за окно и активность пользователя;
+- хвост auth.user_visits после отметки свёртки (visit_rollup_state) — визиты
+  последней минуты; добавляется к итогам, чтобы ответы были точными;
+- auth.user_visits напрямую — только почасовой ряд (BRIN по visited_at или
+  индекс (page_name, visited_at)), окно не больше VISIT_ANALYTICS_HOURLY_MAX_DAYS.
+
+Пустые интервалы ряда заполняются нулями в БД (generate_series).
+
+Результаты кешируются по нормализованному запросу (имя + параметры после
+разбора окна и значений по умолчанию): VISIT_ANALYTICS_TTL_SEC, если окно
+захватывает сегодня, и VISIT_ANALYTICS_TTL_PAST_SEC для прошедших дней.
+Одинаковые запросы, пришедшие одновременно, считаются один раз.
+"""
+
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from core.config import (
+    VISIT_ANALYTICS_CACHE_SIZE,
+    VISIT_ANALYTICS_TTL_PAST_SEC,
+    VISIT_ANALYTICS_TTL_SEC,
+)
+from db.database import engine
+
+# ключ -> (истекает, результат)
+_cache: "OrderedDict[tuple, tuple[float, dict]]" = OrderedDict()
+_lock = threading.Lock()
+_key_locks: dict[tuple, threading.Lock] = defaultdict(threading.Lock)
+
+
+# визиты после отметки свёртки (core/jobs.py visit_rollup): по xid вставившей транзакции,
+# строки до миграции 008 (ins_xid IS NULL) — по старой отметке visit_id. Отметка
+# передаётся значением, а не подзапросом — иначе планировщик не знает, что хвост мал,
+# и идёт по visited_at вместо индексов ins_xid и первичного ключа
+def _tail(alias: str = "") -> str:
+    return (
+        f"({alias}ins_xid > CAST(:last_xid AS xid8)"
+        f" OR ({alias}ins_xid IS NULL AND {alias}visit_id > :last))"
+    )
+
+
+# ----------------- Окно -----------------
+def today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def window(
+    start: Optional[date], end: Optional[date], default_days: int, max_days: int
+) -> tuple[date, date]:
+    """Окно [start, end] в днях UTC (включительно); по умолчанию — последние default_days."""
+    end = end or today()
+    start = start or end - timedelta(days=default_days - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="Начало окна позже конца")
+    if (end - start).days + 1 > max_days:
+        raise HTTPException(
+            status_code=400, detail=f"Окно больше {max_days} дн. — сузьте период"
+        )
+    return start, end
+
+
+def _bounds(start: date, end: date) -> dict:
+    return {
+        "start": start,
+        "end": end,
+        "start_ts": datetime.combine(start, datetime.min.time(), timezone.utc),
+        "end_ts": datetime.combine(
+            end + timedelta(days=1), datetime.min.time(), timezone.utc
+        ),
+    }
+
+
+# ----------------- Кеш -----------------
+def cached(key: tuple, end: date, compute: Callable[[], dict]) -> dict:
+    """Результат из кеша или compute(); в ответ добавляются cached и compute_ms."""
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] > now:
+            _cache.move_to_end(key)
+            return {**entry[1], "cached": True}
+        key_lock = _key_locks[key]
+    with key_lock:
+        with _lock:  # пока ждали, мог посчитать другой поток
+            entry = _cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return {**entry[1], "cached": True}
+        t0 = time.perf_counter()
+        try:
+            result = compute()
+        except BaseException:
+            with _lock:
+                _key_locks.pop(key, None)
+            raise
+        result["compute_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        ttl = VISIT_ANALYTICS_TTL_PAST_SEC if end < today() else VISIT_ANALYTICS_TTL_SEC
+        # результат — в кеш и блокировка ключа — прочь за один захват _lock:
+        # пришедший в промежутке запрос иначе создал бы новую блокировку и считал заново
+        with _lock:
+            _cache[key] = (time.monotonic() + ttl, result)
+            _cache.move_to_end(key)
+            while len(_cache) > VISIT_ANALYTICS_CACHE_SIZE:
+                _cache.popitem(last=False)
+            _key_locks.pop(key, None)
+    return {**result, "cached": False}
+
+
+def clear_cache() -> None:
+    with _lock:
+        _cache.clear()
+
+
+def _rows(sql: str, params: dict) -> list[dict]:
+    with engine.connect() as conn:
+        conn.execute(text("SET search_path TO auth, public"))
+        last, last_xid = conn.execute(
+            text(
+                "SELECT last_visit_id, last_xid::text"
+                " FROM auth.visit_rollup_state WHERE id = 1"
+            )
+        ).one()
+        rows = conn.execute(
+            text(sql), {**params, "last": last, "last_xid": last_xid}
+        ).mappings()
+        return [dict(r) for r in rows]
+
+
+def _page_filter(page: Optional[str]) -> str:
+    return " AND page_name = :page" if page is not None else ""
+
+
+# ----------------- Запросы -----------------
+def top_pages(start: date, end: date, limit: int) -> dict:
+    def compute():
+        rows = _rows(
+            f"""
+            SELECT page_name AS page, sum(visits)::bigint AS visits
+            FROM (
+                SELECT page_name, visits FROM auth.page_visits_daily
+                WHERE day BETWEEN :start AND :end
+                UNION ALL
+                SELECT page_name, count(*) FROM auth.user_visits
+                WHERE {_tail()} AND visited_at >= :start_ts AND visited_at < :end_ts
+                GROUP BY page_name
+            ) t
+            GROUP BY page_name
+            ORDER BY visits DESC, page
+            LIMIT :limit
+            """,
+            {**_bounds(start, end), "limit": limit},
+        )
+        return {"start": start, "end": end, "items": rows}
+
+    return cached(("top_pages", start, end, limit), end, compute)
+
+
+def daily_series(page: str, start: date, end: date) -> dict:
+    """visits и visitors (различные пользователи за день) по дням."""
+
+    def compute():
+        # хвост: visitors — пользователи без строки в user_visits_daily за этот день
+        rows = _rows(
+            f"""
+            WITH b AS (
+                SELECT day, sum(visits)::bigint AS visits, sum(visitors)::bigint AS visitors
+                FROM (
+                    SELECT day, visits, visitors FROM auth.page_visits_daily
+                    WHERE page_name = :page AND day BETWEEN :start AND :end
+                    UNION ALL
+                    SELECT (v.visited_at AT TIME ZONE 'UTC')::date, count(*),
+                           count(DISTINCT v.user_id) FILTER (WHERE NOT EXISTS (
+                               SELECT 1 FROM auth.user_visits_daily d
+                               WHERE d.day = (v.visited_at AT TIME ZONE 'UTC')::date
+                                 AND d.user_id = v.user_id AND d.page_name = v.page_name))
+                    FROM auth.user_visits v
+                    WHERE {_tail("v.")} AND v.page_name = :page
+                      AND v.visited_at >= :start_ts AND v.visited_at < :end_ts
+                    GROUP BY 1
+                ) t
+                GROUP BY day
+            )
+            SELECT g::date AS t, coalesce(b.visits, 0) AS visits,
+                   coalesce(b.visitors, 0) AS visitors
+            FROM generate_series(
+                CAST(:start AS timestamp), CAST(:end AS timestamp), interval '1 day'
+            ) g
+            LEFT JOIN b ON b.day = g::date
+            ORDER BY g
+            """,
+            {**_bounds(start, end), "page": page},
+        )
+        return {
+            "page": page,
+            "bucket": "day",
+            "start": start,
+            "end": end,
+            "points": rows,
+        }
+
+    return cached(("series", page, "day", start, end), end, compute)
+
+
+def hourly_series(page: Optional[str], start: date, end: date) -> dict:
+    """visits и visitors по часам из auth.user_visits (page=None — все страницы)."""
+
+    def compute():
+        rows = _rows(
+            f"""
+            WITH b AS (
+                SELECT date_trunc('hour', visited_at AT TIME ZONE 'UTC') AS h,
+                       count(*) AS visits, count(DISTINCT user_id) AS visitors
+                FROM auth.user_visits
+                WHERE visited_at >= :start_ts AND visited_at < :end_ts{_page_filter(page)}
+                GROUP BY 1
+            )
+            SELECT g AT TIME ZONE 'UTC' AS t, coalesce(b.visits, 0) AS visits,
+                   coalesce(b.visitors, 0) AS visitors
+            FROM generate_series(
+                CAST(:start AS timestamp),
+                CAST(:end AS timestamp) + interval '23 hours',
+                interval '1 hour'
+            ) g
+            LEFT JOIN b ON b.h = g
+            ORDER BY g
+            """,
+            {**_bounds(start, end), "page": page},
+        )
+        return {
+            "page": page,
+            "bucket": "hour",
+            "start": start,
+            "end": end,
+            "points": rows,
+        }
+
+    return cached(("series", page, "hour", start, end), end, compute)
+
+
+def unique_visitors(page: Optional[str], start: date, end: date) -> dict:
+    """Различные пользователи за всё окно (не сумма по дням) и число визитов."""
+
+    def compute():
+        pf = _page_filter(page)
+        row = _rows(
+            f"""
+            SELECT count(DISTINCT user_id) AS visitors, coalesce(sum(cnt), 0)::bigint AS visits
+            FROM (
+                SELECT user_id, cnt FROM auth.user_visits_daily
+                WHERE day BETWEEN :start AND :end{pf}
+                UNION ALL
+                SELECT user_id, count(*) FROM auth.user_visits
+                WHERE {_tail()} AND visited_at >= :start_ts AND visited_at < :end_ts{pf}
+                GROUP BY user_id
+            ) t
+            """,
+            {**_bounds(start, end), "page": page},
+        )[0]
+        return {"page": page, "start": start, "end": end, **row}
+
+    return cached(("unique", page, start, end), end, compute)
+
+
+def user_recency(login: str, start: date, end: date) -> dict:
+    """
+    По страницам: последний визит, дней с него, визиты и активные дни за окно.
+    Пользователь не найден (или удалён) — 404.
+    """
+
+    def compute():
+        rows = _rows(
+            f"""
+            WITH u AS (
+                SELECT user_id FROM auth.users WHERE login = :login AND deleted_at IS NULL
+            ),
+            t AS (
+                SELECT d.page_name, d.day, d.cnt FROM auth.user_visits_daily d, u
+                WHERE d.user_id = u.user_id AND d.day BETWEEN :start AND :end
+                UNION ALL
+                SELECT v.page_name, (v.visited_at AT TIME ZONE 'UTC')::date, count(*)
+                FROM auth.user_visits v, u
+                WHERE v.user_id = u.user_id AND {_tail("v.")}
+                  AND v.visited_at >= :start_ts AND v.visited_at < :end_ts
+                GROUP BY 1, 2
+            ),
+            p AS (
+                SELECT page_name, max(day) AS last_day, count(DISTINCT day) AS active_days,
+                       sum(cnt)::bigint AS visits
+                FROM t GROUP BY page_name
+            )
+            SELECT (SELECT user_id FROM u) AS user_id, p.page_name AS page,
+                   p.last_day, p.active_days, p.visits, lv.visited_at AS last_visit_at
+            FROM (SELECT 1) AS one
+            LEFT JOIN p ON true
+            LEFT JOIN LATERAL (
+                SELECT v.visited_at FROM auth.user_visits v
+                WHERE v.user_id = (SELECT user_id FROM u) AND v.page_name = p.page_name
+                  AND v.visited_at < :end_ts
+                ORDER BY v.visited_at DESC
+                LIMIT 1
+            ) lv ON true
+            ORDER BY p.last_day DESC NULLS LAST, p.visits DESC
+            """,
+            {**_bounds(start, end), "login": login},
+        )
+        if rows[0]["user_id"] is None:
+            raise HTTPException(status_code=404, detail="Пользователь не найден")
+        ref = today()
+        pages = [
+            {
+                "page": r["page"],
+                "last_visit_at": r["last_visit_at"],
+                "days_since": (ref - r["last_day"]).days,
+                "active_days": r["active_days"],
+                "visits": r["visits"],
+            }
+            for r in rows
+            if r["page"] is not None
+        ]
+        return {"login": login, "start": start, "end": end, "pages": pages}
+
+    # login — citext: варианты регистра — один и тот же пользователь и одна запись кеша
+    return {
+        **cached(("recency", login.lower(), start, end), end, compute),
+        "login": login,
+    }
@@ -0,0 +1,334 @@
+# utils/visit_feed.py
+"""
+Поток приращений счётчиков посещений для SSE (GET /api/visits/stream).
+
+Опрос /api/stats каждым дашбордом — GROUP BY по auth.user_visits на клиента.
+Вместо этого:
+- visit_page после COMMIT вызывает record(page, login) — приращение копится в памяти;
+- поток "visit-feed" раз в VISIT_FEED_INTERVAL_SEC забирает накопленное, одним NOTIFY
+  "visit_deltas" рассылает его другим воркерам и вместе с их приращениями
+  (пришедшими по LISTEN) отдаёт ОДИН кадр всем подписчикам этого процесса;
+- итоги по странице (login -> count) держатся в памяти, пока у страницы есть
+  подписчики: загружаются одним запросом при первом подписчике и перечитываются
+  раз в VISIT_FEED_RESYNC_SEC (и после переподключения LISTEN) — новый клиент
+  получает снапшот без запроса к БД.
+
+Итого: запросов к БД — на страницу за интервал, а не на клиента.
+
+Подписчик — asyncio.Queue в event loop; кадры кладутся через call_soon_threadsafe.
+Переполненная очередь (клиент не успевает читать) очищается, и клиент получает
+свежий снапшот вместо пропущенных кадров.
+"""
+
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Optional
+
+from sqlalchemy import text
+
+from core.config import VISIT_FEED_INTERVAL_SEC, VISIT_FEED_RESYNC_SEC
+from db import notify
+from db.database import engine
+
+log = logging.getLogger("visit_feed")
+
+CHANNEL = "visit_deltas"
+NOTIFY_MAX_BYTES = 7000  # payload NOTIFY ограничен 8000 байт
+QUEUE_SIZE = 64
+
+_lock = threading.Lock()
+_local: dict = defaultdict(
+    lambda: defaultdict(int)
+)  # page -> login -> +n (этот процесс)
+_remote: dict = defaultdict(lambda: defaultdict(int))  # то же от других воркеров
+_totals: dict[str, dict[str, int]] = {}  # page -> login -> count (есть подписчики)
+_loaded_at: dict[str, float] = {}
+_stale: set[str] = set()  # перечитать итоги на следующем такте
+# page -> [блокировка загрузки итогов, сколько потоков держат её или ждут]
+_load_locks: dict[str, list] = {}
+_subscribers: dict[str, set] = defaultdict(set)  # page -> {Subscriber}
+_seq = 0  # номер такта
+
+_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+class Subscriber:
+    __slots__ = ("page", "queue", "loop")
+
+    def __init__(self, page: str, loop: asyncio.AbstractEventLoop):
+        self.page = page
+        self.queue: asyncio.Queue = asyncio.Queue(QUEUE_SIZE)
+        self.loop = loop
+
+
+# ----------------- Запись -----------------
+def record(page: str, login: str) -> None:
+    """Учесть визит (вызывать после COMMIT). Дёшево: словарь под блокировкой."""
+    with _lock:
+        _local[page][login] += 1
+
+
+def _on_notify(payload: Optional[str]) -> None:
+    if payload is None:  # переподключение LISTEN: приращения могли потеряться
+        with _lock:
+            _stale.update(_totals)
+        return
+    msg = json.loads(payload)
+    if msg.get("pid") == os.getpid():
+        return
+    with _lock:
+        for page, by_login in msg["d"].items():
+            for login, n in by_login.items():
+                _remote[page][login] += n
+
+
+notify.subscribe(CHANNEL, _on_notify)
+
+
+# ----------------- Итоги -----------------
+def _load_totals(page: str) -> dict[str, int]:
+    # дневные итоги (visit_rollup) + хвост посещений после отметки свёртки
+    with engine.connect() as conn:
+        conn.execute(text("SET search_path TO auth, public"))
+        rows = conn.execute(
+            text(
+                """
+            SELECT u.login, SUM(t.cnt)::bigint AS cnt
+            FROM (
+                SELECT user_id, cnt FROM auth.user_visits_daily WHERE page_name = :pname
+                UNION ALL
+                SELECT v.user_id, COUNT(*)
+                FROM auth.user_visits v, auth.visit_rollup_state s
+                WHERE s.id = 1 AND v.page_name = :pname
+                  AND (v.ins_xid > s.last_xid
+                       OR (v.ins_xid IS NULL AND v.visit_id > s.last_visit_id))
+                GROUP BY v.user_id
+            ) t
+            JOIN auth.users u ON u.user_id = t.user_id AND u.deleted_at IS NULL
+            GROUP BY u.login
+            """
+            ),
+            {"pname": page},
+        ).all()
+    return {login: int(cnt) for login, cnt in rows}
+
+
+def _pending(page: str) -> dict[str, int]:
+    # под _lock: приращения, ещё не разосланные кадром
+    out: dict[str, int] = defaultdict(int)
+    for source in (_local, _remote):
+        for login, n in source.get(page, {}).items():
+            out[login] += n
+    return out
+
+
+def _reload(page: str) -> dict[str, int]:
+    """
+    Перечитать итоги из БД. Визиты, уже записанные, но ещё не разосланные кадром,
+    есть и в БД, и в следующем "delta" — они вычитаются, чтобы не учесть дважды.
+    """
+    with _lock:
+        seq, pending = _seq, _pending(page)
+    totals = _load_totals(page)
+    with _lock:
+        if _seq == seq:
+            for login, n in pending.items():
+                totals[login] = totals.get(login, 0) - n
+        if _subscribers.get(page):
+            _totals[page] = totals
+            _loaded_at[page] = time.monotonic()
+        _stale.discard(page)
+        return dict(totals)
+
+
+# ----------------- Подписчики -----------------
+@contextmanager
+def _load_lock(page: str):
+    """
+    Блокировка загрузки итогов страницы. Запись удаляется, когда её больше никто
+    не держит и не ждёт (page приходит из запроса — не копить), а не при уходе
+    последнего подписчика: иначе ждущий и новый поток взяли бы разные блокировки.
+    """
+    with _lock:
+        entry = _load_locks.get(page)
+        if entry is None:
+            entry = _load_locks[page] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _load_locks[page]
+
+
+def subscribe(
+    page: str, loop: asyncio.AbstractEventLoop
+) -> tuple[Subscriber, dict[str, int]]:
+    """
+    Подписка и итоги страницы на её момент (блокирующая, из threadpool).
+    Регистрация и чтение итогов — под одной блокировкой с тактом: каждый кадр
+    либо уже учтён в итогах, либо придёт подписчику. Первый подписчик страницы
+    загружает итоги из БД, одновременные с ним ждут этого же запроса.
+    """
+    sub = Subscriber(page, loop)
+    with _load_lock(page):
+        with _lock:
+            _subscribers[page].add(sub)
+            if page in _totals and page not in _stale:
+                return sub, dict(_totals[page])
+        try:
+            _reload(page)
+        except Exception:
+            unsubscribe(sub)
+            raise
+        with _lock:
+            return sub, dict(_totals.get(page, {}))
+
+
+def unsubscribe(sub: Subscriber) -> None:
+    with _lock:
+        subs = _subscribers.get(sub.page)
+        if subs is None:
+            return
+        subs.discard(sub)
+        if not subs:
+            del _subscribers[sub.page]
+            _totals.pop(sub.page, None)
+            _loaded_at.pop(sub.page, None)
+
+
+def subscriber_count() -> int:
+    with _lock:
+        return sum(len(s) for s in _subscribers.values())
+
+
+def _put(sub: Subscriber, event: str, data: dict) -> None:
+    # выполняется в event loop подписчика
+    try:
+        sub.queue.put_nowait((event, data))
+    except asyncio.QueueFull:
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        with _lock:
+            totals = dict(_totals.get(sub.page, {}))
+        sub.queue.put_nowait(("snapshot", {"page": sub.page, "counts": totals}))
+
+
+def _broadcast(page: str, event: str, data: dict) -> None:
+    # под _lock (см. subscribe)
+    for sub in list(_subscribers.get(page, ())):
+        try:
+            sub.loop.call_soon_threadsafe(_put, sub, event, data)
+        except RuntimeError:  # loop уже закрыт
+            _subscribers[page].discard(sub)
+
+
+# ----------------- Такт -----------------
+def _json_size(value) -> int:
+    return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+def _publish(local: dict) -> None:
+    """
+    Разослать приращения этого процесса другим воркерам (частями до NOTIFY_MAX_BYTES).
+    Части набираются по парам (страница, логин): приращения одной страницы с
+    множеством логинов расходятся по нескольким NOTIFY — получатель их суммирует.
+    """
+    pid = os.getpid()
+    chunks, chunk, size = [], {}, 0
+    for page, by_login in local.items():
+        page_size = _json_size(page) + 6  # "page": {},
+        for login, n in by_login.items():
+            part = _json_size(login) + len(str(n)) + 4  # "login": n,
+            extra = part if page in chunk else part + page_size
+            if chunk and size + extra > NOTIFY_MAX_BYTES:
+                chunks.append(chunk)
+                chunk, size, extra = {}, 0, part + page_size
+            chunk.setdefault(page, {})[login] = n
+            size += extra
+    if chunk:
+        chunks.append(chunk)
+    with engine.begin() as conn:
+        for c in chunks:
+            notify.send(
+                conn, CHANNEL, json.dumps({"pid": pid, "d": c}, ensure_ascii=False)
+            )
+
+
+def _tick() -> None:
+    global _local, _remote, _seq
+    with _lock:
+        local, remote = _local, _remote
+        _local = defaultdict(lambda: defaultdict(int))
+        _remote = defaultdict(lambda: defaultdict(int))
+        _seq += 1
+        merged: dict = defaultdict(lambda: defaultdict(int))
+        for source in (local, remote):
+            for page, by_login in source.items():
+                for login, n in by_login.items():
+                    merged[page][login] += n
+        # итоги и рассылка — атомарно относительно subscribe()
+        for page, delta in merged.items():
+            totals = _totals.get(page)
+            if totals is None:
+                continue
+            for login, n in delta.items():
+                totals[login] = totals.get(login, 0) + n
+            _broadcast(page, "delta", {"page": page, "counts": dict(delta)})
+        now = time.monotonic()
+        resync = [
+            p
+            for p in _totals
+            if p in _stale or now - _loaded_at[p] >= VISIT_FEED_RESYNC_SEC
+        ]
+
+    if local:
+        try:
+            _publish({p: dict(d) for p, d in local.items()})
+        except Exception:
+            log.exception("visit feed: NOTIFY failed")
+            with _lock:
+                _stale.update(_totals)  # другие воркеры не узнают — хотя бы сами
+
+    for page in resync:
+        try:
+            totals = _reload(page)
+        except Exception:
+            log.exception("visit feed: reload of %s failed", page)
+            continue
+        with _lock:
+            _broadcast(page, "snapshot", {"page": page, "counts": totals})
+
+
+def _loop() -> None:
+    while not _stop.wait(VISIT_FEED_INTERVAL_SEC):
+        try:
+            _tick()
+        except Exception:
+            log.exception("visit feed tick failed")
+
+
+def start() -> None:
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="visit-feed", daemon=True)
+    _thread.start()
+
+
+def stop() -> None:
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)